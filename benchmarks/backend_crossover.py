@@ -0,0 +1,62 @@
+"""
+Wall time per RK4 step of the NumPy and torch backends on the CPU, over N
+(and optionally the batch size B), and the smallest N from which torch is
+faster. Run from the repository root:
+
+    python -m benchmarks.backend_crossover --N 50 100 200 500 1000 2000 5000
+"""
+import argparse
+import time
+import dataclasses
+import numpy as np
+import torch
+from config import SimCfg
+from road import Road, Segment
+from sim import run_batch
+
+def _jobs(N, B, vs=1.0, vf_max=2.0):
+    jobs = []
+    for rho in np.linspace(0.1, 0.4, B):
+        q = N / rho / 4
+        jobs.append((Road([Segment("N", q, vf_max), Segment("S", q, vs),
+                           Segment("N", q, vf_max), Segment("S", q, vs)]), float(rho)))
+    return jobs
+
+def time_step(backend, N, B, steps=500, repeats=3):
+    """Best-of-repeats seconds per step of run_batch (setup included once)."""
+    cfg = SimCfg(N=N, t_warmup=0, t_total=steps, sample_every=20, backend=backend)
+    jobs = _jobs(N, B)
+    run_batch(jobs, dataclasses.replace(cfg, t_total=10))        # warm caches
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        run_batch(jobs, cfg)
+        best = min(best, time.perf_counter() - t0)
+    return best / steps
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--N", nargs="+", type=int, default=[25, 50, 100, 200, 500, 1000, 2000, 5000])
+    p.add_argument("--batch", nargs="+", type=int, default=[1])
+    p.add_argument("--steps", type=int, default=500)
+    p.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = p.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    print(f"{'B':>4} {'N':>7} {'numpy us':>10} {'torch us':>10} {'speedup':>8}")
+    for B in args.batch:
+        crossover = None
+        for N in args.N:
+            t_np = time_step("numpy", N, B, args.steps)
+            t_torch = time_step("torch", N, B, args.steps)
+            print(f"{B:>4} {N:>7} {t_np * 1e6:>10.1f} {t_torch * 1e6:>10.1f} {t_torch / t_np:>8.2f}")
+            if crossover is None and t_torch < t_np:
+                crossover = N
+        if crossover is None:
+            print(f"[bench] B={B}: NumPy faster for every N tested")
+        else:
+            print(f"[bench] B={B}: torch faster from N={crossover} (B*N={B * crossover})")
+
+if __name__ == "__main__":
+    main()
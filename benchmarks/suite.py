@@ -0,0 +1,287 @@
+"""
+Throughput benchmarks of the simulation and its post-processing, with a
+stored baseline for regression checks. Run from the repository root:
+
+    python -m benchmarks.suite                       # quick preset
+    python -m benchmarks.suite --preset full --out bench.json
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --tolerance 0.15
+    python -m benchmarks.suite --check               # against the committed baseline
+
+Every case is timed `repeats` times after one untimed warm-up repetition;
+the report gives its throughput as mean, std, coefficient of variation,
+min and max over the repetitions, in the unit of its stage:
+  step        vehicle-steps/s (B * N * steps / seconds) of the RK4 step
+              kernel of a backend (sim._rk4_step, sim.RK4Workspace as
+              backend "workspace", sim_numpy)
+  run         vehicle-steps/s of run_simulation / run_batch end to end,
+              setup included
+  jam_metrics vehicles/s (B * N * calls / seconds) of metrics.jam_metrics
+              on a (B, N) state
+  plot        figures/s of a headway profile figure rendered with Agg
+A case is a regression when its mean throughput falls below
+(1 - tolerance) times the baseline mean. The exit status is 1 if any case
+regressed, so the suite can gate CI. benchmarks/baseline.json is the
+reference of the quick preset; its "env" records the machine it was
+measured on, and throughputs only compare on a similar one.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import dataclasses
+import numpy as np
+import torch
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from config import SimCfg
+from road import Road, Segment
+from sim import run_batch, initial_state, _rk4_step, RK4Workspace
+from sim_numpy import RK4Stepper, segment_arrays
+from metrics import jam_metrics, road_starts
+
+# reference of the quick preset, compared with by --check
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+DTYPES = {"float32": (torch.float32, np.float32), "float64": (torch.float64, np.float64)}
+
+@dataclasses.dataclass(frozen=True)
+class Case:
+    stage: str
+    N: int
+    K: int = 4              # segments per road (alternating N/S)
+    B: int = 1
+    dtype: str = "float32"
+    backend: str = "torch"
+
+    @property
+    def key(self):
+        return f"{self.stage}/{self.backend}/{self.dtype}/N={self.N}/K={self.K}/B={self.B}"
+
+    @property
+    def unit(self):
+        return {"plot": "figures/s", "jam_metrics": "vehicles/s"}.get(self.stage,
+                                                                       "vehicle-steps/s")
+
+    @property
+    def work(self):
+        """Units of work of one repetition (figures for plot, else B * N * steps)."""
+        return self.steps if self.stage == "plot" else self.B * self.N * self.steps
+
+    @property
+    def steps(self):
+        # short, fixed step counts: about 2e6 vehicle-steps, 5 to 200 steps
+        # (for plot: figures per repetition)
+        if self.stage == "plot":
+            return 2
+        return int(np.clip(2_000_000 // (self.B * self.N), 5, 200))
+
+def _roads(case, vs=1.0, vf=2.0):
+    """B roads of K equal alternating N/S segments at densities 0.15..0.35."""
+    rhos = np.linspace(0.15, 0.35, case.B) if case.B > 1 else np.array([0.25])
+    roads = []
+    for rho in rhos:
+        q = case.N / rho / case.K
+        roads.append(Road([Segment("N" if k % 2 == 0 else "S", q, vf if k % 2 == 0 else vs)
+                           for k in range(case.K)]))
+    return roads, rhos
+
+def _cfg(case):
+    # backend "workspace" is the torch engine on sim.RK4Workspace
+    backend, workspace = (("torch", "on") if case.backend == "workspace"
+                          else (case.backend, "off"))
+    return SimCfg(N=case.N, t_warmup=0, t_total=case.steps, sample_every=20,
+                  backend=backend, dtype=case.dtype, workspace=workspace)
+
+def _step_runner(case):
+    roads, _ = _roads(case)
+    cfg = _cfg(case)
+    torch_dtype, np_dtype = DTYPES[case.dtype]
+    if case.backend == "numpy":
+        Ls = [road.length() for road in roads]
+        stepper = RK4Stepper(Ls, *segment_arrays(roads, cfg, np_dtype),
+                             cfg.alpha_ov, cfg.a_sens, cfg.dt, cfg.N)
+        x, v = (t.numpy() for t in initial_state(roads, cfg, "cpu", torch_dtype)[:2])
+
+        def run():
+            for _ in range(case.steps):
+                stepper.step(x, v)
+        return run
+
+    x0, v0, params = initial_state(roads, cfg, "cpu", torch_dtype)
+    if case.backend == "workspace":
+        x, v = x0.clone(), v0.clone()
+        step = RK4Workspace(x, params)
+
+        def run():
+            for _ in range(case.steps):
+                step(x, v)
+        return run
+
+    def run():
+        x, v = x0, v0
+        for _ in range(case.steps):
+            x, v = _rk4_step(x, v, *params)
+    return run
+
+def _run_runner(case):
+    roads, rhos = _roads(case)
+    cfg = _cfg(case)
+    jobs = list(zip(roads, rhos))
+    return lambda: run_batch(jobs, cfg)
+
+def _final_state(case):
+    """(x_mod, dx, L, starts, roads) after a short run, for the stage cases."""
+    roads, rhos = _roads(case)
+    cfg = dataclasses.replace(_cfg(case), t_total=200, backend="auto", dtype="float32")
+    res = run_batch(list(zip(roads, rhos)), cfg, return_profiles=True)
+    x_mod = torch.stack([r["x_mod"] for r in res])
+    dx = torch.stack([r["dx"] for r in res])
+    L = torch.tensor([road.length() for road in roads])
+    return x_mod, dx, L, road_starts(roads), roads
+
+def _jam_runner(case):
+    x_mod, dx, L, starts, _ = _final_state(case)
+    return lambda: [jam_metrics(x_mod, dx, L, starts, 3.0) for _ in range(case.steps)]
+
+def _plot_runner(case):
+    x_mod, dx, _, _, _ = _final_state(case)
+    x_mod, dx = x_mod[0].numpy(), dx[0].numpy()
+
+    def run():
+        for _ in range(case.steps):
+            order = np.argsort(x_mod)
+            fig, ax = plt.subplots(figsize=(6, 4))
+            ax.step(x_mod[order], dx[order], where="post")
+            ax.grid(True)
+            fig.tight_layout()
+            fig.savefig(io.BytesIO(), dpi=100)
+            plt.close(fig)
+    return run
+
+RUNNERS = {"step": _step_runner, "run": _run_runner, "jam_metrics": _jam_runner,
+           "plot": _plot_runner}
+
+def presets(name):
+    """Cases of a preset: every axis is swept around N=1000, K=4, B=1, float32."""
+    Ns = [100, 1000, 10_000] if name == "quick" else [100, 1000, 10_000, 100_000, 1_000_000]
+    backends = ("torch", "numpy", "workspace")
+    cases = [Case("step", N, backend=b) for N, b in itertools.product(Ns, backends)]
+    cases += [Case("step", 1000, K=K) for K in (2, 6, 16)]
+    cases += [Case("step", 1000, B=B) for B in (8, 64)]
+    cases += [Case("step", 1000, dtype="float64", backend=b) for b in ("torch", "numpy")]
+    cases += [Case("run", N, backend=b) for N, b in itertools.product(Ns[:2], backends)]
+    cases += [Case("run", 1000, dtype="float64", backend=b) for b in ("torch", "numpy")]
+    cases += [Case("jam_metrics", 1000, B=B) for B in (1, 64)]
+    cases += [Case("plot", N) for N in (1000, 10_000)]
+    if name == "full":
+        cases += [Case("run", 1000, B=64)]
+        cases += [Case("run", 1_000_000, backend=b) for b in ("torch", "workspace")]
+        cases += [Case("jam_metrics", 100_000)]
+    return cases
+
+def measure(case, repeats):
+    """Seconds of every timed repetition of case (after one warm-up)."""
+    torch.manual_seed(0)
+    np.random.seed(0)
+    run = RUNNERS[case.stage](case)
+    run()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    return times
+
+def summarize(case, times):
+    rate = case.work / np.asarray(times)
+    std = float(rate.std(ddof=1)) if len(rate) > 1 else 0.0
+    return {"key": case.key, **dataclasses.asdict(case), "steps": case.steps,
+            "repeats": len(times), "times_s": times, "unit": case.unit,
+            "throughput": {"mean": float(rate.mean()), "std": std,
+                             "cv": std / float(rate.mean()),
+                             "min": float(rate.min()), "max": float(rate.max())}}
+
+def environment():
+    return {"python": platform.python_version(), "torch": torch.__version__,
+            "numpy": np.__version__, "platform": platform.platform(),
+            "machine": platform.machine(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count(), "torch_threads": torch.get_num_threads(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(results, baseline, tolerance):
+    """
+    Per case present in both: (key, current mean, baseline mean, ratio,
+    verdict) where verdict is "regression", "faster" or "ok".
+    """
+    base = {r["key"]: r for r in baseline["results"]}
+    rows = []
+    for r in results:
+        if r["key"] not in base:
+            continue
+        cur = r["throughput"]["mean"]
+        ref = base[r["key"]]["throughput"]["mean"]
+        ratio = cur / ref
+        verdict = ("regression" if ratio < 1 - tolerance
+                   else "faster" if ratio > 1 + tolerance else "ok")
+        rows.append((r["key"], cur, ref, ratio, verdict))
+    return rows
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--preset", choices=["quick", "full"], default="quick")
+    p.add_argument("--stage", nargs="+", choices=sorted(RUNNERS), default=None,
+                   help="only run these stages")
+    p.add_argument("--repeats", type=int, default=5)
+    p.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    p.add_argument("--out", type=str, default="bench_results.json")
+    p.add_argument("--baseline", type=str, default=None, help="baseline JSON to compare with")
+    p.add_argument("--check", action="store_true",
+                   help="compare with the committed baseline (benchmarks/baseline.json)")
+    p.add_argument("--tolerance", type=float, default=0.2,
+                   help="allowed relative drop in mean throughput")
+    p.add_argument("--save-baseline", dest="save_baseline", type=str, default=None,
+                   help="also write the results as a baseline file")
+    args = p.parse_args(argv)
+    if args.check and args.baseline is None:
+        args.baseline = BASELINE
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    cases = [c for c in presets(args.preset) if args.stage is None or c.stage in args.stage]
+    results = []
+    print(f"{'case':<48} {'mean':>10} {'cv':>6}  unit")
+    for case in cases:
+        res = summarize(case, measure(case, args.repeats))
+        results.append(res)
+        rate = res["throughput"]
+        print(f"{case.key:<48} {rate['mean']:>10.4g} {rate['cv']:>6.1%}  {case.unit}")
+
+    report = {"env": environment(), "preset": args.preset, "repeats": args.repeats,
+              "results": results}
+    for path in [args.out] + ([args.save_baseline] if args.save_baseline else []):
+        with open(path, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print("[bench] Saved:", path)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        rows = compare(results, baseline, args.tolerance)
+        print(f"\n{'case':<48} {'ratio':>7}  verdict (tolerance {args.tolerance:.0%})")
+        for key, cur, ref, ratio, verdict in rows:
+            print(f"{key:<48} {ratio:>7.3f}  {verdict}")
+        regressions = [row for row in rows if row[4] == "regression"]
+        if regressions:
+            print(f"[bench] {len(regressions)} regression(s) against {args.baseline}")
+            return 1
+        print(f"[bench] no regressions against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
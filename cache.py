@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+import dataclasses
+import numpy as np
+import torch
+
+# source files whose content defines the simulation results and their
+# cached layout: the engines, the diagnostics and observers in the result
+# dicts, the SimCfg fields hashed into every key and the .npz format here
+_CODE_FILES = ("sim.py", "sim_numpy.py", "model_ovm.py", "road.py", "steady.py",
+               "metrics.py", "observers.py", "config.py", "cache.py")
+_PROFILE_KEYS = ("x_mod", "x", "v", "dx")
+
+def _code_version():
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in _CODE_FILES:
+        with open(os.path.join(root, name), "rb") as fh:
+            h.update(fh.read())
+    return h.hexdigest()[:16]
+
+CODE_VERSION = _code_version()
+
+def job_key(road, rho, cfg):
+    """
+    Content hash of everything that determines one run's result (the
+    precision is part of cfg).
+    """
+    spec = {
+        "cfg": dataclasses.asdict(cfg),
+        "segments": [(s.kind, float(s.length), float(s.vmax)) for s in road.segments],
+        "rho": float(rho),
+        "code": CODE_VERSION,
+    }
+    blob = json.dumps(spec, sort_keys=True).encode()
+    return hashlib.sha256(blob).hexdigest()
+
+class ResultCache:
+    """
+    On-disk store of run results as compressed .npz files named by job_key.
+    Scalars and final profiles are kept; profiles come back as CPU tensors.
+    When the directory grows beyond max_bytes the least recently used
+    entries (by mtime, bumped on every hit) are evicted.
+    """
+
+    def __init__(self, path=".sim_cache", max_bytes=1 << 30, enabled=True, refresh=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.refresh = refresh
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+        self._size = None   # bytes on disk, scanned on the first put
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".npz")
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key):
+        """Cached result dict for key, or None."""
+        if not self.enabled:
+            return None
+        if self.refresh:
+            self.stats["misses"] += 1
+            return None
+        fname = self._file(key)
+        try:
+            with np.load(fname) as data:
+                res = {k: data[k] for k in data.files}
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        os.utime(fname)
+        self.stats["hits"] += 1
+        for k in list(res):
+            if k in _PROFILE_KEYS:
+                res[k] = torch.from_numpy(res[k])
+            else:
+                res[k] = res[k].item()
+        return res
+
+    def put(self, key, res):
+        if not self.enabled:
+            return
+        arrays = {}
+        for k, val in res.items():
+            arrays[k] = val.detach().cpu().numpy() if torch.is_tensor(val) else np.asarray(val)
+        fname = self._file(key)
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        if os.path.exists(fname):
+            self._size -= os.path.getsize(fname)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp = fname + f".{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(fh, **arrays)
+        os.replace(tmp, fname)
+        self._size += os.path.getsize(fname)
+        self.stats["stored"] += 1
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _entries(self):
+        for dirpath, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".npz"):
+                    fname = os.path.join(dirpath, name)
+                    st = os.stat(fname)
+                    yield st.st_mtime, st.st_size, fname
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, fname in entries:
+            if self._size <= self.max_bytes:
+                break
+            os.remove(fname)
+            self._size -= size
+            self.stats["evicted"] += 1
+
+    def summary(self):
+        s = self.stats
+        return (f"[cache] {self.path}: hits={s['hits']} misses={s['misses']} "
+                f"stored={s['stored']} evicted={s['evicted']}")
+
+# process-wide cache used by the experiments; disabled until configured
+_cache = ResultCache(enabled=False)
+
+def configure(**kwargs):
+    global _cache
+    _cache = ResultCache(**kwargs)
+    return _cache
+
+def get_cache():
+    return _cache
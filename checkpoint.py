@@ -0,0 +1,88 @@
+import os
+import re
+import json
+import hashlib
+import torch
+from cache import job_key
+
+# <batch_key>[-<engine>].state.pt / <batch_key>.done.pt, and their temporary files
+_CKPT_FILE = re.compile(r"^[0-9a-f]{24}(-[a-z]+)?\.(state|done)\.pt(\.\d+\.tmp)?$")
+
+def batch_key(jobs, cfg, tag="", row_cfgs=None):
+    """Identity of one run_batch call: its job keys in order plus a tag."""
+    rows = row_cfgs or [cfg] * len(jobs)
+    keys = [job_key(road, rho, c) for (road, rho), c in zip(jobs, rows)]
+    return hashlib.sha256(json.dumps([tag] + keys).encode()).hexdigest()[:24]
+
+class Checkpointer:
+    """
+    Snapshots of run_batch integrator state every `every` steps, plus the
+    results of finished batches, in one directory:
+      <key>.state.pt   latest state of a batch in progress
+      <key>.done.pt    result dicts of a finished batch
+    Sweeps check `finished` before running a batch, so a resumed sweep skips
+    completed batches and continues the interrupted one from its last
+    snapshot. Without `resume` existing files are ignored and overwritten.
+    """
+
+    def __init__(self, path=".sim_ckpt", every=5000, resume=False):
+        self.path = path
+        self.every = every
+        self.resume = resume
+
+    def _file(self, key, kind):
+        return os.path.join(self.path, f"{key}.{kind}.pt")
+
+    def _save(self, obj, fname):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = fname + f".{os.getpid()}.tmp"
+        torch.save(obj, tmp)
+        os.replace(tmp, fname)
+
+    def _load(self, fname):
+        if not self.resume or not os.path.exists(fname):
+            return None
+        return torch.load(fname, map_location="cpu", weights_only=False)
+
+    def save_state(self, key, state):
+        self._save(state, self._file(key, "state"))
+
+    def load_state(self, key):
+        return self._load(self._file(key, "state"))
+
+    def finished(self, key):
+        """Results of a batch completed before the restart, or None."""
+        return self._load(self._file(key, "done"))
+
+    def mark_done(self, key, results):
+        self._save(results, self._file(key, "done"))
+        state = self._file(key, "state")
+        if os.path.exists(state):
+            os.remove(state)
+
+    def clear(self):
+        """
+        Drop the checkpoints once the whole run has finished: the files named
+        like those above (also written by sweep worker processes), then the
+        directory if nothing else is left in it.
+        """
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if _CKPT_FILE.match(name):
+                os.remove(os.path.join(self.path, name))
+        try:
+            os.rmdir(self.path)
+        except OSError:     # holds other files
+            pass
+
+# process-wide checkpointer used by the experiments; None disables it
+_checkpointer = None
+
+def configure(**kwargs):
+    global _checkpointer
+    _checkpointer = Checkpointer(**kwargs)
+    return _checkpointer
+
+def get_checkpointer():
+    return _checkpointer
@@ -16,8 +16,42 @@ class SimCfg:
     t_total: int = 60000         # steps
     sample_every: int = 20       # steps (sampling for mean current)
 
+    # --- precision ---
+    dtype: str = "float32"       # state precision, "float32" or "float64"
+    recenter_every: int = 1000   # steps between position re-centering by k*L (0 = off)
+
+    # --- integrator ---
+    integrator: str = "rk4"      # "rk4" (fixed dt) or "dopri5" (adaptive)
+    rtol: float = 1e-4           # dopri5 relative tolerance
+    atol: float = 1e-6           # dopri5 absolute tolerance
+    dt_max: float = 1.0          # dopri5 largest step
+
+    # --- optimal velocity function ---
+    ov_curve: str = "tanh"       # curve of model_ovm.OV_CURVES
+    ov_table: str = "off"        # "off" (evaluate), "linear" or "cubic" interpolation
+    ov_table_h: float = 1.0 / 128.0  # headway spacing of the table
+    ov_table_max: float = 0.0    # table covers [0, ov_table_max]; 0 = where V saturates
+
+    # --- steady-state detection (t_warmup / t_total become upper bounds) ---
+    converge: bool = False
+    conv_check_every: int = 1000 # steps per statistics window
+    conv_rtol: float = 0.01      # max change between windows to end warmup
+    conv_tol: float = 1e-3       # target 95% half-width on J
+    conv_min_batches: int = 10   # min windows (batch means) before stopping
+
+    # --- density continuation ---
+    cont_warmup: int = 5000      # warmup of warm-started points (without converge)
+
     # --- jam detection ---
     dx_threshold: float = 3.0
 
     # --- misc ---
     seed: int = 0
+    compile: bool = False        # fused torch.compile RK4 step (eager fallback)
+    backend: str = "auto"        # "auto", "numpy" or "torch"
+    numpy_max_vehicles: int = 2000  # auto: NumPy for rows of up to this many vehicles on CPU
+
+    # --- large-N mode ---
+    workspace: str = "auto"      # preallocated in-place RK4 step: "auto", "on" or "off"
+    workspace_min_vehicles: int = 1_000_000  # auto: workspace from this many B*N vehicles
+    mem_limit_gb: float = 0.0    # refuse runs estimated above this many GiB (0 = no limit)
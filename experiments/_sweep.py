@@ -0,0 +1,165 @@
+import os
+import dataclasses
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from tqdm import tqdm
+from sim import run_batch
+from cache import get_cache, job_key
+from checkpoint import get_checkpointer, batch_key
+from workqueue import get_queue
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+
+def _run_chunk(jobs, cfg, device, return_profiles, ckpt=None, desc=None, to_cpu=False,
+               row_cfgs=None):
+    """
+    run_batch on one chunk of jobs. With a Checkpointer a chunk finished
+    before a restart is returned as is, and a running one is snapshotted
+    (and resumed from its last snapshot).
+    """
+    key = batch_key(jobs, cfg, tag=f"profiles={return_profiles}", row_cfgs=row_cfgs)
+    results = ckpt.finished(key) if ckpt is not None else None
+    if results is not None:
+        return results
+
+    results = run_batch(jobs, cfg, device=device, return_profiles=return_profiles, desc=desc,
+                        checkpoint=(ckpt, key) if ckpt is not None else None,
+                        row_cfgs=row_cfgs)
+    if to_cpu:
+        # profiles travel back to the parent as CPU tensors
+        for res in results:
+            for k in ("x_mod", "x", "v", "dx"):
+                if k in res:
+                    res[k] = res[k].cpu()
+    if ckpt is not None:
+        ckpt.mark_done(key, results)
+    return results
+
+def run_sweep(jobs, cfg, device="cpu", workers=1, return_profiles=False,
+              desc=None, chunk_size=None, row_cfgs=None):
+    """
+    Run a list of (road, rho) jobs and return their result dicts in job order.
+
+    Jobs found in the result cache (cache.get_cache()) are not simulated;
+    the rest are run by _run_jobs and stored, always with profiles so that
+    one entry serves both kinds of request. row_cfgs optionally gives every
+    job its own SimCfg (differing in sim.ROW_FIELDS only), see
+    sim.run_batch; each job is cached under its own cfg.
+    """
+    cache = get_cache()
+    if not cache.enabled:
+        return _run_jobs(jobs, cfg, device, workers, return_profiles, desc, chunk_size,
+                         row_cfgs)
+
+    rows = row_cfgs or [cfg] * len(jobs)
+    keys = [job_key(road, rho, c) for (road, rho), c in zip(jobs, rows)]
+    results = [cache.get(key) for key in keys]
+    todo = [i for i, res in enumerate(results) if res is None]
+    if todo:
+        fresh = _run_jobs([jobs[i] for i in todo], cfg, device, workers, True, desc, chunk_size,
+                          [row_cfgs[i] for i in todo] if row_cfgs else None)
+        for i, res in zip(todo, fresh):
+            cache.put(keys[i], res)
+            results[i] = res
+    if not return_profiles:
+        results = [{k: val for k, val in res.items() if not torch.is_tensor(val)}
+                   for res in results]
+    return results
+
+def _run_jobs(jobs, cfg, device, workers, return_profiles, desc, chunk_size, row_cfgs=None):
+    """
+    Simulate jobs without the cache. workers=1 integrates all jobs as one
+    run_batch in this process. Otherwise the jobs are cut into contiguous
+    chunks (about four per worker unless chunk_size is given), each
+    integrated as its own batch in a process pool whose workers use
+    cpu_count // workers intra-op threads. Batch rows do not interact and
+    every row runs on the engine of its own cfg (sim.select_backend), so
+    the results match the serial run (rows padded to a different N, see
+    sim.run_batch, to rounding). Chunks are checkpointed through
+    checkpoint.get_checkpointer() when one is configured. With a
+    workqueue.get_queue() the jobs go to its workers instead.
+    """
+    queue = get_queue()
+    if queue is not None:
+        results = queue.map(jobs, cfg, row_cfgs, device=device, desc=desc)
+        if not return_profiles:
+            results = [{k: val for k, val in res.items() if not torch.is_tensor(val)}
+                       for res in results]
+        return results
+
+    ckpt = get_checkpointer()
+    if workers <= 1 or len(jobs) <= 1:
+        return _run_chunk(jobs, cfg, device, return_profiles, ckpt, desc, row_cfgs=row_cfgs)
+
+    if chunk_size is None:
+        chunk_size = -(-len(jobs) // (4 * workers))
+    starts = range(0, len(jobs), chunk_size)
+    chunks = [jobs[i:i + chunk_size] for i in starts]
+    chunk_rows = [row_cfgs[i:i + chunk_size] if row_cfgs else None for i in starts]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=mp.get_context("spawn"),
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(_run_chunk, chunk, cfg, device, return_profiles, ckpt, None, True,
+                               rows)
+                   for chunk, rows in zip(chunks, chunk_rows)]
+        with tqdm(total=len(jobs), desc=desc, disable=desc is None) as bar:
+            for fut, chunk in zip(futures, chunks):
+                fut.add_done_callback(lambda _, n=len(chunk): bar.update(n))
+            results = [res for fut in futures for res in fut.result()]
+    return results
+
+def _rescaled_state(res, L_new):
+    """Final (x, v) of a run shifted into [0, L) and stretched to ring length L_new."""
+    L = res["L"]
+    x = res["x"]
+    x = x - torch.floor(x[0] / L) * L     # keeps ring order and headways
+    return x * (L_new / L), res["v"]
+
+def run_continuation(chains, cfg, device="cpu", return_profiles=False, desc=None):
+    """
+    Density continuation. chains is a list of equally long (road, rho) job
+    lists, each ordered in its own sweep direction (ascending or descending
+    rho, so up and down sweeps can run side by side for hysteresis). Point k
+    of all chains is integrated as one batch, every row starting from the
+    final state of point k-1 of its chain rescaled to the new ring length.
+    Warm-started points use cfg.cont_warmup warmup steps, or leave warmup to
+    the steady-state check when cfg.converge is set.
+    Returns one result list per chain. Results depend on the path taken, so
+    they bypass the result cache; with a checkpointer every finished point
+    is kept so a resumed sweep continues at the first unfinished one.
+    """
+    ckpt = get_checkpointer()
+    n = len(chains[0])
+    assert all(len(chain) == n for chain in chains)
+    warm_cfg = cfg
+    if not cfg.converge:
+        warm_cfg = dataclasses.replace(cfg, t_warmup=cfg.cont_warmup,
+                                       t_total=cfg.cont_warmup + cfg.t_total - cfg.t_warmup)
+
+    out = [[] for _ in chains]
+    prev = None
+    for k in tqdm(range(n), desc=desc, disable=desc is None):
+        jobs = [chain[k] for chain in chains]
+        init = None
+        if prev is not None:
+            states = [_rescaled_state(res, road.length()) for res, (road, _) in zip(prev, jobs)]
+            init = (torch.stack([x for x, _ in states]), torch.stack([v for _, v in states]))
+        run_cfg = cfg if init is None else warm_cfg
+        key = batch_key(jobs, run_cfg, tag=f"continuation:{k}")
+        prev = ckpt.finished(key) if ckpt is not None else None
+        if prev is None:
+            prev = run_batch(jobs, run_cfg, device=device, return_profiles=True, init=init,
+                             checkpoint=(ckpt, key) if ckpt is not None else None)
+            if ckpt is not None:
+                ckpt.mark_done(key, prev)
+        for chain_out, res in zip(out, prev):
+            chain_out.append(res)
+
+    if not return_profiles:
+        out = [[{k: val for k, val in res.items() if not torch.is_tensor(val)}
+                for res in chain_out] for chain_out in out]
+    return out
@@ -1,58 +1,38 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from road import Road, Segment
-from sim import run_simulation
-
-def build_road_two(L, vf, vs):
-    q = L/4
-    return Road([Segment("N", q, vf), Segment("S", q, vs),
-                 Segment("N", q, vf), Segment("S", q, vs)])
-
-def _to_np(t):
-    return t.detach().cpu().numpy()
-
-def run(cfg, device="cpu", rho=0.25, vs=1.0,
-        out_headway="fig3_headway_profile.png",
-        out_velocity="fig3_velocity_profile.png"):
-
-    L = cfg.N / rho
-    road = build_road_two(L, cfg.vf_max, vs)
-    res = run_simulation(road, rho, cfg, device=device, return_profiles=True)
-
-    x = _to_np(res["x"])
-    v = _to_np(res["v"])
-    dx = _to_np(res["dx"])
-    L = float(res["L"])
-
-    # Build continuous spatial axis s from cumulative headway
-    cut = int(np.argmin(dx))  # rotate to place shock nicely
-    dx_r = np.roll(dx, -cut)
-    v_r  = np.roll(v,  -cut)
-    s_r  = np.concatenate([[0.0], np.cumsum(dx_r[:-1])])
-
-    marks = [0.0, 0.25*L, 0.50*L, 0.75*L]
-
-    fig1, ax1 = plt.subplots(figsize=(6,4))
-    ax1.step(s_r, dx_r, where="post")
-    for m in marks: ax1.axvline(m, lw=1)
-    ax1.set_xlabel("Position $s$ (built from cumulative headway)")
-    ax1.set_ylabel("Headway $\\Delta x$")
-    ax1.set_title(f"Fig3(a)-like: Headway profile ($\\rho={rho}$)")
-    ax1.grid(True)
-    fig1.tight_layout()
-    fig1.savefig(out_headway, dpi=300)
-    plt.close(fig1)
-
-    fig2, ax2 = plt.subplots(figsize=(6,4))
-    ax2.step(s_r, v_r, where="post")
-    for m in marks: ax2.axvline(m, lw=1)
-    ax2.set_xlabel("Position $s$ (built from cumulative headway)")
-    ax2.set_ylabel("Velocity $v$")
-    ax2.set_title(f"Fig3(b)-like: Velocity profile ($\\rho={rho}$)")
-    ax2.grid(True)
-    fig2.tight_layout()
-    fig2.savefig(out_velocity, dpi=300)
-    plt.close(fig2)
-
-    print("[Fig3] J =", res["current"])
-    return res["current"]
+from .spec import execute
+from .fig2_fundamental import TWO_SLOWDOWNS
+
+def spec(cfg, rho=0.25, vs=1.0,
+         out_headway="fig3_headway_profile.png",
+         out_velocity="fig3_velocity_profile.png",
+         record=None, record_every=100, record_stride=1,
+         out_spacetime="fig3_spacetime.png"):
+    """
+    Headway and velocity profiles of the two-slowdown layout at rho. With
+    record (a directory) the run also writes a space-time trajectory and
+    its diagram is drawn from t_warmup on.
+    """
+    sweep = {"layout": "two", "rho": [rho], "metrics": ["current", "profiles"]}
+    plots = [
+        {"kind": "profile", "sweep": "profile", "field": "dx", "out": out_headway,
+         "ylabel": "Headway $\\Delta x$", "marks": [0.0, 0.25, 0.5, 0.75],
+         "title": f"Fig3(a)-like: Headway profile ($\\rho={rho}$)"},
+        {"kind": "profile", "sweep": "profile", "field": "v", "out": out_velocity,
+         "ylabel": "Velocity $v$", "marks": [0.0, 0.25, 0.5, 0.75],
+         "title": f"Fig3(b)-like: Velocity profile ($\\rho={rho}$)"},
+    ]
+    if record:
+        sweep["record"] = {"path": record, "every": record_every, "stride": record_stride}
+        plots.insert(0, {"kind": "spacetime", "path": record, "t_start": cfg.t_warmup,
+                         "out": out_spacetime})
+    return {
+        "name": "Fig3",
+        "params": {"vs": vs},
+        "layouts": {"two": TWO_SLOWDOWNS},
+        "sweeps": {"profile": sweep},
+        "plots": plots,
+        "report": [["profile", "current"]],
+    }
+
+def run(cfg, device="cpu", **kwargs):
+    sched = execute([spec(cfg, **kwargs)], cfg, device=device)
+    return sched.figures["Fig3"]["sweeps"]["profile"]["current"][0]
@@ -0,0 +1,157 @@
+"""
+Plot kinds of figure specs (see experiments.spec). Every plot is
+fn(plot, fig): plot is the spec's plot entry, fig the figure context with
+"name", "cfg", "values" (params and SimCfg fields), "layouts" and
+"sweeps" (sweep name -> {"rho", "roads", <metrics>}), as stored in the
+results files of experiments.results. Common plot keys: "out", "title",
+"tag" (log prefix, default the figure name).
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from theory import homogeneous_current, max_flux, road_theory, normal_jam_ratios
+from trajectory import Trajectory
+from .spec import densities, value, build_layout
+
+def _save(plot, fig):
+    plt.tight_layout()
+    plt.savefig(plot["out"], dpi=300)
+    plt.close()
+    print(f"[{plot.get('tag', fig['name'])}] Saved:", plot["out"])
+
+def _finish(plot, xlabel, ylabel, legend=True):
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    if "title" in plot:
+        plt.title(plot["title"])
+    plt.grid(True)
+    if legend:
+        plt.legend()
+
+def plot_current(plot, fig):
+    """
+    Current vs density: simulated "series" ({"sweep", "label", "marker",
+    "hollow"}) over theory lines on "rho_line": "homogeneous" roads
+    ({"vmax", "x_c", "label"}) and the bottleneck-limited current of a
+    spec "layout" ({"layout", "label"}), a stationary prediction.
+    """
+    cfg, values = fig["cfg"], fig["values"]
+    rho_line = densities(plot["rho_line"])
+    plt.figure(figsize=(6,4))
+    for line in plot.get("homogeneous", ()):
+        J = homogeneous_current(rho_line, value(line["vmax"], values), cfg.alpha_ov,
+                                value(line["x_c"], values))
+        plt.plot(rho_line, J, "-", lw=1.2, label=line["label"])
+    if "layout_theory" in plot:
+        line = plot["layout_theory"]
+        road = build_layout(fig["layouts"][line["layout"]], 1.0, values)
+        plt.plot(rho_line, road_theory(road, rho_line, cfg)["current"], "--", lw=1.2,
+                 label=line["label"])
+    for series in plot["series"]:
+        data = fig["sweeps"][series["sweep"]]
+        plt.plot(data["rho"], data["current"], series.get("marker", "o"), ms=4,
+                 mfc="none" if series.get("hollow") else None, label=series["label"])
+    _finish(plot, "Density $\\rho$", "Current $J$")
+    _save(plot, fig)
+
+def plot_theory_current(plot, fig):
+    """Homogeneous currents of every "vmax" on "rho", and the bottleneck of the smallest."""
+    cfg = fig["cfg"]
+    rhos = densities(plot["rho"])
+    plt.figure(figsize=(6,4))
+    for vmax in plot["vmax"]:
+        J = homogeneous_current(rhos, vmax, cfg.alpha_ov, cfg.x_f_c)
+        plt.plot(rhos, J, label=f"v_max={vmax:g}")
+
+    # bottleneck horizontal line: maximal flux of the strongest slowdown
+    Jb, _ = max_flux(min(plot["vmax"]), cfg.x_f_c, cfg.alpha_ov)
+    plt.axhline(Jb, lw=1)
+    _finish(plot, "Density $\\rho$", "Current $J$")
+    _save(plot, fig)
+
+def plot_profile(plot, fig):
+    """
+    Headway ("field": "dx") or velocity ("v") of run "index" of a sweep
+    along s, the position rebuilt from cumulative headways starting at the
+    smallest one, with vertical lines at the fractions "marks" of L.
+    """
+    data = fig["sweeps"][plot["sweep"]]
+    i = plot.get("index", 0)
+    prof = data["profiles"][i]
+    L = data["roads"][i].length()
+    dx, y = prof["dx"], prof[plot["field"]]
+
+    cut = int(np.argmin(dx))  # rotate to place shock nicely
+    dx_r = np.roll(dx, -cut)
+    y_r = np.roll(y, -cut)
+    s_r = np.concatenate([[0.0], np.cumsum(dx_r[:-1])])
+
+    _, ax = plt.subplots(figsize=(6,4))
+    ax.step(s_r, y_r, where="post")
+    for m in plot.get("marks", ()):
+        ax.axvline(m * L, lw=1)
+    ax.set_xlabel("Position $s$ (built from cumulative headway)")
+    ax.set_ylabel(plot["ylabel"])
+    ax.set_title(plot["title"])
+    ax.grid(True)
+    _save(plot, fig)
+
+def plot_headway(plot, fig):
+    """Headway against x mod L of run "index" of a sweep; "bounds" marks the segments."""
+    data = fig["sweeps"][plot["sweep"]]
+    i = plot.get("index", 0)
+    prof = data["profiles"][i]
+    order = np.argsort(prof["x_mod"])
+
+    plt.figure(figsize=(6,4))
+    plt.step(prof["x_mod"][order], prof["dx"][order], where="post")
+    if plot.get("bounds"):
+        road = data["roads"][i]
+        for start in road.starts:
+            plt.axvline(start, lw=1)
+        plt.axvline(road.length(), lw=1)
+    _finish(plot, "Position", plot.get("ylabel", "Headway"), legend=False)
+    _save(plot, fig)
+
+def plot_jam_ratio(plot, fig):
+    """
+    Jam-length ratio of every normal section of a sweep ("labels",
+    "markers"), their sum ("sum_label") and the stationary prediction of the
+    layout (theory.normal_jam_ratios) over "rho_line" points of the sweep range.
+    "ms" / "sum_ms" set marker sizes, "lw" the theory line width.
+    """
+    data = fig["sweeps"][plot["sweep"]]
+    rhos, ratios = data["rho"], data["jam_ratios"]
+    n = ratios.shape[1]
+    labels = plot.get("labels", [f"$l_{{j{k+1}}}$" for k in range(n)])
+    markers = plot.get("markers", ["o", "x", "s", "d"][:n])
+    ms = plot.get("ms")
+    rho_line = np.linspace(rhos[0], rhos[-1], plot.get("rho_line", 200))
+    th = normal_jam_ratios(data["roads"][0], rho_line, fig["cfg"]).sum(axis=1)
+
+    plt.figure(figsize=(6,4))
+    for k in range(n):
+        plt.plot(rhos, ratios[:, k], markers[k], ms=ms, label=labels[k])
+    plt.plot(rhos, ratios.sum(axis=1), "^", ms=plot.get("sum_ms", ms),
+             label=plot.get("sum_label", " + ".join(labels)))
+    plt.plot(rho_line, th, "-", lw=plot.get("lw"), label="stationary prediction")
+    _finish(plot, "Density $\\rho$", "Jam length ratio")
+    _save(plot, fig)
+
+def plot_spacetime(plot, fig):
+    """Space-time diagram (x_mod vs t, coloured by v) of a recorded "path" from "t_start"."""
+    traj = Trajectory(plot["path"])
+    w = traj.window(t_start=plot.get("t_start"), rows=0, fields=("x_mod", "v"))
+    t = np.repeat(w["step"] * traj.meta["dt"], w["x_mod"].shape[1])
+
+    _, ax = plt.subplots(figsize=(6,4))
+    sc = ax.scatter(w["x_mod"].ravel(), t, c=w["v"].ravel(), s=0.5, cmap="viridis",
+                    rasterized=True)
+    plt.colorbar(sc, ax=ax, label="Velocity $v$")
+    ax.set_xlabel("Position $x$ mod $L$")
+    ax.set_ylabel("Time $t$")
+    ax.set_title(f"Space-time diagram ($\\rho={traj.meta['rho'][0]}$)")
+    _save(plot, fig)
+
+PLOTS = {"current": plot_current, "theory_current": plot_theory_current,
+         "profile": plot_profile, "headway": plot_headway, "jam_ratio": plot_jam_ratio,
+         "spacetime": plot_spacetime}
@@ -0,0 +1,145 @@
+"""
+Results files of figure specs and the render stage drawing from them.
+
+A results file (<results_dir>/<figure name>.npz, compressed) holds
+everything the plots of a figure read: a JSON "meta" entry with the
+format version, the spec, SimCfg, params values, layouts and the roads
+of every sweep, and one array per sweep axis and metric ("<sweep>/rho",
+"<sweep>/current", "<sweep>/profiles/<i>/dx", ...). Raw run results are
+not kept; they live in the result cache. Rendering needs only these
+files, so plots can be redrawn (e.g. with new labels, run.py
+--render_only) without simulating, and a Renderer draws figures in a
+background process or thread while the next sweeps run.
+"""
+import os
+import json
+import dataclasses
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from config import SimCfg
+from road import Road, Segment
+
+RESULTS_VERSION = 1
+
+def results_path(results_dir, name):
+    """Results file of figure name ("Fig4/9" -> Fig4_9.npz)."""
+    return os.path.join(results_dir, name.replace("/", "_") + ".npz")
+
+def _pack(prefix, val, arrays):
+    """Store val (arrays, possibly in dicts and lists) in arrays; returns its structure."""
+    if isinstance(val, dict):
+        return {"dict": {k: _pack(f"{prefix}/{k}", v, arrays) for k, v in val.items()}}
+    if isinstance(val, (list, tuple)):
+        return {"list": [_pack(f"{prefix}/{i}", v, arrays) for i, v in enumerate(val)]}
+    arrays[prefix] = np.asarray(val)
+    return "array"
+
+def _unpack(prefix, node, data):
+    if node == "array":
+        return data[prefix]
+    if "dict" in node:
+        return {k: _unpack(f"{prefix}/{k}", v, data) for k, v in node["dict"].items()}
+    return [_unpack(f"{prefix}/{i}", v, data) for i, v in enumerate(node["list"])]
+
+def _normalized(spec):
+    """Spec as stored (JSON round trip), without the parts only rendering reads."""
+    spec = json.loads(json.dumps(spec))
+    return {k: v for k, v in spec.items() if k not in ("plots", "report")}
+
+def save_results(path, spec, fig):
+    """Write the figure context fig (see experiments.plots) of spec to path."""
+    arrays, sweeps = {}, {}
+    for name, data in fig["sweeps"].items():
+        sweeps[name] = {
+            "roads": [[(s.kind, float(s.length), float(s.vmax)) for s in road.segments]
+                      for road in data["roads"]],
+            "data": {k: _pack(f"{name}/{k}", v, arrays) for k, v in data.items()
+                     if k not in ("roads", "results")},
+        }
+    meta = {"version": RESULTS_VERSION, "spec": spec, "cfg": dataclasses.asdict(fig["cfg"]),
+            "values": fig["values"], "layouts": fig["layouts"], "sweeps": sweeps}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        np.savez_compressed(fh, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+    return path
+
+def load_results(path):
+    """(spec, figure context) of a results file."""
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].item())
+        if meta["version"] > RESULTS_VERSION:
+            raise ValueError(f"{path}: results format {meta['version']}, "
+                             f"this code reads up to {RESULTS_VERSION}")
+        sweeps = {}
+        for name, sw in meta["sweeps"].items():
+            sweeps[name] = {k: _unpack(f"{name}/{k}", node, data) for k, node in sw["data"].items()}
+            sweeps[name]["roads"] = [Road([Segment(*s) for s in segs]) for segs in sw["roads"]]
+    known = {f.name for f in dataclasses.fields(SimCfg)}
+    cfg = SimCfg(**{k: v for k, v in meta["cfg"].items() if k in known})
+    fig = {"name": meta["spec"]["name"], "cfg": cfg, "values": meta["values"],
+           "layouts": meta["layouts"], "sweeps": sweeps}
+    return meta["spec"], fig
+
+def render_figure(spec, fig):
+    """Draw the plots of spec from the figure context fig."""
+    from .plots import PLOTS
+    for plot in spec.get("plots", ()):
+        PLOTS[plot["kind"]](plot, dict(fig, name=spec["name"]))
+
+def render_file(path, spec=None, cfg=None):
+    """
+    Draw a figure from its results file, with the plots of spec if given
+    (its simulated part, and the SimCfg cfg if given, must match the file).
+    """
+    stored, fig = load_results(path)
+    if spec is not None:
+        same_cfg = cfg is None or fig["cfg"] == dataclasses.replace(cfg, **spec.get("cfg", {}))
+        if _normalized(spec) != _normalized(stored) or not same_cfg:
+            raise ValueError(f"{path} holds results of different sweeps or SimCfg than "
+                             f"{spec['name']}; rerun its simulations")
+    render_figure(spec or stored, fig)
+
+def _use_agg():
+    import matplotlib
+    matplotlib.use("Agg")
+
+class Renderer:
+    """
+    Draws figures from results files off the simulating thread, with the
+    Agg backend. mode "process" uses a pool of `workers` spawned processes,
+    "thread" one background thread (pyplot is not thread-safe, so it is
+    the only one drawing), "inline" draws in submit(). submit() returns at
+    once; close() waits for every figure and re-raises the first error.
+    """
+
+    def __init__(self, mode="process", workers=1):
+        _use_agg()
+        self.futures = []
+        if mode == "process":
+            self.pool = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=mp.get_context("spawn"),
+                                            initializer=_use_agg)
+        elif mode == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=1)
+        elif mode == "inline":
+            self.pool = None
+        else:
+            raise ValueError(f"unknown render mode {mode!r}")
+
+    def submit(self, path, spec=None, cfg=None):
+        if self.pool is None:
+            render_file(path, spec, cfg)
+        else:
+            self.futures.append(self.pool.submit(render_file, path, spec, cfg))
+
+    def close(self):
+        try:
+            for fut in self.futures:
+                fut.result()
+        finally:
+            self.futures = []
+            if self.pool is not None:
+                self.pool.shutdown()
@@ -0,0 +1,271 @@
+"""
+Declarative figure specs and the job scheduler behind run.py.
+
+A spec is a JSON-serializable dict (or a .json / .yaml file) describing
+one figure:
+
+    {"name": "Fig5",
+     "params": {"vs": 1.0},
+     "cfg": {},
+     "layouts": {"two": [["N", 0.25, "vf_max"], ["S", 0.25, "vs"],
+                         ["N", 0.25, "vf_max"], ["S", 0.25, "vs"]]},
+     "sweeps": {"ratio": {"layout": "two",
+                          "rho": {"linspace": [0.15, 0.35, 15]},
+                          "metrics": ["jam_ratios"]}},
+     "plots": [{"kind": "jam_ratio", "sweep": "ratio",
+                "out": "fig5_jam_length_ratio.png"}]}
+
+Layout segments are [kind, fraction of L, vmax], vmax a number, a params
+entry or a SimCfg field; "cfg" holds optional SimCfg overrides. A sweep's
+rho is a list or {"linspace": [min, max, steps]}, every density on a ring
+of length cfg.N / rho. Optional sweep keys: "params" and "cfg", merged
+over the figure's own for this sweep (so one spec can hold a grid of
+slowdown speeds, a_sens, alpha_ov, x_c or N), "continuation" ("up" or
+"down", warm-started along rho, see _sweep.run_continuation) and "record"
+({"path", "every", "stride"}: the single density run with a
+trajectory.Recorder). Metrics are names of METRICS, plots kinds of
+experiments.plots.PLOTS. An optional "report" lists [sweep, metric] pairs
+printed once the sweeps are done.
+
+The Scheduler expands the sweeps of every figure into (road, rho) jobs,
+merges identical jobs (same cache.job_key) across figures and runs all of
+them: one run_sweep per set of SimCfgs that differ in sim.ROW_FIELDS
+only, every row with its own configuration. A figure is complete once
+its sweeps are; with a results_dir its numbers are then written to a
+results file (experiments.results) that a Renderer draws from while the
+remaining sweeps run.
+"""
+import json
+import dataclasses
+import numpy as np
+from road import Road, Segment
+from sim import run_simulation, shared_fields
+from cache import job_key
+from metrics import normal_section_ratios
+from trajectory import Recorder
+from ._sweep import run_sweep, run_continuation
+from .results import results_path, save_results, render_figure
+
+def linspace(lo, hi, steps):
+    """Spec form of np.linspace(lo, hi, steps)."""
+    return {"linspace": [float(lo), float(hi), int(steps)]}
+
+def densities(rho):
+    """Densities of a sweep's rho entry, as an array."""
+    if isinstance(rho, dict):
+        lo, hi, steps = rho["linspace"]
+        return np.linspace(lo, hi, int(steps))
+    return np.asarray(rho, dtype=float)
+
+def load_spec(path):
+    """Spec (or list of specs) from a .json or .yaml file."""
+    with open(path) as fh:
+        if path.endswith((".yaml", ".yml")):
+            import yaml         # optional, only needed for YAML specs
+            return yaml.safe_load(fh)
+        return json.load(fh)
+
+def value(v, values):
+    """A spec number, or the params / SimCfg entry it names."""
+    return float(values[v]) if isinstance(v, str) else float(v)
+
+def build_layout(segments, L, values):
+    """Road of ring length L from [kind, fraction, vmax] segments."""
+    return Road([Segment(kind, frac * L, value(vmax, values)) for kind, frac, vmax in segments])
+
+def _current(jobs, results, cfg):
+    return np.asarray([res["current"] for res in results])
+
+def _jam_ratios(jobs, results, cfg):
+    return normal_section_ratios([res["x_mod"] for res in results],
+                                 [res["dx"] for res in results],
+                                 [road for road, _ in jobs], cfg.dx_threshold)
+
+def _profiles(jobs, results, cfg):
+    return [{k: res[k].detach().cpu().numpy() for k in ("x", "x_mod", "v", "dx")}
+            for res in results]
+
+# metric name -> fn(jobs, results, cfg)
+METRICS = {"current": _current, "jam_ratios": _jam_ratios, "profiles": _profiles}
+
+# metrics reading the final state, whose jobs are run with return_profiles
+PROFILE_METRICS = {"jam_ratios", "profiles"}
+
+@dataclasses.dataclass
+class _Sweep:
+    figure: str
+    name: str
+    spec: dict
+    cfg: object
+    jobs: list
+    keys: list = None       # job keys of plain sweeps (merged across figures)
+    results: list = None
+
+    @property
+    def profiles(self):
+        return bool(PROFILE_METRICS & set(self.spec.get("metrics", ())))
+
+def _reuse_order(item):
+    """Sort key of a unique job: segment count, vehicle count, layout, density."""
+    _, cfg, (road, rho), _ = item
+    return (len(road.segments), cfg.N,
+            [(s.kind, s.length / road.L, s.vmax) for s in road.segments], rho)
+
+class Scheduler:
+    """
+    Runs the simulations of several figure specs together. add() expands
+    a spec into jobs, run() simulates every distinct job once and computes
+    the sweep metrics of each figure as soon as its sweeps are done,
+    render() draws the plots. With results_dir every finished figure is
+    saved to <results_dir>/<name>.npz, and with a results.Renderer it is
+    drawn from that file in the background at once (render() then waits
+    for the drawing). Unique jobs are grouped
+    by the SimCfg fields rows must share (rows may differ in vs, layout,
+    a_sens, alpha_ov, x_c and N) and ordered by segment count, N, layout
+    and density, so worker chunks hold rows of one padding width and
+    similar convergence times; continuation sweeps of one SimCfg and
+    length run side by side as the chains of one run_continuation.
+    """
+
+    def __init__(self, cfg, device="cpu", workers=1, results_dir=None, renderer=None):
+        if renderer is not None and results_dir is None:
+            raise ValueError("a Renderer draws from results files: give results_dir")
+        self.cfg = cfg
+        self.device = device
+        self.workers = workers
+        self.results_dir = results_dir
+        self.renderer = renderer
+        self.specs = []
+        self.sweeps = []
+        self.figures = {}       # figure name -> {"cfg", "values", "sweeps": {name: data}}
+        self.finished = set()   # figures whose metrics are computed
+        self.stats = {"jobs": 0, "unique": 0}
+
+    def add(self, spec):
+        name = spec["name"]
+        cfg = dataclasses.replace(self.cfg, **spec.get("cfg", {}))
+        values = {**dataclasses.asdict(cfg), **spec.get("params", {})}
+        for sweep_name, sweep in spec.get("sweeps", {}).items():
+            sw_cfg = dataclasses.replace(cfg, **sweep.get("cfg", {}))
+            sw_values = {**dataclasses.asdict(sw_cfg), **spec.get("params", {}),
+                         **sweep.get("params", {})}
+            segments = spec["layouts"][sweep["layout"]]
+            jobs = [(build_layout(segments, sw_cfg.N / rho, sw_values), float(rho))
+                    for rho in densities(sweep["rho"])]
+            entry = _Sweep(name, sweep_name, sweep, sw_cfg, jobs)
+            if not (sweep.get("continuation") or sweep.get("record")):
+                entry.keys = [job_key(road, rho, sw_cfg) for road, rho in jobs]
+            self.sweeps.append(entry)
+        self.specs.append(spec)
+        self.figures[name] = {"cfg": cfg, "values": values, "layouts": spec.get("layouts", {}),
+                              "sweeps": {}}
+        return self
+
+    def _run_plain(self):
+        unique = {}
+        for sw in self.sweeps:
+            if sw.keys is None:
+                continue
+            self.stats["jobs"] += len(sw.jobs)
+            for key, job in zip(sw.keys, sw.jobs):
+                cfg, _, profiles = unique.get(key, (sw.cfg, job, False))
+                unique[key] = (cfg, job, profiles or sw.profiles)
+        self.stats["unique"] += len(unique)
+
+        groups = {}
+        for key, (cfg, job, profiles) in unique.items():
+            group = json.dumps(shared_fields(cfg), sort_keys=True)
+            groups.setdefault(group, []).append((key, cfg, job, profiles))
+        results = {}
+        for group in groups.values():
+            group.sort(key=_reuse_order)
+            cfgs = [cfg for _, cfg, _, _ in group]
+            out = run_sweep([job for _, _, job, _ in group], cfgs[0], device=self.device,
+                            workers=self.workers,
+                            return_profiles=any(p for *_, p in group), desc="Sweep",
+                            row_cfgs=None if all(c == cfgs[0] for c in cfgs) else cfgs)
+            results.update(zip([key for key, *_ in group], out))
+            for sw in self.sweeps:
+                if sw.results is None and sw.keys is not None and all(k in results for k in sw.keys):
+                    sw.results = [results[key] for key in sw.keys]
+            self._finish_ready()
+
+    def _run_continuation(self):
+        groups = {}
+        for sw in self.sweeps:
+            if sw.spec.get("continuation"):
+                group = (json.dumps(dataclasses.asdict(sw.cfg), sort_keys=True), len(sw.jobs))
+                groups.setdefault(group, []).append(sw)
+        for group in groups.values():
+            down = [sw.spec["continuation"] == "down" for sw in group]
+            chains = [sw.jobs[::-1] if d else sw.jobs for sw, d in zip(group, down)]
+            out = run_continuation(chains, group[0].cfg, device=self.device,
+                                   return_profiles=any(sw.profiles for sw in group),
+                                   desc="Continuation")
+            for sw, d, res in zip(group, down, out):
+                sw.results = res[::-1] if d else res
+            self._finish_ready()
+
+    def _run_recorded(self):
+        for sw in self.sweeps:
+            rec = sw.spec.get("record")
+            if rec:
+                # the trajectory is written while the run proceeds, so skip the cache
+                recorder = Recorder(rec["path"], every=rec.get("every", 100),
+                                    stride=rec.get("stride", 1))
+                (road, rho), = sw.jobs
+                sw.results = [run_simulation(road, rho, sw.cfg, device=self.device,
+                                             return_profiles=True, record=recorder)]
+                self._finish_ready()
+
+    def _finish_ready(self):
+        """Metrics of every figure whose sweeps are all done; saved and drawn if configured."""
+        for spec in self.specs:
+            name = spec["name"]
+            sweeps = [sw for sw in self.sweeps if sw.figure == name]
+            if name in self.finished or any(sw.results is None for sw in sweeps):
+                continue
+            for sw in sweeps:
+                data = {"rho": np.asarray([rho for _, rho in sw.jobs]),
+                        "roads": [road for road, _ in sw.jobs],
+                        "results": sw.results}
+                for metric in sw.spec.get("metrics", ()):
+                    data[metric] = METRICS[metric](sw.jobs, sw.results, sw.cfg)
+                self.figures[name]["sweeps"][sw.name] = data
+            self.finished.add(name)
+            if self.results_dir is not None:
+                path = save_results(results_path(self.results_dir, name), spec,
+                                    self.figures[name])
+                if self.renderer is not None:
+                    self.renderer.submit(path)
+
+    def run(self):
+        """Simulate every sweep and compute its metrics."""
+        self._finish_ready()    # figures without simulations
+        self._run_plain()
+        self._run_continuation()
+        self._run_recorded()
+        if self.stats["jobs"]:
+            print(f"[scheduler] {self.stats['jobs']} jobs, {self.stats['unique']} unique")
+        for spec in self.specs:
+            for sweep, metric in spec.get("report", ()):
+                values = self.figures[spec["name"]]["sweeps"][sweep][metric]
+                print(f"[{spec['name']}] {sweep} {metric} =", values)
+        return self
+
+    def render(self):
+        """Draw the plots of every spec, in the order added (or wait for the Renderer)."""
+        if self.renderer is not None:
+            self.renderer.close()
+            return self
+        for spec in self.specs:
+            render_figure(spec, self.figures[spec["name"]])
+        return self
+
+def execute(specs, cfg, device="cpu", workers=1, results_dir=None, renderer=None):
+    """Run and plot a list of specs together; returns the Scheduler."""
+    sched = Scheduler(cfg, device=device, workers=workers, results_dir=results_dir,
+                      renderer=renderer)
+    for spec in specs:
+        sched.add(spec)
+    return sched.run().render()
@@ -1,52 +1,139 @@
 # traffic_jam_paper/metrics.py
 import numpy as np
-from typing import Dict, Tuple
+import torch
+from typing import Dict, List
 
-# Allow running both as a package and as a plain script workspace.
-try:
-    from .road import Road
-except ImportError:  # pragma: no cover
-    from road import Road
+def _as_tensor(a, device=None):
+    if torch.is_tensor(a):
+        return a if device is None else a.to(device)
+    return torch.as_tensor(np.asarray(a), device=device)
 
-def jam_length_by_section(profile: Dict, road: Road, jam_headway_threshold: float) -> Dict[str, float]:
+def road_starts(roads, device="cpu", dtype=torch.float32):
+    """Segment starts of every road as a (B, K) tensor padded with +inf."""
+    K = max(len(road.bounds) for road in roads)
+    starts = torch.full((len(roads), K), float("inf"), dtype=dtype)
+    for b, road in enumerate(roads):
+        starts[b, :len(road.bounds)] = torch.as_tensor(road.starts, dtype=dtype)
+    return starts.to(device)
+
+def jam_metrics(x_mod, dx, L, starts, dx_threshold):
+    """
+    Jam clusters of a batch of ring states in one vectorized pass.
+
+    x_mod, dx: (B, N) in ring order (vehicle i+1 drives ahead of i, dx[i]
+    is the headway to it); L: (B,) or (B, 1) ring lengths; starts: (B, K)
+    segment starts padded with +inf (see road_starts).
+
+    A vehicle is jammed when dx < dx_threshold, and a cluster is a run of
+    consecutive jammed vehicles along the ring (run-length encoding of the
+    jam mask), including a run that wraps from the last vehicle to the
+    first. A cluster's length is the road it occupies, the sum of its
+    headways, so it does not depend on where the ring or a segment is cut.
+    Clusters belong to the segment of their head (front) vehicle.
+
+    Returns a dict of tensors on the input device, without host syncs:
+      jammed          (B, N) bool jam mask
+      cluster_id      (B, N) cluster of every jammed vehicle (-1 if free)
+      cluster_length  (B, N) length of cluster c in column c, 0-padded
+      n_clusters      (B,)   clusters per ring
+      section_length  (B, K) jammed road per segment (headways of the
+                             jammed vehicles in it)
+      section_clusters(B, K) clusters whose head lies in the segment
+      jam_fraction    (B,)   jammed road / L
+    """
+    dx = _as_tensor(dx)
+    x_mod = _as_tensor(x_mod, dx.device).to(dx.dtype)
+    L = _as_tensor(L, dx.device).to(dx.dtype).reshape(-1)
+    starts = _as_tensor(starts, dx.device).to(dx.dtype)
+    B, N = dx.shape
+    K = starts.shape[1]
+
+    jammed = dx < dx_threshold
+    behind = torch.roll(jammed, 1, dims=1)
+    ahead = torch.roll(jammed, -1, dims=1)
+    rear = jammed & ~behind
+    head = jammed & ~ahead
+    # a fully jammed ring is one cluster from vehicle 0 to vehicle N-1
+    everywhere = jammed.all(dim=1)
+    rear[:, 0] |= everywhere
+    head[:, -1] |= everywhere
+
+    n_clusters = rear.sum(dim=1)
+    cid = torch.cumsum(rear.long(), dim=1) - 1
+    # vehicles before the first rear belong to the run wrapping the ring
+    cid = torch.where(cid < 0, n_clusters.unsqueeze(1) - 1, cid)
+    cid = torch.where(jammed, cid, torch.full_like(cid, -1))
+
+    jam_dx = torch.where(jammed, dx, torch.zeros_like(dx))
+    cluster_length = torch.zeros_like(dx).scatter_add_(1, cid.clamp(min=0), jam_dx)
+
+    seg = torch.searchsorted(starts.contiguous(), x_mod.contiguous(), right=True) - 1
+    seg = seg.clamp_(0, K - 1)
+    section_length = torch.zeros((B, K), device=dx.device, dtype=dx.dtype)
+    section_length.scatter_add_(1, seg, jam_dx)
+    section_clusters = torch.zeros((B, K), device=dx.device, dtype=torch.long)
+    section_clusters.scatter_add_(1, seg, head.long())
+
+    return {
+        "jammed": jammed,
+        "cluster_id": cid,
+        "cluster_length": cluster_length,
+        "n_clusters": n_clusters,
+        "section_length": section_length,
+        "section_clusters": section_clusters,
+        "jam_fraction": jam_dx.sum(dim=1) / L,
+    }
+
+def headway_rounding_error(x_absmax, dx_max, dtype) -> np.ndarray:
+    """
+    Worst-case rounding error of a headway x[i+1] - x[i] computed in dtype
+    when positions reach |x| <= x_absmax and headways dx <= dx_max: each
+    position is off by at most half an ulp of x_absmax, and the difference
+    rounds by at most half an ulp of dx_max, so
+        ulp(x_absmax) + ulp(dx_max) / 2.
+    Arguments may be arrays (one value per ring); returns float64.
+    """
+    dtype = np.dtype(dtype)
+    x_absmax = np.asarray(x_absmax, dtype=dtype)
+    dx_max = np.asarray(dx_max, dtype=dtype)
+    return np.spacing(x_absmax).astype(np.float64) + 0.5 * np.spacing(dx_max).astype(np.float64)
+
+def normal_section_ratios(x_mod, dx, roads, dx_threshold) -> np.ndarray:
+    """
+    Jam-length ratio lJk / L of every normal section N1, N2, ... for a batch
+    of final profiles (x_mod, dx: (B, N) or lists of (N,) profiles). Rows
+    with fewer normal sections are padded with 0. Returns (B, max #N).
+    """
+    if isinstance(dx, (list, tuple)):
+        dx = torch.stack([_as_tensor(d) for d in dx])
+        x_mod = torch.stack([_as_tensor(x) for x in x_mod])
+    dx = _as_tensor(dx)
+    L = torch.tensor([road.length() for road in roads], dtype=torch.float64)
+    m = jam_metrics(x_mod, dx, L, road_starts(roads, dx.device, dx.dtype), dx_threshold)
+    section = m["section_length"].double().cpu().numpy() / L.numpy()[:, None]
+
+    normal = [np.flatnonzero(~road.is_slow) for road in roads]
+    out = np.zeros((len(roads), max(len(idx) for idx in normal)))
+    for b, idx in enumerate(normal):
+        out[b, :len(idx)] = section[b, idx]
+    return out
+
+def jam_ratios_in_normal_sections(x_mod, dx, road, dx_threshold) -> List[float]:
+    """Jam-length ratio of every normal section of one profile (N,)."""
+    x_mod, dx = _as_tensor(x_mod), _as_tensor(dx)
+    return list(normal_section_ratios(x_mod[None], dx[None], [road], dx_threshold)[0])
+
+def jam_length_by_section(profile: Dict, road, jam_headway_threshold: float) -> Dict[str, float]:
     """
-    Estimate jam length in each Normal section N_k as in paper Fig5-7: jam is in normal section before slowdown.
-    We approximate jam region by positions where headway < threshold (dense) AND vehicle is in Normal section.
-    Then jam length ≈ sum of local headways (dx) for jam vehicles.
+    Jam length in each normal section N_k as in paper Fig5-7 (the jam sits
+    in the normal section before a slowdown), from a run_simulation result
+    with profiles (x_mod, dx).
 
     Returns:
       {"N1": lJ1/L, "N2": lJ2/L, ... , "total": sum/L}
     """
-    x = profile["x"]
-    dx = profile["dx"]
-    kind = profile["kind"]   # 0=N,1=S
-    L = road.L
-
-    # assign section index counting only N sections in order along road
-    # We map each vehicle to which N segment it lies in.
-    labels = road.labels()
-    # build cumulative boundaries and N indices
-    N_spans = []
-    nidx = 0
-    for seg_kind, a, b in labels:
-        if seg_kind == "N":
-            nidx += 1
-            N_spans.append((nidx, a, b))
-
-    # vehicle -> N_k (or 0 if not in normal)
-    Nk = np.zeros_like(x, dtype=int)
-    xm = np.mod(x, L)
-    for k, a, b in N_spans:
-        mask = (xm >= a) & (xm < b)
-        Nk[mask] = k
-
-    jam_mask = (kind == 0) & (dx < jam_headway_threshold) & (Nk > 0)
-
-    out = {}
-    total = 0.0
-    for k, _, _ in N_spans:
-        Lk = float(np.sum(dx[jam_mask & (Nk == k)]))
-        out[f"N{k}"] = Lk / L
-        total += Lk
-    out["total"] = total / L
+    ratios = jam_ratios_in_normal_sections(profile["x_mod"], profile["dx"], road,
+                                           jam_headway_threshold)
+    out = {f"N{k + 1}": float(r) for k, r in enumerate(ratios)}
+    out["total"] = float(sum(ratios))
     return out
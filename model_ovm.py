@@ -1,4 +1,8 @@
+import math
+import numpy as np
 import torch
+from typing import Callable, NamedTuple, Optional
+from profiling import phase
 
 def _to_tensor(x, device, dtype):
     if torch.is_tensor(x):
@@ -12,6 +16,226 @@ def V_form(dx, vmax, x_c, alpha_ov):
     """
     return 0.5 * vmax * (torch.tanh(alpha_ov * (dx - x_c)) + torch.tanh(alpha_ov * x_c))
 
+def empirical_curve(dx, v_over_vmax):
+    """
+    OV curve from measured points: V = vmax * g(dx), with g interpolated
+    linearly between the samples (dx ascending, g non-decreasing) and held
+    constant outside them; x_c and alpha are ignored. Register it with
+    register_ov_curve and select it with SimCfg.ov_curve (tabulated runs).
+    """
+    xs = torch.as_tensor(np.asarray(dx, dtype=np.float64))
+    gs = torch.as_tensor(np.asarray(v_over_vmax, dtype=np.float64))
+    if xs.ndim != 1 or xs.shape != gs.shape or len(xs) < 2 or not bool((xs[1:] > xs[:-1]).all()):
+        raise ValueError("empirical_curve needs two matching 1-D sample arrays, dx ascending")
+
+    def curve(dx, vmax, x_c, alpha_ov):
+        x, g = xs.to(dx.device, dx.dtype), gs.to(dx.device, dx.dtype)
+        j = (torch.searchsorted(x, dx.contiguous()) - 1).clamp_(0, len(x) - 2)
+        w = ((dx - x[j]) / (x[j + 1] - x[j])).clamp_(0.0, 1.0)
+        return vmax * torch.lerp(g[j], g[j + 1], w)
+
+    curve.dx_max = float(xs[-1])
+    return curve
+
+# OV curves V(dx, vmax, x_c, alpha_ov), selected by SimCfg.ov_curve
+OV_CURVES = {"tanh": V_form}
+
+def register_ov_curve(name, fn):
+    """Make fn(dx, vmax, x_c, alpha_ov) -> V available as SimCfg.ov_curve = name."""
+    OV_CURVES[name] = fn
+
+class OVTable(NamedTuple):
+    """
+    Tabulated OV curves of a batch (see ov_table): polynomial coefficients
+    of every table interval, one block per distinct (vmax, x_c), each block
+    ending with a constant interval that holds V(dx_max).
+    """
+    base: torch.Tensor         # (B, K) offset of the block of every segment
+    coef: torch.Tensor         # (P, C * n_nodes) coefficients in t = dx/h - j
+    inv_h: float
+    dx_max: float
+    exact_tails: bool          # curve constant (in dtype) outside [0, dx_max]
+    fn: Callable               # exact curve, used outside the table otherwise
+    max_error: float           # measured max |table - curve| inside the table
+    bound: Optional[float]     # analytic error bound (tanh curve only)
+
+# max |tanh''| and max |tanh''''| over the real line
+_TANH_D2 = 4.0 / (3.0 * math.sqrt(3.0))
+_TANH_D4 = 4.0858855
+
+def ov_table_error_bound(kind, h, vmax, alpha_ov):
+    """
+    Max interpolation error of the tanh curve tabulated at spacing h:
+      linear  h^2/8   * max|V''|   = h^2/8   * vmax/2 * alpha^2 * 0.770
+      cubic   h^4/384 * max|V''''| = h^4/384 * vmax/2 * alpha^4 * 4.086
+    (cubic Hermite with exact slopes). Rounding in the working dtype,
+    about eps * vmax, comes on top.
+    """
+    if kind == "linear":
+        return h**2 / 8 * 0.5 * vmax * alpha_ov**2 * _TANH_D2
+    if kind == "cubic":
+        return h**4 / 384 * 0.5 * vmax * alpha_ov**4 * _TANH_D4
+    raise ValueError(f"unknown ov_table {kind!r}")
+
+def _eval_curve(fn, dx, vmax, x_c, alpha_ov, clamp=True):
+    as64 = lambda a: torch.tensor(a, dtype=torch.float64)
+    V = fn(dx, as64(vmax), as64(x_c), as64(alpha_ov))
+    return torch.clamp(V, min=0.0) if clamp else V
+
+def _curve_coef(fn, kind, h, n_nodes, vmax, x_c, alpha_ov):
+    """(P, n_nodes) float64 coefficients of one curve, and its max error."""
+    nodes = torch.arange(n_nodes, dtype=torch.float64) * h
+    V = _eval_curve(fn, nodes, vmax, x_c, alpha_ov)
+    v0, v1 = V[:-1], V[1:]
+    if kind == "linear":
+        coef = torch.stack([v0, v1 - v0], dim=1)
+    else:
+        # cubic Hermite, slopes (times h) by central differences of the
+        # unclamped curve, so the slope at dx = 0 is not halved
+        eps = 1e-5
+        S = h * (_eval_curve(fn, nodes + eps, vmax, x_c, alpha_ov, clamp=False)
+                 - _eval_curve(fn, nodes - eps, vmax, x_c, alpha_ov, clamp=False)) / (2 * eps)
+        s0, s1 = S[:-1], S[1:]
+        coef = torch.stack([v0, s0, 3 * (v1 - v0) - 2 * s0 - s1, 2 * (v0 - v1) + s0 + s1],
+                           dim=1)
+
+    # error against the curve at 7 points inside every interval
+    t = torch.arange(1, 8, dtype=torch.float64) / 8
+    approx = coef[:, -1:].expand(-1, len(t))
+    for k in range(coef.shape[1] - 2, -1, -1):
+        approx = approx * t + coef[:, k:k + 1]
+    exact = _eval_curve(fn, nodes[:-1, None] + h * t, vmax, x_c, alpha_ov)
+    error = float((approx - exact).abs().max())
+    last = torch.zeros((1, coef.shape[1]), dtype=torch.float64)
+    last[0, 0] = V[-1]
+    return torch.cat([coef, last]).T.contiguous(), error
+
+# coefficient blocks, keyed on (curve, kind, h, dx_max, vmax, x_c, alpha)
+_TABLE_BLOCKS = {}
+
+def ov_table(roads, cfg, device, dtype, row_cfgs=None):
+    """
+    OVTable for cfg.ov_table = "linear" or "cubic": the curve cfg.ov_curve
+    of every distinct (vmax, x_c, alpha) on the roads, sampled at spacing
+    cfg.ov_table_h over [0, dx_max]. dx_max is cfg.ov_table_max or, if 0,
+    max(x_c + 20/alpha), past which tanh is 1 in float64 (or the last
+    sample of an empirical curve, if further). Blocks are built once in
+    float64 and cached. When the curve is constant in dtype on both tails,
+    clamping dx into the table is exact; otherwise ov_lookup evaluates the
+    curve itself for headways outside the table. row_cfgs: optional SimCfg
+    per road for its x_c and alpha_ov.
+    """
+    if cfg.ov_table not in ("linear", "cubic"):
+        raise ValueError(f"unknown ov_table {cfg.ov_table!r}")
+    if cfg.ov_curve not in OV_CURVES:
+        raise ValueError(f"unknown ov_curve {cfg.ov_curve!r}")
+    fn = OV_CURVES[cfg.ov_curve]
+    h = cfg.ov_table_h
+    rows = row_cfgs or [cfg] * len(roads)
+    dx_max = cfg.ov_table_max
+    if dx_max <= 0:
+        reach = max(float(np.max(road.x_c(c.x_f_c, c.x_s_c))) + 20.0 / c.alpha_ov
+                    for road, c in zip(roads, rows))
+        dx_max = max(reach, getattr(fn, "dx_max", 0.0))
+    n_nodes = int(math.ceil(dx_max / h)) + 1
+    dx_max = (n_nodes - 1) * h
+
+    curves = []
+    base = torch.zeros((len(roads), max(len(road.bounds) for road in roads)), dtype=torch.long)
+    for b, (road, c) in enumerate(zip(roads, rows)):
+        for k, (vmax, x_c) in enumerate(zip(road.vmax.tolist(),
+                                            road.x_c(c.x_f_c, c.x_s_c).tolist())):
+            curve = (vmax, x_c, c.alpha_ov)
+            if curve not in curves:
+                curves.append(curve)
+            base[b, k] = curves.index(curve) * n_nodes
+
+    blocks, errors = [], []
+    exact_tails = True
+    far = torch.tensor([-1e6, 0.0, dx_max, 1e6], dtype=torch.float64)
+    for vmax, x_c, alpha in curves:
+        key = (fn, cfg.ov_table, h, dx_max, vmax, x_c, alpha)
+        if key not in _TABLE_BLOCKS:
+            _TABLE_BLOCKS[key] = _curve_coef(fn, cfg.ov_table, h, n_nodes, vmax, x_c, alpha)
+        blocks.append(_TABLE_BLOCKS[key][0])
+        errors.append(_TABLE_BLOCKS[key][1])
+        lo_far, lo, hi, hi_far = _eval_curve(fn, far, vmax, x_c, alpha).to(dtype).tolist()
+        exact_tails &= lo_far == lo and hi == hi_far
+
+    bound = None
+    if fn is V_form:
+        bound = max(ov_table_error_bound(cfg.ov_table, h, vmax, alpha)
+                    for vmax, _, alpha in curves)
+    return OVTable(base=base.to(device),
+                   coef=torch.cat(blocks, dim=1).to(device=device, dtype=dtype),
+                   inv_h=1.0 / h, dx_max=dx_max,
+                   exact_tails=exact_tails, fn=fn, max_error=max(errors), bound=bound)
+
+def ov_interp(dx, base, table):
+    """V from the table blocks at base (same shape as dx), dx clamped into the table."""
+    r = torch.clamp(dx, 0.0, table.dx_max) * table.inv_h
+    j = r.long()                        # floor, r >= 0
+    t = r - j
+    idx = base + j
+    coef = table.coef
+    V = torch.take(coef[-1], idx)
+    for k in range(coef.shape[0] - 2, -1, -1):
+        V = torch.addcmul(torch.take(coef[k], idx), V, t)
+    return V
+
+def segment_tables(road, cfg, device, dtype):
+    """
+    (starts, vmax, x_c, offset) tensors of shape (K,) for ov_lookup, where
+    offset = tanh(alpha*x_c) is the dx-independent term of V_form.
+    Built once per (device, dtype, OV parameters) and cached on the road.
+    """
+    key = (str(device), dtype, cfg.alpha_ov, cfg.x_f_c, cfg.x_s_c)
+    if key not in road._tables:
+        alpha = _to_tensor(cfg.alpha_ov, device, dtype)
+        x_c = _to_tensor(road.x_c(cfg.x_f_c, cfg.x_s_c), device, dtype)
+        road._tables[key] = (
+            _to_tensor(road.starts, device, dtype),
+            _to_tensor(road.vmax, device, dtype),
+            x_c,
+            torch.tanh(alpha * x_c),
+        )
+    return road._tables[key]
+
+def ov_lookup(dx, x_mod, starts, vmax, x_c, offset, alpha_ov, table=None):
+    """
+    Optimal velocity from segment tables.
+    dx, x_mod: (N,) or (B, N) tensors, x_mod in [0, L)
+    starts, vmax, x_c, offset: (K,) or (B, K) tables, starts ascending
+    Each vehicle's segment is one searchsorted on starts; V is then a single
+    tanh over all vehicles, so the cost does not grow with K.
+    table: optional OVTable (see ov_table); V is then interpolated from the
+    tabulated curve of the segment instead, and outside the table it is
+    evaluated exactly unless the curve is constant there.
+    """
+    if table is not None:
+        with phase("segment_lookup"):
+            idx = torch.searchsorted(starts, x_mod, right=True) - 1
+            idx = idx.clamp_(0, starts.shape[-1] - 1)
+            base = torch.gather(table.base, -1, idx)
+        with phase("ov_table"):
+            V = ov_interp(dx, base, table)
+            if table.exact_tails:
+                return V
+            vm = torch.gather(vmax, -1, idx)
+            xc = torch.gather(x_c, -1, idx)
+            exact = torch.clamp(table.fn(dx, vm, xc, alpha_ov), min=0.0)
+            return torch.where((dx < 0) | (dx > table.dx_max), exact, V)
+
+    with phase("segment_lookup"):
+        idx = torch.searchsorted(starts, x_mod, right=True) - 1
+        idx = idx.clamp_(0, starts.shape[-1] - 1)
+        vm = torch.gather(vmax, -1, idx)
+        xc = torch.gather(x_c, -1, idx)
+        off = torch.gather(offset, -1, idx)
+    with phase("ov_tanh"):
+        V = 0.5 * vm * (torch.tanh(alpha_ov * (dx - xc)) + off)
+        return torch.clamp(V, min=0.0)
+
 def optimal_velocity_sections(dx, x_mod, road, cfg, device):
     """
     dx: (N,) tensor
@@ -19,19 +243,11 @@ def optimal_velocity_sections(dx, x_mod, road, cfg, device):
     road: Road with segments
     """
     dtype = dx.dtype
-    V = torch.zeros_like(dx)
-
-    alpha = _to_tensor(cfg.alpha_ov, device, dtype)
-    xf_c  = _to_tensor(cfg.x_f_c, device, dtype)
-    xs_c  = _to_tensor(cfg.x_s_c, device, dtype)
-
-    for (start, end, kind, vmax) in road.bounds:
-        start_t = _to_tensor(start, device, dtype)
-        end_t   = _to_tensor(end, device, dtype)
-        mask = (x_mod >= start_t) & (x_mod < end_t)
-        if mask.any():
-            vmax_t = _to_tensor(vmax, device, dtype)
-            x_c = xf_c if kind == "N" else xs_c
-            V[mask] = V_form(dx[mask], vmax_t, x_c, alpha)
-
-    return torch.clamp(V, min=0.0)
+    with phase("optimal_velocity"):
+        starts, vmax, x_c, offset = segment_tables(road, cfg, device, dtype)
+        alpha = _to_tensor(cfg.alpha_ov, device, dtype)
+        table = None
+        if cfg.ov_table != "off":
+            table = ov_table([road], cfg, device, dtype)
+            table = table._replace(base=table.base[0])
+        return ov_lookup(dx, x_mod, starts, vmax, x_c, offset, alpha, table)
@@ -0,0 +1,448 @@
+"""
+Streaming observers of a running simulation.
+
+An Observer is called by the fixed-step RK4 loop (torch and NumPy
+engines) every `every` steps from step `start` on, with a State of the
+(B, N) batch. It keeps fixed-size reductions on the device of the state
+(running means, histograms, reservoir samples), so memory does not grow
+with the run, and reports them per row when the run ends.
+
+State computes dx, x_mod, the jam mask, the jam fronts and the segment
+index lazily, at most once per observed step, so observers sharing a
+step share them. Per-row scalars of QUANTITIES are cached on the State
+as well.
+
+    mean = RunningMean(["jam_fraction", "jam_count"], every=20)
+    hist = HeadwayHistogram(bins=60, range=(0.0, 12.0), start=cfg.t_warmup)
+    res = run_simulation(road, rho, cfg, observers=[mean, hist])
+    res["mean"]["jam_fraction"], res["headway_hist"]["counts"]
+
+LoopDetectors are virtual induction loops at the Road.detectors positions
+of every job (by default each segment boundary), counting crossings every
+step with time-mean speed and occupancy.
+"""
+import random
+from functools import cached_property
+import numpy as np
+import torch
+
+class State:
+    """
+    State of the batch at step t as seen by observers: x, v (B, N), L
+    (B, 1), segment starts (B, K). The derived fields are computed on
+    first access with the engine's headway / remainder functions (into its
+    buffers where it has them) and then shared.
+    """
+
+    def __init__(self, t, x, v, L, starts, dx_threshold, headway, remainder):
+        self.t = t
+        self.x = x
+        self.v = v
+        self.L = L
+        self.starts = starts
+        self.dx_threshold = dx_threshold
+        self._headway = headway
+        self._remainder = remainder
+        self.quantities = {}
+
+    @cached_property
+    def dx(self):
+        return self._headway(self.x)
+
+    @cached_property
+    def x_mod(self):
+        return self._remainder(self.x)
+
+    @cached_property
+    def jam(self):
+        return self.dx < self.dx_threshold
+
+    @cached_property
+    def fronts(self):
+        """Upstream jam fronts: jammed vehicles whose follower is free."""
+        return self.jam & ~torch.roll(self.jam, 1, dims=1)
+
+    @cached_property
+    def segment(self):
+        idx = torch.searchsorted(self.starts, self.x_mod, right=True) - 1
+        return idx.clamp_(0, self.starts.shape[-1] - 1)
+
+    def quantity(self, name):
+        """Per-row value (B,) of QUANTITIES[name], computed once per step."""
+        if name not in self.quantities:
+            self.quantities[name] = QUANTITIES[name](self)
+        return self.quantities[name]
+
+# per-row scalars of a State, (B,) each
+QUANTITIES = {
+    "v_mean": lambda s: s.v.mean(dim=1),
+    "dx_var": lambda s: s.dx.var(dim=1),
+    "jam_fraction": lambda s: (s.dx * s.jam).sum(dim=1) / s.L[:, 0],
+    "jam_count": lambda s: s.fronts.sum(dim=1).to(s.x.dtype),
+    "jam_vehicles": lambda s: s.jam.sum(dim=1).to(s.x.dtype) / s.x.shape[1],
+}
+
+class Observer:
+    """
+    Base class. Subclasses allocate their reductions in open(), update
+    them in observe(state) and return per-row numpy arrays from result().
+    Tensor attributes named in _state are checkpointed; the observation
+    count n is always kept. setup() sees the SimCfg and the jobs' roads
+    once per run; every=None takes cfg.sample_every. reset() runs before
+    every open(), so an instance can observe several runs one after the
+    other.
+    """
+
+    name = "observer"
+    _state = ()
+
+    def __init__(self, every=None, start=0, name=None):
+        self._every = every
+        self.every = every
+        self.start = start
+        if name is not None:
+            self.name = name
+        self.n = 0
+
+    def setup(self, cfg, roads):
+        self.every = cfg.sample_every if self._every is None else self._every
+
+    def reset(self):
+        """Forget the observations of a previous run."""
+        self.n = 0
+
+    def due(self, t):
+        return t >= self.start and (t - self.start) % self.every == 0
+
+    def open(self, x, L, starts):
+        pass
+
+    def observe(self, state):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def state_dict(self):
+        state = {k: getattr(self, k) for k in self._state}
+        state["n"] = self.n
+        return state
+
+    def load_state_dict(self, state):
+        for k in self._state:
+            getattr(self, k).copy_(state[k])
+        self.n = state["n"]
+
+class RunningMean(Observer):
+    """Per-row running mean and standard deviation (Welford) of QUANTITIES."""
+
+    name = "mean"
+    _state = ("mean", "m2")
+
+    def __init__(self, quantities=("v_mean", "jam_fraction"), **kwargs):
+        super().__init__(**kwargs)
+        self.quantities = list(quantities)
+
+    def open(self, x, L, starts):
+        shape = (len(self.quantities), x.shape[0])
+        self.mean = torch.zeros(shape, device=x.device, dtype=torch.float64)
+        self.m2 = torch.zeros_like(self.mean)
+
+    def observe(self, state):
+        q = torch.stack([state.quantity(name) for name in self.quantities]).double()
+        self.n += 1
+        delta = q - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (q - self.mean)
+
+    def result(self):
+        mean = self.mean.cpu().numpy()
+        std = np.sqrt(self.m2.cpu().numpy() / max(self.n - 1, 1))
+        out = {"n": np.full(mean.shape[1], self.n)}
+        for i, name in enumerate(self.quantities):
+            out[name] = mean[i]
+            out[name + "_std"] = std[i]
+        return out
+
+class HeadwayHistogram(Observer):
+    """
+    Per-row histogram of all headways over the observed steps: bins equal
+    bins on range, headways outside range counted in the edge bins.
+    """
+
+    name = "headway_hist"
+    _state = ("counts",)
+
+    def __init__(self, bins=64, range=(0.0, 16.0), **kwargs):
+        super().__init__(**kwargs)
+        self.bins = bins
+        self.range = range
+
+    def open(self, x, L, starts):
+        B, N = x.shape
+        self.counts = torch.zeros(B * self.bins, device=x.device, dtype=torch.long)
+        self.row = (torch.arange(B, device=x.device) * self.bins).unsqueeze(1)
+        self.ones = torch.ones(1, device=x.device, dtype=torch.long).expand(B * N)
+        self.scale = self.bins / (self.range[1] - self.range[0])
+
+    def observe(self, state):
+        self.n += 1
+        idx = ((state.dx - self.range[0]) * self.scale).clamp_(0, self.bins - 1).long()
+        self.counts.scatter_add_(0, (idx + self.row).view(-1), self.ones)
+
+    def result(self):
+        return {"counts": self.counts.view(-1, self.bins).cpu().numpy(),
+                "edges": np.tile(np.linspace(*self.range, self.bins + 1),
+                                 (self.counts.numel() // self.bins, 1))}
+
+class SectionFlow(Observer):
+    """
+    Per-row, per-segment time means of density (vehicles per length) and
+    flow (sum of v per length) over the observed steps, (B, K); padding
+    segments of shorter roads are NaN.
+    """
+
+    name = "section_flow"
+    _state = ("count", "flow")
+
+    def open(self, x, L, starts):
+        B, K = starts.shape
+        ends = torch.minimum(torch.cat([starts[:, 1:], L], dim=1), L)
+        self.length = torch.where(torch.isfinite(starts), ends - starts,
+                                  torch.full_like(starts, float("nan"))).double()
+        self.count = torch.zeros((B, K), device=x.device, dtype=torch.float64)
+        self.flow = torch.zeros_like(self.count)
+        self.ones = torch.ones((1, 1), device=x.device, dtype=torch.float64).expand(x.shape)
+
+    def observe(self, state):
+        self.n += 1
+        self.count.scatter_add_(1, state.segment, self.ones)
+        self.flow.scatter_add_(1, state.segment, state.v.double())
+
+    def result(self):
+        norm = self.length * max(self.n, 1)
+        return {"density": (self.count / norm).cpu().numpy(),
+                "flow": (self.flow / norm).cpu().numpy()}
+
+class Reservoir(Observer):
+    """
+    Uniform random sample of `size` observed steps (algorithm R with a
+    seeded host RNG, the same slots for every row, so no host sync) of
+    QUANTITIES and, with fronts > 0, the positions x_mod of the first
+    `fronts` upstream jam fronts per row (NaN padded). result() gives the
+    sampled steps in time order with (B, size[, fronts]) values.
+    """
+
+    name = "reservoir"
+
+    def __init__(self, quantities=("jam_fraction", "jam_count"), size=256, fronts=0,
+                 seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.quantities = list(quantities)
+        self.size = size
+        self.fronts = fronts
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+    @property
+    def _state(self):
+        return ("steps", "values") + (("front_pos",) if self.fronts else ())
+
+    def open(self, x, L, starts):
+        B = x.shape[0]
+        self.steps = torch.full((self.size,), -1, dtype=torch.long)
+        self.values = torch.full((self.size, len(self.quantities), B), float("nan"),
+                                 device=x.device, dtype=x.dtype)
+        if self.fronts:
+            self.front_pos = torch.full((self.size, B, self.fronts), float("nan"),
+                                        device=x.device, dtype=x.dtype)
+
+    def reset(self):
+        super().reset()
+        self.rng = random.Random(self.seed)
+
+    def _slot(self):
+        if self.n < self.size:
+            return self.n
+        j = self.rng.randrange(self.n + 1)
+        return j if j < self.size else None
+
+    def observe(self, state):
+        slot = self._slot()
+        self.n += 1
+        if slot is None:
+            return
+        self.steps[slot] = state.t
+        for i, name in enumerate(self.quantities):
+            self.values[slot, i] = state.quantity(name)
+        if self.fronts:
+            pos = torch.where(state.fronts, state.x_mod, torch.full_like(state.x_mod, float("inf")))
+            k = min(self.fronts, pos.shape[1])
+            first = torch.topk(pos, k, dim=1, largest=False).values
+            self.front_pos[slot, :, :k] = torch.where(torch.isinf(first),
+                                                      torch.full_like(first, float("nan")), first)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state["rng"] = self.rng.getstate()
+        return state
+
+    def load_state_dict(self, state):
+        super().load_state_dict(state)
+        self.rng.setstate(state["rng"])
+
+    def result(self):
+        steps = self.steps.numpy()
+        order = np.argsort(np.where(steps < 0, np.iinfo(np.int64).max, steps))
+        kept = order[:min(self.n, self.size)]
+        values = self.values.cpu().numpy()[kept]            # (S, Q, B)
+        out = {"steps": np.tile(steps[kept], (values.shape[2], 1))}
+        for i, name in enumerate(self.quantities):
+            out[name] = values[:, i].T
+        if self.fronts:
+            out["jam_fronts"] = self.front_pos.cpu().numpy()[kept].transpose(1, 0, 2)
+        return out
+
+class LoopDetectors(Observer):
+    """
+    Virtual loop detectors at the Road.detectors positions of every row,
+    (B, D) results NaN padded. A vehicle crosses the detectors between its
+    x_mod of the previous and of the current observation; with the
+    detector interval index g = searchsorted(positions, x_mod) and laps
+    from a wrap of x_mod, it crosses detectors g_prev .. g_prev + net - 1
+    (mod D). These ranges are added to a (B, 2D + 1) difference array and
+    folded onto the detectors, so an observation costs about a dozen
+    (B, N) passes into preallocated buffers whatever D is (a compare per
+    detector up to 8 detectors, searchsorted beyond), without host syncs.
+    Counts are exact at any cadence as long as vehicles move less than
+    L / 2 between observations; speeds are those of the observation after
+    the crossing (every=1 for per-step values). Per detector: crossings
+    count, flow (count per time), time-mean speed, harmonic-mean
+    (space-mean) speed and occupancy, the fraction of time a vehicle of
+    `length` covers it, over the time from the first to the last
+    observation.
+    """
+
+    name = "loops"
+    _state = ("x_prev", "g_prev", "sums")
+
+    def __init__(self, length=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.length = length
+
+    def setup(self, cfg, roads):
+        super().setup(cfg, roads)
+        self.dt = cfg.dt
+        self.sizes = [len(road.detectors) for road in roads]
+        self.positions = np.full((len(roads), max(max(self.sizes), 1)), np.inf)
+        for b, road in enumerate(roads):
+            self.positions[b, :len(road.detectors)] = road.detectors
+
+    def open(self, x, L, starts):
+        B, D = self.positions.shape
+        dev = x.device
+        self.pos = torch.as_tensor(self.positions, device=dev, dtype=x.dtype)
+        self.size = torch.as_tensor(self.sizes, device=dev).unsqueeze(1)
+        self.fold = torch.arange(2 * D + 1, device=dev) % self.size.clamp(min=1)
+        self.half_L = L / 2
+        self.x_prev = torch.zeros_like(x)
+        self.g_prev = torch.zeros(x.shape, device=dev, dtype=torch.long)
+        self.g, self.g_from, self.g_to = (torch.empty_like(self.g_prev) for _ in range(3))
+        self.jump = torch.empty_like(x)
+        self.mask = torch.empty(x.shape, device=dev, dtype=torch.bool)
+        self.w = torch.empty((3,) + x.shape, device=dev, dtype=x.dtype)
+        self.diff = torch.zeros((3, B, 2 * D + 1), device=dev, dtype=x.dtype)
+        self.sums = torch.zeros((3, B, D), device=dev, dtype=torch.float64)
+
+    def _interval(self, x_mod):
+        """Number of detectors at or behind x_mod, into self.g."""
+        if self.pos.shape[1] > 8:
+            return torch.searchsorted(self.pos, x_mod, right=True, out=self.g)
+        self.g.zero_()
+        for k in range(self.pos.shape[1]):
+            torch.ge(x_mod, self.pos[:, k:k + 1], out=self.mask)
+            self.g.add_(self.mask)
+        return self.g
+
+    def observe(self, state):
+        x_mod = state.x_mod
+        g = self._interval(x_mod)
+        if self.n:
+            # a lap forward (backward) shifts the end (start) by D, both stay in [0, 2D]
+            torch.sub(x_mod, self.x_prev, out=self.jump)
+            torch.gt(self.jump, self.half_L, out=self.mask)
+            torch.add(self.g_prev, self.mask * self.size, out=self.g_from)
+            torch.lt(self.jump, -self.half_L, out=self.mask)
+            torch.add(g, self.mask * self.size, out=self.g_to)
+            # crossings, sum of v, sum of 1/v; zero for vehicles that did not cross
+            w = self.w
+            torch.ne(self.g_from, self.g_to, out=self.mask)
+            w[0].copy_(self.mask)
+            torch.mul(state.v, w[0], out=w[1])
+            torch.abs(state.v, out=w[2]).clamp_(min=1e-12).reciprocal_().mul_(w[0])
+            self.diff.zero_()
+            self.diff.scatter_add_(2, self.g_from.expand(3, -1, -1), w)
+            self.diff.scatter_add_(2, self.g_to.expand(3, -1, -1), w.neg_())
+            self.sums.scatter_add_(2, self.fold.expand(3, -1, -1),
+                                   self.diff.cumsum(dim=2).double())
+        self.x_prev.copy_(x_mod)
+        self.g_prev.copy_(g)
+        self.n += 1
+
+    def result(self):
+        count, sum_v, sum_inv_v = self.sums.cpu().numpy()
+        T = max(self.n - 1, 0) * self.every * self.dt
+        pad = np.isinf(self.positions)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = {"positions": self.positions, "count": count,
+                   "flow": count / T if T else np.full_like(count, np.nan),
+                   "speed": sum_v / count, "harmonic_speed": count / sum_inv_v,
+                   "occupancy": self.length * sum_inv_v / T if T
+                                else np.full_like(count, np.nan)}
+        return {k: np.where(pad, np.nan, val) for k, val in out.items()}
+
+class ObserverSet:
+    """
+    The observers of one run, driven by an engine loop: open() once with
+    the initial state and the engine's headway / remainder functions,
+    push() after every step, results() at the end. A step where no
+    observer is due costs one check per observer.
+    """
+
+    def __init__(self, observers, cfg, roads):
+        self.observers = list(observers)
+        names = [obs.name for obs in self.observers]
+        if len(set(names)) != len(names):
+            raise ValueError(f"observer names must be unique, got {names}")
+        for obs in self.observers:
+            obs.setup(cfg, roads)
+        self.dx_threshold = cfg.dx_threshold
+
+    def open(self, x, L, starts, headway, remainder):
+        self.L = L
+        self.starts = starts
+        self.headway = headway
+        self.remainder = remainder
+        for obs in self.observers:
+            obs.reset()
+            obs.open(x, L, starts)
+
+    def push(self, t, x, v):
+        due = [obs for obs in self.observers if obs.due(t)]
+        if not due:
+            return
+        state = State(t, x, v, self.L, self.starts, self.dx_threshold,
+                      self.headway, self.remainder)
+        for obs in due:
+            obs.observe(state)
+
+    def state_dict(self):
+        return [obs.state_dict() for obs in self.observers]
+
+    def load_state_dict(self, states):
+        for obs, state in zip(self.observers, states):
+            obs.load_state_dict(state)
+
+    def results(self):
+        """{observer name: {key: (B, ...) array}}."""
+        return {obs.name: obs.result() for obs in self.observers}
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import torch
+
+class _Null:
+    """Context manager doing nothing: what phase() returns while not profiling."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _Null()
+
+# profiler receiving the phases of the hot path; None = instrumentation off
+_active = None
+
+def phase(name):
+    """
+    Time a region of the hot path under name, e.g.
+        with profiling.phase("headway"): ...
+    Costs one global lookup while no Profiler is active.
+    """
+    if _active is None or torch.compiler.is_compiling():
+        return _NULL
+    return _active.phase(name)
+
+def count(name, n=1):
+    """Increment counter name (e.g. host syncs) of the active Profiler."""
+    if _active is not None and not torch.compiler.is_compiling():
+        _active.counters[name] = _active.counters.get(name, 0) + n
+
+class _Phase:
+    __slots__ = ("prof", "name", "t0", "ranges")
+
+    # prof.phases[name] = [calls, total seconds, self seconds]
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        if self.prof.torch_profiler:
+            self.ranges = torch.profiler.record_function(self.name)
+            self.ranges.__enter__()
+        self.prof._stack.append(0.0)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        prof = self.prof
+        if prof.sync:
+            prof._sync()
+        t1 = time.perf_counter()
+        if prof.torch_profiler:
+            self.ranges.__exit__(*exc)
+        dur = t1 - self.t0
+        nested = prof._stack.pop()
+        if prof._stack:
+            prof._stack[-1] += dur
+        stat = prof.phases.get(self.name)
+        if stat is None:
+            stat = prof.phases[self.name] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += dur
+        stat[2] += dur - nested
+        if len(prof.events) < prof.max_events:
+            prof.events.append((self.name, self.t0, t1))
+        return False
+
+class Profiler:
+    """
+    Lightweight timer registry for the simulation hot path. While active
+    (`with Profiler() as prof:` or start()/stop()), every profiling.phase
+    region records its wall time, and profiling.count its counters.
+
+    Per phase the report holds call count, total and mean wall time
+    (inclusive of nested phases) and self time (exclusive of them).
+    Counters include host syncs. Memory figures come from the CUDA caching
+    allocator (allocation count and bytes over the session) when CUDA is in
+    use. The first max_events regions are kept as a Chrome trace
+    (chrome://tracing or Perfetto).
+
+    Kernels run asynchronously on accelerators, so wall time there measures
+    launches unless sync=True, which synchronizes at the end of every phase
+    (and therefore slows the run). With torch_profiler=True the session also
+    runs under torch.profiler with memory profiling, the phases appear as
+    record_function ranges, and per-phase CPU/device memory is reported,
+    at a much higher overhead.
+    """
+
+    def __init__(self, sync=False, torch_profiler=False, max_events=200000):
+        self.sync = sync
+        self.torch_profiler = torch_profiler
+        self.max_events = max_events
+        self.phases = {}
+        self.counters = {}
+        self.events = []
+        self.memory = {}
+        self._stack = []
+        self._prev = None
+        self._torch_prof = None
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def _sync(self):
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            torch.cuda.synchronize()
+            self.counters["profiler_syncs"] = self.counters.get("profiler_syncs", 0) + 1
+
+    @staticmethod
+    def _cuda_memory():
+        if not (torch.cuda.is_available() and torch.cuda.is_initialized()):
+            return None
+        s = torch.cuda.memory_stats()
+        return {"allocations": s.get("allocation.all.allocated", 0),
+                "allocated_bytes": s.get("allocated_bytes.all.allocated", 0),
+                "peak_bytes": s.get("allocated_bytes.all.peak", 0)}
+
+    def start(self):
+        global _active
+        self._prev, _active = _active, self
+        self._mem0 = self._cuda_memory()
+        if self.torch_profiler:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_prof = torch.profiler.profile(activities=activities,
+                                                      profile_memory=True)
+            self._torch_prof.__enter__()
+        self.t_start = time.perf_counter()
+        return self
+
+    def stop(self):
+        global _active
+        self.wall = time.perf_counter() - self.t_start
+        if self._torch_prof is not None:
+            self._torch_prof.__exit__(None, None, None)
+        _active = self._prev
+        mem1 = self._cuda_memory()
+        if mem1 is not None:
+            mem0 = self._mem0 or {"allocations": 0, "allocated_bytes": 0}
+            self.memory["cuda"] = {"allocations": mem1["allocations"] - mem0["allocations"],
+                                   "allocated_bytes": mem1["allocated_bytes"] - mem0["allocated_bytes"],
+                                   "peak_bytes": mem1["peak_bytes"]}
+        if self._torch_prof is not None:
+            self.memory["per_phase"] = self._torch_phase_memory()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _torch_phase_memory(self):
+        out = {}
+        for evt in self._torch_prof.key_averages():
+            if evt.key in self.phases:
+                out[evt.key] = {
+                    "cpu_memory_bytes": getattr(evt, "cpu_memory_usage", 0),
+                    "device_memory_bytes": getattr(evt, "device_memory_usage",
+                                                   getattr(evt, "cuda_memory_usage", 0)),
+                }
+        return out
+
+    def report(self):
+        phases = {name: {"calls": calls, "total_s": total, "self_s": own,
+                         "mean_us": 1e6 * total / calls,
+                         "share": total / self.wall if self.wall else 0.0}
+                  for name, (calls, total, own) in sorted(self.phases.items(),
+                                                          key=lambda kv: -kv[1][1])}
+        return {"wall_s": self.wall, "phases": phases, "counters": dict(self.counters),
+                "memory": self.memory, "events": len(self.events),
+                "events_dropped": len(self.events) >= self.max_events}
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        return {"traceEvents": [
+            {"name": name, "ph": "X", "pid": pid, "tid": 0,
+             "ts": 1e6 * (t0 - self.t_start), "dur": 1e6 * (t1 - t0)}
+            for name, t0, t1 in self.events]}
+
+    def write(self, prefix="profile"):
+        """Write <prefix>.json (report) and <prefix>.trace.json (Chrome trace)."""
+        paths = [prefix + ".json", prefix + ".trace.json"]
+        with open(paths[0], "w") as fh:
+            json.dump(self.report(), fh, indent=2)
+        with open(paths[1], "w") as fh:
+            json.dump(self.chrome_trace(), fh)
+        if self._torch_prof is not None:
+            paths.append(prefix + ".torch_trace.json")
+            self._torch_prof.export_chrome_trace(paths[-1])
+        return paths
+
+    def summary(self, top=12):
+        lines = [f"[profile] wall {self.wall:.3f} s"]
+        for name, p in list(self.report()["phases"].items())[:top]:
+            lines.append(f"  {name:<16} {p['calls']:>9} calls {p['total_s']:>9.3f} s "
+                         f"(self {p['self_s']:>8.3f} s) {p['mean_us']:>9.1f} us/call "
+                         f"{100 * p['share']:>5.1f}%")
+        for name, n in self.counters.items():
+            lines.append(f"  {name:<16} {n:>9}")
+        return "\n".join(lines)
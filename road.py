@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from typing import List, Tuple
+import numpy as np
 
 @dataclass
 class Segment:
@@ -8,7 +9,7 @@ class Segment:
     vmax: float
 
 class Road:
-    def __init__(self, segments: List[Segment]):
+    def __init__(self, segments: List[Segment], detectors=None):
         assert len(segments) > 0
         self.segments = segments
         self.L = sum(s.length for s in segments)
@@ -22,5 +23,28 @@ class Road:
             self.bounds.append((start, end, seg.kind, seg.vmax))
             pos = end
 
+        # per-segment arrays for vectorized lookup (searchsorted on starts)
+        self.starts = np.array([b[0] for b in self.bounds], dtype=np.float64)
+        self.ends = np.array([b[1] for b in self.bounds], dtype=np.float64)
+        self.vmax = np.array([s.vmax for s in segments], dtype=np.float64)
+        self.is_slow = np.array([s.kind != "N" for s in segments])
+
+        # virtual loop detector positions in [0, L) (observers.LoopDetectors),
+        # by default one at the start of every segment, i.e. every N/S boundary
+        self.detectors = np.sort(np.asarray(self.starts if detectors is None else detectors,
+                                            dtype=np.float64))
+        assert ((self.detectors >= 0) & (self.detectors < self.L)).all()
+        self._tables = {}   # device tensors, filled by model_ovm.segment_tables
+
+    def __getstate__(self):
+        # cached device tensors are rebuilt on demand after unpickling
+        state = self.__dict__.copy()
+        state["_tables"] = {}
+        return state
+
     def length(self) -> float:
         return self.L
+
+    def x_c(self, x_f_c: float, x_s_c: float) -> np.ndarray:
+        """Turning point of V(dx) for every segment."""
+        return np.where(self.is_slow, x_s_c, x_f_c)
@@ -1,33 +1,84 @@
+import json
 import argparse
+import cache
+import checkpoint
+import profiling
+import workqueue
 from config import SimCfg
+from experiments.spec import execute, load_spec
+from experiments.results import Renderer, results_path
 
-from experiments.fig2_fundamental import run as run_fig2
-from experiments.fig3_profile import run as run_fig3
-from experiments.fig4_9_theory_current import run as run_fig4_9
-from experiments.fig5_jam_ratio_equal import run as run_fig5
-from experiments.fig8_strongest_slowdown import run as run_fig8
-from experiments.fig10_three_slowdowns import run as run_fig10
-from experiments.fig6_jam_ratio_unequal import run as run_fig6
-from experiments.fig7_various_layouts import run as run_fig7
-
-
-FIG_RUNNERS = {
-    "2": run_fig2,
-    "3": run_fig3,
-    "4": run_fig4_9,
-    "9": run_fig4_9,
-    "5": run_fig5,
-    "6": run_fig6,
-    "7": run_fig7,
-    "8": run_fig8,
-    "10": run_fig10,
+from experiments.fig2_fundamental import spec as spec_fig2
+from experiments.fig3_profile import spec as spec_fig3
+from experiments.fig4_9_theory_current import spec as spec_fig4_9
+from experiments.fig5_jam_ratio_equal import spec as spec_fig5
+from experiments.fig8_strongest_slowdown import spec as spec_fig8
+from experiments.fig10_three_slowdowns import spec as spec_fig10
+from experiments.fig6_jam_ratio_unequal import spec as spec_fig6
+from experiments.fig7_various_layouts import spec as spec_fig7
+
+
+FIG_SPECS = {
+    "2": spec_fig2,
+    "3": spec_fig3,
+    "4": spec_fig4_9,
+    "9": spec_fig4_9,
+    "5": spec_fig5,
+    "6": spec_fig6,
+    "7": spec_fig7,
+    "8": spec_fig8,
+    "10": spec_fig10,
 }
 
 def build_parser():
     p = argparse.ArgumentParser()
-    p.add_argument("--fig", nargs="+", required=True)
+    p.add_argument("--fig", nargs="+", default=[])
+    p.add_argument("--spec", nargs="+", default=[], metavar="FILE",
+                   help="figure specs (.json or .yaml) to run along with --fig")
+    p.add_argument("--save_spec", type=str, default=None, metavar="FILE",
+                   help="write the specs of this run as JSON")
 
     p.add_argument("--device", type=str, default="cpu")
+    p.add_argument("--workers", type=int, default=1,
+                   help="processes for density sweeps (1 = one batched run in-process)")
+
+    # result cache
+    p.add_argument("--cache_dir", type=str, default=".sim_cache")
+    p.add_argument("--cache_max_mb", type=float, default=1024.0)
+    p.add_argument("--no-cache", dest="no_cache", action="store_true",
+                   help="neither read nor write cached results")
+    p.add_argument("--refresh", action="store_true",
+                   help="recompute every run and overwrite its cache entry")
+
+    # checkpoint / resume
+    p.add_argument("--checkpoint_dir", type=str, default=None, metavar="DIR",
+                   help="checkpoint runs and finished sweep batches to DIR (off by default)")
+    p.add_argument("--checkpoint_every", type=int, default=5000,
+                   help="steps between integrator snapshots (0 = only finished batches)")
+    p.add_argument("--resume", action="store_true",
+                   help="continue from the checkpoints of an interrupted run")
+
+    # distributed sweep queue
+    p.add_argument("--queue", type=str, default=None, metavar="DIR",
+                   help="run density sweeps through a work queue in DIR on a shared "
+                        "filesystem (workers: python workqueue.py DIR)")
+    p.add_argument("--queue_workers", type=int, default=0,
+                   help="local worker processes to start on the queue")
+    p.add_argument("--queue_batch", type=int, default=8, help="jobs per worker claim")
+    p.add_argument("--queue_lease", type=float, default=300.0,
+                   help="seconds before an unrenewed claim expires and is retried")
+    p.add_argument("--queue_attempts", type=int, default=3,
+                   help="attempts per job before the run fails")
+    p.add_argument("--queue_submit_only", action="store_true",
+                   help="only enqueue and wait, leave the jobs to the workers")
+
+    # hot-path profiling
+    p.add_argument("--profile", nargs="?", const="profile", default=None, metavar="PREFIX",
+                   help="time the simulation phases; writes PREFIX.json and PREFIX.trace.json")
+    p.add_argument("--profile_sync", action="store_true",
+                   help="synchronize the device after every phase (accurate GPU times)")
+    p.add_argument("--profile_torch", action="store_true",
+                   help="also run under torch.profiler (per-phase memory, PREFIX.torch_trace.json)")
 
     # overrides cfg
     p.add_argument("--N", type=int, default=None)
@@ -41,6 +92,34 @@ def build_parser():
     p.add_argument("--t_total", type=int, default=None)
     p.add_argument("--sample_every", type=int, default=None)
     p.add_argument("--dx_threshold", type=float, default=None)
+    p.add_argument("--integrator", choices=["rk4", "dopri5"], default=None)
+    p.add_argument("--rtol", type=float, default=None)
+    p.add_argument("--atol", type=float, default=None)
+    p.add_argument("--dt_max", type=float, default=None)
+    p.add_argument("--conv_check_every", type=int, default=None)
+    p.add_argument("--conv_rtol", type=float, default=None)
+    p.add_argument("--conv_tol", type=float, default=None)
+    p.add_argument("--conv_min_batches", type=int, default=None)
+    p.add_argument("--converge", action="store_true",
+                   help="end warmup/sampling per run once statistics are stationary")
+    p.add_argument("--compile", action="store_true",
+                   help="fused torch.compile RK4 step (falls back to eager)")
+    p.add_argument("--backend", choices=["auto", "numpy", "torch"], default=None,
+                   help="simulation engine (auto: NumPy for small CPU runs)")
+    p.add_argument("--numpy_max_vehicles", type=int, default=None)
+    p.add_argument("--workspace", choices=["auto", "on", "off"], default=None,
+                   help="preallocated in-place RK4 step (auto: large runs)")
+    p.add_argument("--workspace_min_vehicles", type=int, default=None)
+    p.add_argument("--mem_limit_gb", type=float, default=None,
+                   help="refuse runs whose memory estimate exceeds this")
+    p.add_argument("--dtype", choices=["float32", "float64"], default=None,
+                   help="precision of the simulation state")
+    p.add_argument("--recenter_every", type=int, default=None,
+                   help="steps between position re-centering (0 = off)")
+    p.add_argument("--ov_table", choices=["off", "linear", "cubic"], default=None,
+                   help="interpolate V from a precomputed table")
+    p.add_argument("--ov_table_h", type=float, default=None)
+    p.add_argument("--ov_table_max", type=float, default=None)
 
     # common params
     p.add_argument("--rho", type=float, default=0.25)
@@ -53,11 +132,27 @@ def build_parser():
     p.add_argument("--rho_max", type=float, default=0.80)
     p.add_argument("--rho_steps", type=int, default=60)
     p.add_argument("--vmax_list", nargs="+", type=float, default=None)
+    p.add_argument("--continuation", choices=["up", "down", "both"], default=None,
+                   help="fig2: warm-start each density from the previous steady state")
+    p.add_argument("--cont_warmup", type=int, default=None)
+
+    # space-time trajectory (fig3)
+    p.add_argument("--record", type=str, default=None,
+                   help="fig3: directory for a memory-mapped space-time trajectory")
+    p.add_argument("--record_every", type=int, default=100, help="steps between frames")
+    p.add_argument("--record_stride", type=int, default=1, help="keep every k-th vehicle")
 
     # outputs
+    p.add_argument("--results_dir", type=str, default="results",
+                   help="numeric results of every figure (<name>.npz), read by the render stage")
+    p.add_argument("--render_mode", choices=["process", "thread", "inline"], default="process",
+                   help="draw figures in a background process, thread, or in line")
+    p.add_argument("--render_only", action="store_true",
+                   help="redraw the figures from their results files without simulating")
     p.add_argument("--out", type=str, default="out.png")
     p.add_argument("--out_headway", type=str, default="fig3_headway.png")
     p.add_argument("--out_velocity", type=str, default="fig3_velocity.png")
+    p.add_argument("--out_spacetime", type=str, default="fig3_spacetime.png")
     p.add_argument("--out_prefix", type=str, default="fig8")
     p.add_argument("--out_a", type=str, default="fig10a.png")
     p.add_argument("--out_b", type=str, default="fig10b.png")
@@ -68,60 +163,122 @@ def build_parser():
 
 def apply_overrides(cfg, args):
     for k in ["N","a_sens","vf_max","alpha_ov","x_f_c","x_s_c","dt",
-              "t_warmup","t_total","sample_every","dx_threshold"]:
+              "t_warmup","t_total","sample_every","dx_threshold",
+              "conv_check_every","conv_rtol","conv_tol","conv_min_batches",
+              "cont_warmup","integrator","rtol","atol","dt_max",
+              "backend","numpy_max_vehicles","ov_table","ov_table_h","ov_table_max",
+              "dtype","recenter_every","workspace","workspace_min_vehicles","mem_limit_gb"]:
         v = getattr(args, k, None)
         if v is not None:
             setattr(cfg, k, v)
+    if args.compile:
+        cfg.compile = True
+    if args.converge:
+        cfg.converge = True
+
+def fig_kwargs(f, args):
+    """Spec arguments of figure f from the command line."""
+    if f == "2":
+        return dict(vs=args.vs, rho_min=args.rho_min, rho_max=args.rho_max,
+                    rho_steps=args.rho_steps, continuation=args.continuation, out=args.out)
+    if f == "3":
+        return dict(rho=args.rho, vs=args.vs,
+                    out_headway=args.out_headway, out_velocity=args.out_velocity,
+                    record=args.record, record_every=args.record_every,
+                    record_stride=args.record_stride, out_spacetime=args.out_spacetime)
+    if f in ["4", "9"]:
+        return dict(rho_min=args.rho_min, rho_max=args.rho_max, rho_steps=args.rho_steps,
+                    vmax_list=args.vmax_list, out=args.out)
+    if f == "5":
+        return dict(vs=args.vs, out=args.out)
+    if f == "6":
+        return dict(vs=args.vs, rho=args.rho,
+                    rho_min=args.rho_min, rho_max=args.rho_max, rho_steps=args.rho_steps,
+                    out_profile=args.out_profile, out_ratio=args.out_ratio)
+    if f == "7":
+        return dict(vs=args.vs, rho_min=args.rho_min, rho_max=args.rho_max,
+                    rho_steps=args.rho_steps, out_a=args.out_a, out_b=args.out_b)
+    if f == "8":
+        return dict(vs1=args.vs1, vs2=args.vs2, out_prefix=args.out_prefix)
+    if f == "10":
+        return dict(vs=args.vs, out_a=args.out_a, out_b=args.out_b)
+
+def build_specs(cfg, args):
+    """Specs of the --fig figures followed by those of the --spec files."""
+    specs = []
+    for f in args.fig:
+        if f not in FIG_SPECS:
+            raise SystemExit(f"Unknown fig {f}. Available: {sorted(FIG_SPECS)}")
+        specs.append(FIG_SPECS[f](cfg, **fig_kwargs(f, args)))
+    for path in args.spec:
+        loaded = load_spec(path)
+        specs.extend(loaded if isinstance(loaded, list) else [loaded])
+    if not specs:
+        raise SystemExit("nothing to run: give --fig and/or --spec")
+    return specs
 
 def main():
     args = build_parser().parse_args()
     cfg = SimCfg()
     apply_overrides(cfg, args)
+    specs = build_specs(cfg, args)
+    if args.save_spec:
+        with open(args.save_spec, "w") as fh:
+            json.dump(specs, fh, indent=2)
+        print("[spec] Saved:", args.save_spec)
+    renderer = Renderer(args.render_mode)
+    if args.render_only:
+        # plots of the current specs (labels, outputs) on the stored numbers
+        for spec in specs:
+            renderer.submit(results_path(args.results_dir, spec["name"]), spec, cfg)
+        try:
+            renderer.close()
+        except (OSError, ValueError) as err:
+            raise SystemExit(f"[render] {err}")
+        return
+    result_cache = cache.configure(path=args.cache_dir,
+                                   max_bytes=int(args.cache_max_mb * 2**20),
+                                   enabled=not args.no_cache, refresh=args.refresh)
+    ckpt = None
+    if args.checkpoint_dir:
+        ckpt = checkpoint.configure(path=args.checkpoint_dir, every=args.checkpoint_every,
+                                    resume=args.resume)
+    elif args.resume:
+        raise SystemExit("--resume needs the --checkpoint_dir of the interrupted run")
+    stop_workers = None
+    if args.queue:
+        workqueue.configure(args.queue, lease=args.queue_lease,
+                            max_attempts=args.queue_attempts, batch=args.queue_batch,
+                            work=not args.queue_submit_only)
+        stop_workers = workqueue.start_workers(args.queue, args.queue_workers,
+                                               device=args.device, batch=args.queue_batch)
+    prof = None
+    if args.profile:
+        if args.workers > 1:
+            print("[profile] only this process is profiled; use --workers 1 for sweeps")
+        prof = profiling.Profiler(sync=args.profile_sync,
+                                  torch_profiler=args.profile_torch).start()
 
-    for f in args.fig:
-        if f not in FIG_RUNNERS:
-            raise SystemExit(f"Unknown fig {f}. Available: {sorted(FIG_RUNNERS)}")
-
-        print(f"=== RUN FIG {f} on {args.device} ===")
-
-        if f == "2":
-            FIG_RUNNERS[f](cfg, device=args.device, vs=args.vs,
-                           rho_min=args.rho_min, rho_max=args.rho_max, rho_steps=args.rho_steps,
-                           out=args.out)
-
-        elif f == "3":
-            FIG_RUNNERS[f](cfg, device=args.device, rho=args.rho, vs=args.vs,
-                           out_headway=args.out_headway, out_velocity=args.out_velocity)
-
-        elif f in ["4", "9"]:
-            FIG_RUNNERS[f](cfg,
-                           rho_min=args.rho_min, rho_max=args.rho_max, rho_steps=args.rho_steps,
-                           vmax_list=args.vmax_list,
-                           out=args.out)
-
-        elif f == "5":
-            FIG_RUNNERS[f](cfg, device=args.device, vs=args.vs,
-                           out=args.out)
-        
-        elif f == "6":
-            FIG_RUNNERS[f](cfg, device=args.device, vs=args.vs,
-                           rho=args.rho,
-                           rho_min=args.rho_min, rho_max=args.rho_max, rho_steps=args.rho_steps,
-                           out_profile=args.out_profile, out_ratio=args.out_ratio)
-
-        elif f == "7":
-            FIG_RUNNERS[f](cfg, device=args.device, vs=args.vs,
-                           rho_min=args.rho_min, rho_max=args.rho_max, rho_steps=args.rho_steps,
-                           out_a=args.out_a, out_b=args.out_b)
-
-
-        elif f == "8":
-            FIG_RUNNERS[f](cfg, device=args.device, vs1=args.vs1, vs2=args.vs2,
-                           out_prefix=args.out_prefix)
-
-        elif f == "10":
-            FIG_RUNNERS[f](cfg, device=args.device, vs=args.vs,
-                           out_a=args.out_a, out_b=args.out_b)
+    # all figures' jobs are merged; each figure is saved and drawn once its sweeps are done
+    print(f"=== RUN {', '.join(spec['name'] for spec in specs)} on {args.device} ===")
+    try:
+        execute(specs, cfg, device=args.device, workers=args.workers,
+                results_dir=args.results_dir, renderer=renderer)
+    finally:
+        if stop_workers is not None:
+            stop_workers()
+
+    # everything finished: nothing left to resume
+    if ckpt is not None:
+        ckpt.clear()
+
+    if prof is not None:
+        prof.stop()
+        print(prof.summary())
+        print("[profile] Saved:", ", ".join(prof.write(args.profile)))
+
+    if result_cache.enabled:
+        print(result_cache.summary())
 
 if __name__ == "__main__":
     main()
@@ -1,79 +1,1002 @@
+import warnings
+import dataclasses
+from typing import NamedTuple
 import torch
 import numpy as np
-from model_ovm import optimal_velocity_sections
+from tqdm import tqdm
+from model_ovm import segment_tables, ov_lookup, ov_table
+from steady import SteadyState
+from metrics import headway_rounding_error
+from sim_numpy import integrate_numpy
+from observers import ObserverSet
+from profiling import phase, count
 
-def run_simulation(road, rho, cfg, device="cpu", return_profiles=False):
+# SimCfg fields that may differ between the rows of one batch (see run_batch)
+ROW_FIELDS = ("N", "a_sens", "alpha_ov", "x_f_c", "x_s_c")
+
+def shared_fields(cfg):
+    """The SimCfg fields every row of a batch has in common, as a dict."""
+    return {k: v for k, v in dataclasses.asdict(cfg).items() if k not in ROW_FIELDS}
+
+def row_batch_cfg(cfg, row_cfgs):
     """
-    Ring road, vehicles indexed in order along ring (no overtaking).
-    Keep x unwrapped to avoid periodic cut artifacts.
-    Use x_mod = x % L for segment masking.
+    SimCfg of a batch whose rows carry their own row_cfgs: they may differ
+    from cfg in ROW_FIELDS only, and N becomes the largest row N, the
+    padded width of the state.
     """
-    torch.manual_seed(cfg.seed)
+    for c in row_cfgs:
+        if shared_fields(c) != shared_fields(cfg):
+            raise ValueError(f"row configs of one batch may differ in {ROW_FIELDS} only")
+    return dataclasses.replace(cfg, N=max(c.N for c in row_cfgs))
 
-    dev = torch.device(device)
-    dtype = torch.float32
+class Ragged(NamedTuple):
+    """
+    Rows of a batch with fewer vehicles than its width N. Their vehicles
+    fill the first n columns; the padding columns hold vehicles at rest at
+    x = 0 that the headway, the step and all statistics ignore.
+    """
+    ghost: torch.Tensor         # (B, N) bool, padding columns
+    last: torch.Tensor          # (B, 1) long, column of the last vehicle of each row
+    n: torch.Tensor             # (B, 1) vehicles per row, in the state dtype
 
-    N = cfg.N
-    L = road.length()
-    L_t = torch.tensor(L, device=dev, dtype=dtype)
-
-    # initial uniform spacing
-    dx0 = L / N
-    x = torch.linspace(0.0, L - dx0, N, device=dev, dtype=dtype)  # increasing
-    dx_init = torch.full((N,), dx0, device=dev, dtype=dtype)
-
-    # initial velocity = Vopt in each segment
-    x_mod = torch.remainder(x, L_t)
-    V0 = optimal_velocity_sections(dx_init, x_mod, road, cfg, dev)
-    v = V0.clone()
-
-    dt = cfg.dt
-    a_sens = torch.tensor(cfg.a_sens, device=dev, dtype=dtype)
-
-    def compute_dx(x_unwrapped):
-        dx = torch.empty((N,), device=dev, dtype=dtype)
-        dx[:-1] = x_unwrapped[1:] - x_unwrapped[:-1]
-        dx[-1]  = (x_unwrapped[0] + L_t) - x_unwrapped[-1]
-        return dx
+def _ragged(ns, N, device, dtype):
+    """Ragged of the per-row vehicle counts ns, or None if every row has N."""
+    if all(n == N for n in ns):
+        return None
+    n = torch.tensor(ns, device=device).unsqueeze(1)
+    return Ragged(ghost=torch.arange(N, device=device) >= n, last=n - 1, n=n.to(dtype))
 
-    def f(x_unwrapped, v_vec):
-        dx = compute_dx(x_unwrapped)
-        x_mod_loc = torch.remainder(x_unwrapped, L_t)
-        Vopt = optimal_velocity_sections(dx, x_mod_loc, road, cfg, dev)
+def _row_mean(a, ragged, keepdim=False):
+    """Mean over the vehicles of every row; padding entries of a must be 0."""
+    if ragged is None:
+        return a.mean(dim=1, keepdim=keepdim)
+    n = ragged.n if keepdim else ragged.n[:, 0]
+    return a.sum(dim=1, keepdim=keepdim) / n
+
+def _segment_tables(roads, cfg, device, dtype, row_cfgs=None):
+    """
+    Stack the per-road segment tables into padded (B, K) tensors
+    (starts, vmax, x_c, offset) for ov_lookup. Padding columns start at +inf
+    so searchsorted never selects them. row_cfgs: optional SimCfg per road
+    for its x_c and alpha_ov.
+    """
+    K = max(len(road.bounds) for road in roads)
+    tables = [segment_tables(road, c, device, dtype)
+              for road, c in zip(roads, row_cfgs or [cfg] * len(roads))]
+    pad_values = (float("inf"), 0.0, 0.0, 0.0)
+    stacked = []
+    for i, pad_value in enumerate(pad_values):
+        cols = [torch.nn.functional.pad(t[i], (0, K - t[i].shape[0]), value=pad_value)
+                for t in tables]
+        stacked.append(torch.stack(cols))
+    return tuple(stacked)
+
+def _compute_dx(x_unwrapped, L_t, ragged=None):
+    """
+    Headway to the vehicle ahead along each ring; x: (B, N), L_t: (B, 1).
+    With a Ragged the last vehicle of every row wraps to its first (the
+    same arithmetic as a full row); headways of padding columns are junk.
+    """
+    dx = torch.cat([x_unwrapped[:, 1:] - x_unwrapped[:, :-1],
+                    (x_unwrapped[:, :1] + L_t) - x_unwrapped[:, -1:]], dim=1)
+    if ragged is not None:
+        dx.scatter_(1, ragged.last,
+                    (x_unwrapped[:, :1] + L_t) - x_unwrapped.gather(1, ragged.last))
+    return dx
+
+def _rhs(x_unwrapped, v_vec, L_t, starts, vmax, x_c, offset, alpha, a_sens, table=None,
+         ragged=None):
+    """OVM right-hand side (x_dot, v_dot) on a (B, N) state."""
+    with phase("rhs"):
+        with phase("headway"):
+            dx = _compute_dx(x_unwrapped, L_t, ragged)
+            x_mod_loc = torch.remainder(x_unwrapped, L_t)
+        Vopt = ov_lookup(dx, x_mod_loc, starts, vmax, x_c, offset, alpha, table)
         x_dot = v_vec
         v_dot = a_sens * (Vopt - v_vec)
-        return x_dot, v_dot, dx, Vopt
+        if ragged is not None:
+            v_dot = v_dot.masked_fill(ragged.ghost, 0.0)    # padding vehicles stay at rest
+        return x_dot, v_dot
+
+def _rk4_step(x, v, L_t, starts, vmax, x_c, offset, alpha, a_sens, dt, table=None,
+              ragged=None):
+    """One classic RK4 step of the OVM on a (B, N) state."""
+    def f(x_unwrapped, v_vec):
+        return _rhs(x_unwrapped, v_vec, L_t, starts, vmax, x_c, offset, alpha, a_sens, table,
+                    ragged)
+
+    def stage(h, kx, kv):
+        with phase("rk4_combine"):
+            return x + h*kx, v + h*kv
 
-    # sampling for current
-    samples = []
-    for t in range(cfg.t_total):
-        # RK4
-        k1x, k1v, _, _ = f(x, v)
-        k2x, k2v, _, _ = f(x + 0.5*dt*k1x, v + 0.5*dt*k1v)
-        k3x, k3v, _, _ = f(x + 0.5*dt*k2x, v + 0.5*dt*k2v)
-        k4x, k4v, _, _ = f(x + dt*k3x, v + dt*k3v)
+    k1x, k1v = f(x, v)
+    k2x, k2v = f(*stage(0.5*dt, k1x, k1v))
+    k3x, k3v = f(*stage(0.5*dt, k2x, k2v))
+    k4x, k4v = f(*stage(dt, k3x, k3v))
 
+    with phase("rk4_combine"):
         x = x + (dt/6.0)*(k1x + 2*k2x + 2*k3x + k4x)
         v = v + (dt/6.0)*(k1v + 2*k2v + 2*k3v + k4v)
+    return x, v
+
+class RK4Workspace:
+    """
+    _rk4_step on a fixed workspace: every intermediate of a step lives in a
+    (B, N) buffer allocated once, and all arithmetic runs in place or with
+    out=, so the step loop allocates nothing. Built for a run's (x, params)
+    and called like _rk4_step (params are bound at construction); x and v
+    are updated in place and returned. Operations follow _rk4_step and
+    ov_lookup in the same order, as sim_numpy.RK4Stepper does. Buffers:
+    headway, x_mod, the gathered vmax/x_c/offset, the stage state (xs, vs),
+    the slope k and the RK4 sums (ax, av), plus the int64 segment index.
+    """
+
+    FLOAT_BUFFERS = 10
+
+    def __init__(self, x, params):
+        L_t, starts, vmax, x_c, offset, alpha, a_sens, dt, table, ragged = params
+        if table is not None:
+            raise ValueError("the RK4 workspace evaluates the tanh OV function only")
+        self.ragged = ragged
+        self.L_t = L_t
+        self.starts, self.vmax, self.x_c, self.offset = starts, vmax, x_c, offset
+        self.alpha, self.a_sens, self.dt = alpha, a_sens, dt
+        (self.dx, self.x_mod, self.vm, self.xc, self.off,
+         self.xs, self.vs, self.ax, self.av, self.k) = (
+            torch.empty_like(x) for _ in range(self.FLOAT_BUFFERS))
+        self.idx = torch.empty(x.shape, device=x.device, dtype=torch.long)
+
+    def headway(self, x):
+        """Headway to the vehicle ahead (into the dx buffer)."""
+        dx = self.dx
+        torch.sub(x[:, 1:], x[:, :-1], out=dx[:, :-1])
+        dx[:, -1:].copy_(x[:, :1]).add_(self.L_t).sub_(x[:, -1:])
+        if self.ragged is not None:
+            last = self.ragged.last
+            dx.scatter_(1, last, (x[:, :1] + self.L_t).sub_(x.gather(1, last)))
+        return dx
+
+    def ov(self, dx, x_mod, out):
+        """ov_lookup of every vehicle into out."""
+        with phase("segment_lookup"):
+            torch.searchsorted(self.starts, x_mod, right=True, out=self.idx)
+            self.idx.sub_(1).clamp_(0, self.starts.shape[-1] - 1)
+            torch.gather(self.vmax, -1, self.idx, out=self.vm)
+            torch.gather(self.x_c, -1, self.idx, out=self.xc)
+            torch.gather(self.offset, -1, self.idx, out=self.off)
+        with phase("ov_tanh"):
+            # 0.5 * vm * (...): scaling by 0.5 is exact, so the order is free
+            torch.sub(dx, self.xc, out=out)
+            out.mul_(self.alpha).tanh_().add_(self.off).mul_(self.vm).mul_(0.5)
+            return out.clamp_(min=0.0)
+
+    def rhs(self, x, v, out):
+        """v_dot = a (V(dx, x_mod) - v) into out; x_dot is v itself."""
+        with phase("rhs"):
+            with phase("headway"):
+                torch.remainder(x, self.L_t, out=self.x_mod)
+                dx = self.headway(x)
+            self.ov(dx, self.x_mod, out)
+            out.sub_(v).mul_(self.a_sens)
+            if self.ragged is not None:
+                out.masked_fill_(self.ragged.ghost, 0.0)
+            return out
+
+    def _stage(self, x, v, h):
+        # next stage state from the current stage slopes (vs = x_dot, k = v_dot)
+        with phase("rk4_combine"):
+            torch.mul(self.vs, h, out=self.xs).add_(x)
+            torch.mul(self.k, h, out=self.vs).add_(v)
+        self.rhs(self.xs, self.vs, self.k)
+
+    def _accumulate(self, weight):
+        # weight is 1 or 2, so weight * slope is exact and the sum rounds once
+        with phase("rk4_combine"):
+            self.ax.add_(self.vs, alpha=weight)
+            self.av.add_(self.k, alpha=weight)
+
+    def __call__(self, x, v, *params):
+        dt = self.dt
+        self.rhs(x, v, self.k)                  # k1
+        self.ax.copy_(v)
+        self.av.copy_(self.k)
+        self.vs.copy_(v)
+        self._stage(x, v, 0.5 * dt)             # k2
+        self._accumulate(2)
+        self._stage(x, v, 0.5 * dt)             # k3
+        self._accumulate(2)
+        self._stage(x, v, dt)                   # k4
+        self._accumulate(1)
 
-        # after warmup, sample mean(v)
+        with phase("rk4_combine"):
+            x.add_(self.ax.mul_(dt / 6.0))
+            v.add_(self.av.mul_(dt / 6.0))
+        return x, v
+
+def memory_estimate(cfg, n_rows, engine):
+    """
+    Estimated peak bytes of a fixed-step RK4 run of n_rows x cfg.N vehicles,
+    by part: state (x, v), step (workspace buffers, or the temporaries of
+    one eager step at their peak, about 20 per vehicle), samples and the
+    end-of-run diagnostics (profiles, headway error). engine is "torch",
+    "workspace" or "numpy". Segment tables and the interpreter are not
+    counted.
+    """
+    s = np.dtype(cfg.dtype).itemsize
+    vehicles = n_rows * cfg.N
+    if engine == "workspace":
+        step = (RK4Workspace.FLOAT_BUFFERS * s + 8) * vehicles
+    elif engine == "numpy":
+        step = (12 * s + np.dtype(np.intp).itemsize + 1) * vehicles
+    else:
+        step = (20 * s + 16) * vehicles
+    n_samples = len(range(cfg.t_warmup, cfg.t_total, cfg.sample_every))
+    parts = {"state": 2 * s * vehicles, "step": step,
+             "samples": n_samples * n_rows * s, "diagnostics": 2 * s * vehicles}
+    parts["total"] = sum(parts.values())
+    return parts
+
+def use_workspace(cfg, n_rows):
+    """
+    Whether a torch run uses RK4Workspace. cfg.workspace "on" forces it,
+    "off" disables it and "auto" takes it from cfg.workspace_min_vehicles
+    vehicles in total (B * N), where the allocations of the eager step
+    dominate, for the fixed-step tanh RK4 runs it implements (no converge,
+    dopri5, compile or OV table).
+    """
+    if cfg.workspace not in ("auto", "on", "off"):
+        raise ValueError(f"unknown workspace mode {cfg.workspace!r}")
+    supported = (cfg.integrator == "rk4" and not cfg.converge and not cfg.compile
+                 and cfg.ov_table == "off")
+    if cfg.workspace == "on":
+        if not supported:
+            raise ValueError("workspace='on' supports fixed-step tanh rk4 runs only "
+                             "(no converge, compile or ov_table)")
+        return True
+    return (cfg.workspace == "auto" and supported
+            and n_rows * cfg.N >= cfg.workspace_min_vehicles)
+
+def _check_memory(cfg, n_rows, engine, report=False):
+    """Print the memory estimate (report) and enforce cfg.mem_limit_gb."""
+    est = memory_estimate(cfg, n_rows, engine)
+    if report:
+        parts = ", ".join(f"{k} {v / 2**20:.1f}" for k, v in est.items() if k != "total")
+        print(f"[sim] {engine} memory estimate for {n_rows}x{cfg.N} {cfg.dtype}: "
+              f"{est['total'] / 2**20:.1f} MiB ({parts} MiB)")
+    if cfg.mem_limit_gb > 0 and est["total"] > cfg.mem_limit_gb * 2**30:
+        raise ValueError(f"estimated {est['total'] / 2**30:.2f} GiB exceeds "
+                         f"mem_limit_gb={cfg.mem_limit_gb}")
+    return est
+
+# compiled steps, keyed on (N, segment count, dtype, device)
+_COMPILED_STEPS = {}
+
+def _select_step(cfg, args, stats, rtol=1e-5, atol=1e-6):
+    """
+    Step function for a run. With cfg.compile the fused torch.compile graph
+    of _rk4_step is used; it is checked once against the eager step on the
+    initial state, and the run falls back to eager if compilation is not
+    available or the two disagree beyond (rtol, atol).
+    """
+    if not cfg.compile:
+        return _rk4_step
+    x, v, L_t, starts = args[:4]
+    key = (x.shape[1], starts.shape[1], x.dtype, str(x.device))
+    try:
+        if key not in _COMPILED_STEPS:
+            _COMPILED_STEPS[key] = torch.compile(_rk4_step)
+        step = _COMPILED_STEPS[key]
+        with phase("compile"):
+            got = step(*args)
+    except Exception as e:  # no compiler backend, unsupported op, ...
+        warnings.warn(f"torch.compile unavailable, using eager RK4 step: {e}")
+        _COMPILED_STEPS.pop(key, None)
+        return _rk4_step
+    ref = _rk4_step(*args)
+    stats["host_syncs"] += 1
+    count("host_syncs")
+    if not all(torch.allclose(g, r, rtol=rtol, atol=atol) for g, r in zip(got, ref)):
+        warnings.warn("compiled RK4 step disagrees with eager step, using eager")
+        return _rk4_step
+    return step
+
+def _to_host(t, stats):
+    """Copy a tensor to a host numpy array, counted as one host sync."""
+    stats["host_syncs"] += 1
+    count("host_syncs")
+    with phase("host_sync"):
+        return t.detach().cpu().numpy()
+
+def _sample_stats(x, v, L_t, dx_threshold, ragged=None):
+    """
+    Per-row statistics watched by SteadyState: mean v, headway variance
+    relative to the mean headway squared, jammed fraction of the ring and
+    number of jam fronts. Returns a (B, 4) tensor.
+    """
+    dx = _compute_dx(x, L_t, ragged)
+    jam = dx < dx_threshold
+    if ragged is None:
+        fronts = (jam != torch.roll(jam, 1, dims=1)).sum(dim=1)
+        dx_mean = L_t[:, 0] / x.shape[1]
+        dx_var = dx.var(dim=1)
+    else:
+        real = ~ragged.ghost
+        jam &= real
+        prev = torch.roll(jam, 1, dims=1)
+        prev[:, :1] = jam.gather(1, ragged.last)
+        fronts = ((jam != prev) & real).sum(dim=1)
+        n = ragged.n[:, 0]
+        dx_mean = L_t[:, 0] / n
+        dx_var = ((dx - dx_mean[:, None])**2 * real).sum(dim=1) / (n - 1)
+    return torch.stack([_row_mean(v, ragged),
+                        dx_var / dx_mean**2,
+                        (dx * jam).sum(dim=1) / L_t[:, 0],
+                        fronts.to(x.dtype)], dim=1)
+
+def _keep_rows(params, keep):
+    """Step parameters of the batch rows keep (per-row tables sliced)."""
+    table, ragged = params[8:]
+    if table is not None:
+        table = table._replace(base=table.base[keep])
+    if ragged is not None:
+        ragged = Ragged(*(t[keep] for t in ragged))
+    return tuple(p[keep] for p in params[:7]) + params[7:8] + (table, ragged)
+
+def _recenter(x, L_t, ragged=None):
+    """
+    Shift the rows whose vehicles are centred more than 2 ring lengths from
+    0 back by k * L, k the nearest integer, so positions stay within about
+    one ring length of 0. In float32, k * L and x - k * L are formed
+    exactly in float64, and x - k * L is a multiple of ulp(L); the cast
+    back to float32 keeps it only while its magnitude stays below the
+    power of two above L, and rounds it by up to half an ulp beyond. Only
+    headways x[i+1] - x[i] between positions that come back unrounded are
+    invariant. (In float64, k * L itself rounds, by at most half an ulp of
+    x.) The rounding is monotone, so ring order is kept. Padding vehicles
+    of a Ragged stay at 0.
+    """
+    x = (x.double() - _recenter_shift(x, L_t, ragged)).to(x.dtype)
+    return x if ragged is None else x.masked_fill_(ragged.ghost, 0.0)
+
+def _recenter_shift(x, L_t, ragged=None):
+    """Per-row shift k * L of _recenter, in float64, (B, 1)."""
+    L64 = L_t.double()
+    x_last = x[:, -1:] if ragged is None else x.gather(1, ragged.last)
+    mid = 0.5 * (x[:, :1].double() + x_last.double())
+    k = torch.where(mid.abs() >= 2 * L64, torch.round(mid / L64), torch.zeros_like(mid))
+    return k * L64
+
+def _recenter_(x, L_t, ragged=None, chunk=1 << 20):
+    """_recenter in place, a chunk of columns at a time (small float64 copies)."""
+    shift = _recenter_shift(x, L_t, ragged)
+    for cols in x.split(chunk, dim=1):
+        cols.copy_(cols.double() - shift)
+    return x if ragged is None else x.masked_fill_(ragged.ghost, 0.0)
+
+def _track_extent(x_absmax, x):
+    """Running per-row max |x| (positions are largest just before re-centering)."""
+    return torch.maximum(x_absmax, x.abs().amax(dim=1))
+
+def _headway_error(x, L_t, x_absmax, stats, ragged=None):
+    """Per-row worst-case headway rounding error of the run, on the host."""
+    x_absmax = _track_extent(x_absmax, x)
+    dx = _compute_dx(x, L_t, ragged)
+    if ragged is not None:
+        dx.masked_fill_(ragged.ghost, 0.0)
+    dx_max = dx.amax(dim=1)
+    host = _to_host(torch.stack([x_absmax, dx_max]), stats)
+    return headway_rounding_error(host[0], host[1], host.dtype)
+
+def _integrate_fixed(step, x, v, params, cfg, stats, steps, resume=None, save=None,
+                     record=None, observers=None):
+    """
+    Fixed t_total run: per-row means go into a preallocated on-device buffer
+    after t_warmup and are read back once after the loop.
+    resume/save: checkpoint state to continue from / callback(t_done, state).
+    record: optional trajectory.Recorder fed after every step.
+    observers: optional, opened observers.ObserverSet pushed after every step.
+    Positions are re-centred in place every cfg.recenter_every steps (see
+    _recenter), so with an RK4Workspace step the loop allocates nothing
+    beyond small float64 chunks.
+    """
+    ragged = params[9]
+    n_samples = len(range(cfg.t_warmup, cfg.t_total, cfg.sample_every))
+    samples = torch.empty((n_samples, x.shape[0]), device=x.device, dtype=x.dtype)
+    x_absmax = torch.zeros(x.shape[0], device=x.device, dtype=x.dtype)
+    i_sample = 0
+    if resume is not None:
+        samples.copy_(resume["samples"])
+        x_absmax.copy_(resume["x_absmax"])
+        i_sample = resume["i_sample"]
+        if observers is not None:
+            observers.load_state_dict(resume["observers"])
+    for t in steps:
+        with phase("step"):
+            x, v = step(x, v, *params)
+        if cfg.recenter_every and (t + 1) % cfg.recenter_every == 0:
+            with phase("recenter"):
+                x_absmax = _track_extent(x_absmax, x)
+                x = _recenter_(x, params[0], ragged)
+
+        # after warmup, sample mean(v) of every row
         if t >= cfg.t_warmup and (t - cfg.t_warmup) % cfg.sample_every == 0:
-            samples.append(v.mean().item())
+            with phase("sample"):
+                if ragged is None:
+                    torch.mean(v, dim=1, out=samples[i_sample])
+                else:
+                    torch.sum(v, dim=1, out=samples[i_sample]).div_(ragged.n[:, 0])
+            i_sample += 1
+
+        if observers is not None:
+            with phase("observe"):
+                observers.push(t + 1, x, v)
+        if record is not None:
+            with phase("record"):
+                record.push(t + 1, x, v, params[0])
+        if save is not None:
+            save(t + 1, lambda: {"x": x, "v": v, "samples": samples, "i_sample": i_sample,
+                                 "x_absmax": x_absmax,
+                                 "observers": observers.state_dict() if observers else None})
+
+    if n_samples:
+        v_means = np.mean(_to_host(samples, stats).astype(np.float64), axis=0)
+    else:
+        v_means = _to_host(_row_mean(v, ragged), stats).astype(np.float64)
+
+    B = x.shape[0]
+    info = {"warmup_steps": np.full(B, cfg.t_warmup), "steps": np.full(B, cfg.t_total),
+            "headway_error": _headway_error(x, params[0], x_absmax, stats, ragged)}
+    return x, v, v_means, info
+
+def _integrate_converging(step, x, v, params, cfg, stats, steps, rhos,
+                          resume=None, save=None):
+    """
+    SimCfg.converge run: statistics are buffered on device and handed to
+    SteadyState every conv_check_every steps (one host sync per check).
+    Rows that are finished are stored and dropped from the batch, so the
+    remaining rows integrate faster; t_total is only an upper bound. The
+    samples of a final partial window are handed over at t_total.
+    """
+    monitor = SteadyState(cfg, rhos)
+    rows = np.arange(x.shape[0])          # original index of every active row
+    L_all, ragged_all = params[0], params[9]
+    x_out, v_out = x.clone(), v.clone()
+    W = -(-cfg.conv_check_every // cfg.sample_every)
+    window = torch.empty((W, len(rows), 4), device=x.device, dtype=x.dtype)
+    x_absmax = torch.zeros(len(rows), device=x.device, dtype=x.dtype)
+    j = 0
+    t_done = 0
+    if resume is not None:
+        t_done = resume["t"]
+        monitor, rows, j = resume["monitor"], resume["rows"], resume["j"]
+        x_out = resume["x_out"].to(x.device)
+        v_out = resume["v_out"].to(x.device)
+        window = resume["window"].to(x.device)
+        x_absmax = resume["x_absmax"].to(x.device)
+        keep = torch.as_tensor(rows, device=x.device)
+        params = _keep_rows(params, keep)
+    for t in steps:
+        with phase("step"):
+            x, v = step(x, v, *params)
+        t_done = t + 1
+        if cfg.recenter_every and t_done % cfg.recenter_every == 0:
+            with phase("recenter"):
+                active = torch.as_tensor(rows, device=x.device)
+                x_absmax[active] = _track_extent(x_absmax[active], x)
+                x = _recenter(x, params[0], params[9])
 
-    v_mean = float(np.mean(samples)) if len(samples) else float(v.mean().item())
-    current = rho * v_mean
+        if t % cfg.sample_every == 0:
+            with phase("sample"):
+                window[j] = _sample_stats(x, v, params[0], cfg.dx_threshold, params[9])
+            j += 1
+        if t_done % cfg.conv_check_every:
+            continue
 
-    out = {"current": current, "v_mean": v_mean, "L": L}
+        finished = monitor.update(rows, _to_host(window[:j], stats).astype(np.float64), t_done)
+        j = 0
+        if finished.any():
+            done_idx = torch.as_tensor(np.flatnonzero(finished), device=x.device)
+            out_idx = torch.as_tensor(rows[finished], device=x.device)
+            x_out[out_idx] = x[done_idx]
+            v_out[out_idx] = v[done_idx]
 
+            keep = torch.as_tensor(np.flatnonzero(~finished), device=x.device)
+            rows = rows[~finished]
+            if not len(rows):
+                break
+            x, v = x[keep], v[keep]
+            params = _keep_rows(params, keep)
+            window = torch.empty((W, len(rows), 4), device=x.device, dtype=x.dtype)
+
+        if save is not None:
+            save(t_done, lambda: {"x": x, "v": v, "rows": rows, "j": j, "monitor": monitor,
+                                  "x_out": x_out, "v_out": v_out, "window": window,
+                                  "x_absmax": x_absmax})
+
+    if len(rows) and j:
+        # samples after the last check (t_total not a multiple of conv_check_every)
+        monitor.update(rows, _to_host(window[:j], stats).astype(np.float64), t_done)
+    if len(rows):
+        monitor.finish(rows, t_done)
+        out_idx = torch.as_tensor(rows, device=x.device)
+        x_out[out_idx] = x
+        v_out[out_idx] = v
+        fallback = _to_host(_row_mean(v, params[9]), stats).astype(np.float64)
+
+    v_means = np.empty(len(rhos))
+    for b in range(len(rhos)):
+        v_mean = monitor.v_mean(b)
+        v_means[b] = v_mean if v_mean is not None else fallback[np.flatnonzero(rows == b)[0]]
+    info = {"warmup_steps": monitor.warmup_steps, "steps": monitor.steps,
+            "current_ci": [monitor.halfwidth(b) for b in range(len(rhos))],
+            "headway_error": _headway_error(x_out, L_all, x_absmax, stats, ragged_all)}
+    return x_out, v_out, v_means, info
+
+# Dormand-Prince 5(4) tableau: stage coefficients, 5th-order weights and
+# the difference between the 5th- and 4th-order weights (error estimate)
+_DP_A = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+]
+_DP_B = [35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84]
+_DP_E = [71/57600, 0.0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40]
+
+def _integrate_adaptive(x, v, params, cfg, stats, resume=None, save=None, desc=None):
+    """
+    SimCfg.integrator == "dopri5": embedded Dormand-Prince 5(4) with a step
+    size per row, controlled by cfg.rtol/cfg.atol (positions are scaled by
+    the mean headway, velocities by their magnitude). Rows integrate to
+    T = t_total*dt; steps are clipped to land on T_w = t_warmup*dt, and
+    mean(v) is integrated with the trapezoidal rule over [T_w, T], i.e. the
+    current is time-weighted. Accepted and rejected steps are counted per
+    row. Rows that reached T idle with h = 0 until the whole batch is done.
+    Positions are re-centred every cfg.recenter_every iterations.
+    """
+    rhs_params = params[:7] + params[8:]
+    ragged = params[9]
+    B, N = x.shape
+    dev = x.device
+    T_w = cfg.t_warmup * cfg.dt
+    T = cfg.t_total * cfg.dt
+    x_scale = params[0] / (N if ragged is None else ragged.n)  # mean headway per row
+
+    def rhs(x_, v_):
+        return _rhs(x_, v_, *rhs_params)
+
+    t = torch.zeros((B, 1), device=dev, dtype=torch.float64)
+    h = torch.full((B, 1), cfg.dt, device=dev, dtype=torch.float64)
+    integral = torch.zeros((B, 1), device=dev, dtype=torch.float64)
+    n_acc = torch.zeros((B, 1), device=dev, dtype=torch.long)
+    n_rej = torch.zeros_like(n_acc)
+    n_warm = torch.zeros_like(n_acc)
+    rejected = torch.zeros((B, 1), device=dev, dtype=torch.bool)
+    x_absmax = torch.zeros(B, device=dev, dtype=x.dtype)
+    k1x, k1v = rhs(x, v)
+    it = 0
+    if resume is not None:
+        t, h, integral = resume["t_row"].to(dev), resume["h"].to(dev), resume["integral"].to(dev)
+        n_acc, n_rej, n_warm = (resume[k].to(dev) for k in ("n_acc", "n_rej", "n_warm"))
+        k1x, k1v = resume["k1x"].to(dev), resume["k1v"].to(dev)
+        rejected = resume["rejected"].to(dev)
+        x_absmax = resume["x_absmax"].to(dev)
+        it = resume["it"]
+
+    bar = tqdm(desc=desc, total=T, disable=desc is None)
+    while True:
+        # land exactly on T_w and T; finished rows get h = 0
+        t_end = torch.where(t < T_w, torch.full_like(t, T_w), torch.full_like(t, T))
+        active = t < T
+        h = torch.minimum(h, t_end - t).clamp_(min=0.0)
+        hs = h.to(x.dtype)
+
+        kx, kv = [k1x], [k1v]
+        for a_row in _DP_A[1:]:
+            xi = x + hs * sum(a * k for a, k in zip(a_row, kx) if a)
+            vi = v + hs * sum(a * k for a, k in zip(a_row, kv) if a)
+            kxi, kvi = rhs(xi, vi)
+            kx.append(kxi)
+            kv.append(kvi)
+        x5 = x + hs * sum(b * k for b, k in zip(_DP_B, kx) if b)
+        v5 = v + hs * sum(b * k for b, k in zip(_DP_B, kv) if b)
+        k7x, k7v = rhs(x5, v5)
+        kx.append(k7x)
+        kv.append(k7v)
+
+        err_x = hs * sum(e * k for e, k in zip(_DP_E, kx) if e) / (cfg.atol + cfg.rtol * x_scale)
+        err_v = hs * sum(e * k for e, k in zip(_DP_E, kv) if e) / (
+            cfg.atol + cfg.rtol * torch.maximum(v.abs(), v5.abs()))
+        err = torch.sqrt(0.5 * (_row_mean(err_x**2, ragged, keepdim=True)
+                                + _row_mean(err_v**2, ragged, keepdim=True))).to(torch.float64)
+        accept = (err <= 1.0) & active
+
+        sampling = accept & (t >= T_w * (1 - 1e-12))
+        vbar = 0.5 * (_row_mean(v, ragged, keepdim=True)
+                      + _row_mean(v5, ragged, keepdim=True)).to(torch.float64)
+        integral += torch.where(sampling, vbar * h, torch.zeros_like(h))
+        n_acc += accept
+        n_rej += active & ~accept
+        n_warm += accept & (t < T_w)
+
+        t = torch.where(accept, t + h, t)
+        x = torch.where(accept, x5, x)
+        v = torch.where(accept, v5, v)
+        k1x = torch.where(accept, k7x, k1x)
+        k1v = torch.where(accept, k7v, k1v)
+
+        # no growth right after a rejection (damps accept/reject cycling)
+        fac = torch.clamp(0.9 * err.clamp(min=1e-10) ** -0.2, 0.2, 5.0)
+        fac = torch.where(rejected, fac.clamp(max=1.0), fac)
+        rejected = active & ~accept
+        h = torch.where(active, torch.clamp(h * fac, max=cfg.dt_max), h)
+
+        it += 1
+        if cfg.recenter_every and it % cfg.recenter_every == 0:
+            with phase("recenter"):
+                x_absmax = _track_extent(x_absmax, x)
+                x = _recenter(x, params[0], ragged)
+        if it % 32 == 0:
+            stats["host_syncs"] += 1
+            count("host_syncs")
+            t_min = float(t.min())
+            bar.update(min(t_min, T) - bar.n)
+            if t_min >= T:
+                break
+            if save is not None:
+                save(it, lambda: {"x": x, "v": v, "t_row": t, "h": h, "integral": integral,
+                                  "n_acc": n_acc, "n_rej": n_rej, "n_warm": n_warm,
+                                  "k1x": k1x, "k1v": k1v, "rejected": rejected, "it": it,
+                                  "x_absmax": x_absmax})
+    bar.close()
+
+    if T > T_w:
+        v_means = _to_host(integral[:, 0], stats) / (T - T_w)
+    else:
+        v_means = _to_host(_row_mean(v, ragged), stats).astype(np.float64)
+    n_acc, n_rej, n_warm = (_to_host(c[:, 0], stats) for c in (n_acc, n_rej, n_warm))
+    info = {"warmup_steps": n_warm, "steps": n_acc,
+            "accepted_steps": n_acc, "rejected_steps": n_rej,
+            "headway_error": _headway_error(x, params[0], x_absmax, stats, ragged)}
+    return x, v, v_means, info
+
+def initial_state(roads, cfg, device, dtype, init=None, row_cfgs=None):
+    """
+    (x, v, params) of a batched torch run: the uniform start with every
+    vehicle at V of its segment (or init), and the step parameters
+    (L_t, starts, vmax, x_c, offset, alpha, a_sens, dt, table, ragged) for
+    _rk4_step: alpha and a_sens are (B, 1), table is the OVTable of
+    cfg.ov_table or None, ragged a Ragged when rows have fewer than cfg.N
+    vehicles, else None. row_cfgs: optional SimCfg per road (see run_batch).
+    """
+    dev = torch.device(device)
+    N = cfg.N
+    rows = row_cfgs or [cfg] * len(roads)
+    Ls = [road.length() for road in roads]
+    L_t = torch.tensor(Ls, device=dev, dtype=dtype).unsqueeze(1)   # (B, 1)
+
+    starts, vmax, x_c, offset = _segment_tables(roads, cfg, dev, dtype, row_cfgs)
+    alpha = torch.tensor([[c.alpha_ov] for c in rows], device=dev, dtype=dtype)
+    table = ov_table(roads, cfg, dev, dtype, row_cfgs) if cfg.ov_table != "off" else None
+    ragged = _ragged([c.N for c in rows], N, dev, dtype)
+
+    if init is not None:
+        x, v = (t.to(device=dev, dtype=dtype).clone() for t in init)
+    else:
+        # initial uniform spacing, padding vehicles at 0
+        pad = lambda t, n: torch.nn.functional.pad(t, (0, N - n))
+        x = torch.stack([pad(torch.linspace(0.0, L - L / c.N, c.N, device=dev, dtype=dtype), c.N)
+                         for L, c in zip(Ls, rows)])                    # increasing
+        dx_init = torch.stack([torch.full((N,), L / c.N, device=dev, dtype=dtype)
+                               for L, c in zip(Ls, rows)])
+
+        # initial velocity = Vopt in each segment
+        x_mod = torch.remainder(x, L_t)
+        V0 = ov_lookup(dx_init, x_mod, starts, vmax, x_c, offset, alpha, table)
+        v = V0.clone() if ragged is None else V0.masked_fill(ragged.ghost, 0.0)
+
+    a_sens = torch.tensor([[c.a_sens] for c in rows], device=dev, dtype=dtype)
+    params = (L_t, starts, vmax, x_c, offset, alpha, a_sens, cfg.dt, table, ragged)
+    return x, v, params
+
+def select_backend(cfg, device):
+    """
+    "numpy" or "torch" for the rows of cfg. cfg.backend forces one; "auto"
+    takes NumPy for CPU rows of at most cfg.numpy_max_vehicles vehicles,
+    where torch's per-op dispatch costs more than the arithmetic, as long as
+    the run is a fixed-step RK4 run that the NumPy engine implements (no
+    converge, dopri5, compile or OV table). The choice depends on the row
+    only, not on how many rows are batched with it, so a job runs on the
+    same engine serially, in worker chunks or in any scheduler group.
+    """
+    if cfg.backend not in ("auto", "numpy", "torch"):
+        raise ValueError(f"unknown backend {cfg.backend!r}")
+    if cfg.backend != "auto":
+        return cfg.backend
+    supported = (torch.device(device).type == "cpu" and cfg.integrator == "rk4"
+                 and not cfg.converge and not cfg.compile and cfg.ov_table == "off")
+    if supported and cfg.N <= cfg.numpy_max_vehicles:
+        return "numpy"
+    return "torch"
+
+def _run_split(jobs, cfg, row_cfgs, engines, device, return_profiles, desc, checkpoint):
+    """
+    run_batch of rows whose "auto" engines differ: the rows of every engine
+    run as a batch of their own, results come back in job order.
+    """
+    results = [None] * len(jobs)
+    for engine in ("numpy", "torch"):
+        idx = [i for i, e in enumerate(engines) if e == engine]
+        if not idx:
+            continue
+        sub = None
+        if checkpoint is not None:
+            sub = (checkpoint[0], f"{checkpoint[1]}-{engine}")
+        rows = [dataclasses.replace(row_cfgs[i], backend=engine) for i in idx]
+        out = run_batch([jobs[i] for i in idx], dataclasses.replace(cfg, backend=engine),
+                        device=device, return_profiles=return_profiles, desc=desc,
+                        checkpoint=sub, row_cfgs=rows)
+        for i, res in zip(idx, out):
+            results[i] = res
+    return results
+
+def _checkpoint_hooks(checkpoint, stats, before_save=None):
+    """
+    (resume, save) for a run_batch checkpoint (Checkpointer, key): the saved
+    state to continue from, or None, and the save(t_done, make_state)
+    callback of the integrators, which snapshots every ckpt.every steps
+    (calling before_save() first, if given).
+    """
+    ckpt, key = checkpoint
+    resume = ckpt.load_state(key)
+    if resume is not None:
+        torch.set_rng_state(resume["rng"])
+        stats.update(resume["stats"])
+    last_saved = [resume["t"] if resume is not None else 0]
+
+    def save(t_done, make_state):
+        if ckpt.every <= 0 or t_done - last_saved[0] < ckpt.every:
+            return
+        with phase("checkpoint"):
+            if before_save is not None:
+                before_save()
+            stats["host_syncs"] += 1
+            count("host_syncs")
+            state = {k: (val.cpu() if torch.is_tensor(val) else val)
+                     for k, val in make_state().items()}
+            state.update(t=t_done, rng=torch.get_rng_state(), stats=dict(stats))
+            ckpt.save_state(key, state)
+            last_saved[0] = t_done
+
+    return resume, save
+
+def _run_batch_numpy(jobs, cfg, return_profiles, desc, init, checkpoint, record, observers,
+                     row_cfgs):
+    """
+    run_batch on the NumPy engine of sim_numpy; same result dicts. The
+    uniform start is built by initial_state, the only builder of it, so
+    both engines start from the same positions.
+    """
+    roads = [road for road, _ in jobs]
+    rhos = [float(rho) for _, rho in jobs]
+    Ls = [road.length() for road in roads]
+    if init is None:
+        init = initial_state(roads, cfg, "cpu", getattr(torch, cfg.dtype), row_cfgs=row_cfgs)[:2]
+    init = tuple(t.detach().cpu().numpy() if torch.is_tensor(t) else t for t in init)
+
+    stats = {"host_syncs": 0}
+    resume, save = None, None
+    if checkpoint is not None:
+        resume, save = _checkpoint_hooks(checkpoint, stats,
+                                         record.flush if record is not None else None)
+    if record is not None:
+        like = np.empty((len(jobs), cfg.N), dtype=cfg.dtype)
+        record.open(jobs, cfg, like, t0=resume["t"] if resume is not None else 0, stats=stats)
+    x, v, v_means, info = integrate_numpy(roads, cfg, init=init, resume=resume,
+                                          save=save, desc=desc, record=record,
+                                          observers=observers, row_cfgs=row_cfgs)
+    if record is not None:
+        record.close()
+    dtype = getattr(torch, cfg.dtype)
+    L_t = torch.tensor(Ls, dtype=dtype).unsqueeze(1)
+    ragged = _ragged([c.N for c in row_cfgs or [cfg]], cfg.N, "cpu", dtype)
+    return _collect(jobs, rhos, Ls, torch.from_numpy(x), torch.from_numpy(v), L_t,
+                    v_means, info, stats, return_profiles,
+                    observers.results() if observers is not None else None, ragged)
+
+def run_batch(jobs, cfg, device="cpu", return_profiles=False, desc=None, init=None,
+              checkpoint=None, record=None, observers=None, row_cfgs=None):
+    """
+    Integrate several (road, rho) configurations together as one (B, N) state.
+    All rows share cfg (dt, steps, integrator, ...); ring length, segment
+    bounds and vmax are stored per row. Returns one dict per job, same keys
+    as run_simulation.
+
+    row_cfgs: optional SimCfg per job that may differ from cfg in
+    ROW_FIELDS (N, a_sens, alpha_ov, x_f_c, x_s_c), which then act per row:
+    a_sens and alpha_ov as (B, 1) columns, x_c in the segment tables, and N
+    by padding every row to the largest N with vehicles at rest that the
+    step and the statistics mask out (see Ragged). Vehicles of a padded
+    row move exactly as in a run of their own; row means may round
+    differently. Padded rows take no init, record or observers.
+
+    With cfg.converge each row ends warmup and sampling on its own once its
+    statistics are stationary (see steady.SteadyState); t_warmup and t_total
+    then act as upper bounds. The steps actually used are reported per run.
+    cfg.integrator = "dopri5" replaces fixed-step RK4 by the adaptive
+    integrator of _integrate_adaptive. cfg.ov_table interpolates V from a
+    table of cfg.ov_curve (see model_ovm.ov_table) instead of evaluating it.
+
+    init: optional (x, v) pair of (B, N) tensors replacing the uniform
+    start, e.g. a rescaled steady state of a neighbouring density.
+    checkpoint: optional (Checkpointer, key). The integrator state is saved
+    every checkpointer.every steps and, when resuming, the run continues
+    from the saved state with the same final numbers.
+    record: optional trajectory.Recorder writing decimated space-time
+    frames of a fixed-step RK4 run to disk while it runs.
+    observers: optional list of observers.Observer evaluated inside a
+    fixed-step RK4 run at their own cadence; result dicts then hold one
+    {key: value} dict per observer name with this job's row.
+
+    cfg.backend (see select_backend) may route the run to the NumPy engine,
+    which agrees with the torch one to rounding; with "auto" every row
+    takes the engine of its own N, and rows of both engines are run as one
+    batch per engine. cfg.dtype sets the
+    precision of the state; result dicts report "headway_error", the
+    worst-case rounding error of a headway over the run (see
+    metrics.headway_rounding_error).
+
+    Large runs (see use_workspace) step on a preallocated RK4Workspace and
+    print their memory_estimate first; any run estimated above
+    cfg.mem_limit_gb raises ValueError before allocating.
+    """
+    torch.manual_seed(cfg.seed)
+    if cfg.dtype not in ("float32", "float64"):
+        raise ValueError(f"unknown dtype {cfg.dtype!r}")
+    if row_cfgs is not None:
+        engines = [select_backend(c, device) for c in row_cfgs]
+        if len(set(engines)) > 1:
+            if init is not None or record is not None or observers is not None:
+                raise ValueError("rows with different N take no init, record or observers")
+            return _run_split(jobs, cfg, row_cfgs, engines, device, return_profiles, desc,
+                              checkpoint)
+        cfg = row_batch_cfg(cfg, row_cfgs)
+        if (any(c.N != cfg.N for c in row_cfgs)
+                and (init is not None or record is not None or observers is not None)):
+            raise ValueError("rows with different N take no init, record or observers")
+    if record is not None and (cfg.integrator != "rk4" or cfg.converge):
+        raise ValueError("trajectory recording needs a fixed-step rk4 run")
+    if observers is not None:
+        if cfg.integrator != "rk4" or cfg.converge:
+            raise ValueError("observers need a fixed-step rk4 run")
+        observers = ObserverSet(observers, cfg, [road for road, _ in jobs])
+    if cfg.ov_curve != "tanh" and cfg.ov_table == "off":
+        raise ValueError(f"ov_curve {cfg.ov_curve!r} is only available tabulated (ov_table)")
+    backend = select_backend(cfg, device)
+    if backend == "numpy":
+        if not (cfg.integrator == "rk4" and not cfg.converge):
+            raise ValueError("backend='numpy' supports fixed-step rk4 runs only")
+        if cfg.ov_table != "off":
+            raise ValueError("backend='numpy' evaluates the tanh OV function only")
+        if torch.device(device).type != "cpu":
+            raise ValueError("backend='numpy' runs on the CPU only")
+        _check_memory(cfg, len(jobs), "numpy")
+        return _run_batch_numpy(jobs, cfg, return_profiles, desc, init, checkpoint, record,
+                                observers, row_cfgs)
+
+    dev = torch.device(device)
+    roads = [road for road, _ in jobs]
+    rhos = [float(rho) for _, rho in jobs]
+    Ls = [road.length() for road in roads]
+    workspace = use_workspace(cfg, len(jobs))
+    _check_memory(cfg, len(jobs), "workspace" if workspace else "torch", report=workspace)
+    x, v, params = initial_state(roads, cfg, dev, getattr(torch, cfg.dtype), init, row_cfgs)
+    L_t, ragged = params[0], params[9]
+
+    stats = {"host_syncs": 0}
+    resume, save = None, None
+    if checkpoint is not None:
+        resume, save = _checkpoint_hooks(checkpoint, stats,
+                                         record.flush if record is not None else None)
+        if resume is not None:
+            x, v = resume["x"].to(dev), resume["v"].to(dev)
+
+    if cfg.integrator == "dopri5":
+        if cfg.converge:
+            raise ValueError("integrator='dopri5' does not support converge")
+        x, v, v_means, info = _integrate_adaptive(x, v, params, cfg, stats,
+                                                  resume=resume, save=save, desc=desc)
+        return _collect(jobs, rhos, Ls, x, v, L_t, v_means, info, stats, return_profiles,
+                        ragged=ragged)
+    if cfg.integrator != "rk4":
+        raise ValueError(f"unknown integrator {cfg.integrator!r}")
+
+    t0 = resume["t"] if resume is not None else 0
+    observed = None
+    probe = (x, v)
+    if resume is not None and cfg.converge:
+        # x, v only hold the still active rows; probe the step on all rows
+        probe = (resume["x_out"].to(dev), resume["v_out"].to(dev))
+    step = RK4Workspace(x, params) if workspace else _select_step(cfg, probe + params, stats)
+    steps = range(t0, cfg.t_total)
+    if desc is not None:
+        steps = tqdm(steps, desc=desc, initial=t0, total=cfg.t_total)
+    if cfg.converge:
+        x, v, v_means, info = _integrate_converging(step, x, v, params, cfg, stats, steps, rhos,
+                                                    resume=resume, save=save)
+    else:
+        if record is not None:
+            record.open(jobs, cfg, x, t0=t0, stats=stats)
+        if observers is not None:
+            # observed steps share one headway / x_mod, in the workspace buffers if any
+            if workspace:
+                observers.open(x, L_t, params[1], step.headway,
+                               lambda x: torch.remainder(x, L_t, out=step.x_mod))
+            else:
+                observers.open(x, L_t, params[1], lambda x: _compute_dx(x, L_t),
+                               lambda x: torch.remainder(x, L_t))
+        x, v, v_means, info = _integrate_fixed(step, x, v, params, cfg, stats, steps,
+                                               resume=resume, save=save, record=record,
+                                               observers=observers)
+        if record is not None:
+            record.close()
+        if observers is not None:
+            observed = observers.results()
+    return _collect(jobs, rhos, Ls, x, v, L_t, v_means, info, stats, return_profiles,
+                    observed, ragged)
+
+def _collect(jobs, rhos, Ls, x, v, L_t, v_means, info, stats, return_profiles,
+             observed=None, ragged=None):
+    """
+    Per-job result dicts; info holds per-row step counts and diagnostics,
+    observed the per-row results of the run's observers by name. Profiles
+    of padded rows (ragged) hold their own vehicles only.
+    """
     if return_profiles:
         with torch.no_grad():
-            dx = compute_dx(x)
+            dx = _compute_dx(x, L_t, ragged)
             x_mod = torch.remainder(x, L_t)
-        out.update({
-            "x_mod": x_mod.detach(),
-            "x": x.detach(),
-            "v": v.detach(),
-            "dx": dx.detach(),
-        })
-
-    return out
+        ns = [x.shape[1]] * len(jobs)
+        if ragged is not None:
+            ns = _to_host(ragged.last[:, 0] + 1, stats).tolist()
+
+    results = []
+    for b in range(len(jobs)):
+        v_mean = float(v_means[b])
+        out = {"current": rhos[b] * v_mean, "v_mean": v_mean, "L": Ls[b],
+               "host_syncs": stats["host_syncs"]}
+        for k, vals in info.items():
+            out[k] = np.asarray(vals)[b].item()
+        for name, values in (observed or {}).items():
+            out[name] = {k: vals[b] for k, vals in values.items()}
+        if return_profiles:
+            n = ns[b]
+            out.update({
+                "x_mod": x_mod[b, :n].detach(),
+                "x": x[b, :n].detach(),
+                "v": v[b, :n].detach(),
+                "dx": dx[b, :n].detach(),
+            })
+        results.append(out)
+
+    return results
+
+def run_simulation(road, rho, cfg, device="cpu", return_profiles=False, record=None,
+                   profiler=None, observers=None):
+    """
+    Ring road, vehicles indexed in order along ring (no overtaking).
+    Keep x unwrapped to avoid periodic cut artifacts.
+    Use x_mod = x % L for segment masking.
+    Single-configuration wrapper around run_batch; record is an optional
+    trajectory.Recorder for a space-time diagram of the run, profiler an
+    optional profiling.Profiler timing the hot-path phases of this run,
+    observers optional observers.Observer instances (see run_batch).
+    """
+    if profiler is not None:
+        with profiler:
+            return run_simulation(road, rho, cfg, device, return_profiles, record,
+                                  observers=observers)
+    return run_batch([(road, rho)], cfg, device=device,
+                     return_profiles=return_profiles, record=record, observers=observers)[0]
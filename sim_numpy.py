@@ -0,0 +1,249 @@
+import numpy as np
+import torch
+from tqdm import tqdm
+from profiling import phase
+from metrics import headway_rounding_error
+
+def segment_arrays(roads, cfg, dtype=np.float32, row_cfgs=None):
+    """
+    NumPy counterpart of sim._segment_tables: padded (B, K) arrays
+    (starts, vmax, x_c, offset), padding columns starting at +inf.
+    row_cfgs: optional SimCfg per road for its x_c and alpha_ov.
+    """
+    K = max(len(road.bounds) for road in roads)
+    B = len(roads)
+    rows = row_cfgs or [cfg] * B
+    starts = np.full((B, K), np.inf, dtype=dtype)
+    vmax = np.zeros((B, K), dtype=dtype)
+    x_c = np.zeros((B, K), dtype=dtype)
+    for b, (road, c) in enumerate(zip(roads, rows)):
+        k = len(road.bounds)
+        starts[b, :k] = road.starts
+        vmax[b, :k] = road.vmax
+        x_c[b, :k] = road.x_c(c.x_f_c, c.x_s_c)
+    alpha = np.array([[c.alpha_ov] for c in rows], dtype=dtype)
+    offset = np.tanh(alpha * x_c)
+    return starts, vmax, x_c, offset
+
+class RK4Stepper:
+    """
+    Classic RK4 step of the OVM on (B, N) NumPy arrays, updating x and v in
+    place. Every intermediate lives in a buffer allocated once, and all
+    arithmetic goes through ufuncs with out=, so a step allocates nothing.
+    Operations follow sim._rk4_step / model_ovm.ov_lookup in the same order
+    and precision. The segment of each vehicle is the number of segment
+    starts after the first that x_mod has passed, counted with one compare
+    per segment; for the handful of segments a road has this beats a
+    per-row searchsorted. Only the headway, segment lookup and tanh phases
+    are profiled, to keep the disabled hooks cheap next to a ~100 us step;
+    the RK4 combine is the self time of the "step" phase. alpha_ov and
+    a_sens are numbers or per-row sequences; sizes optionally gives the
+    vehicles of every row, fewer than N padded as in sim.Ragged.
+    """
+
+    def __init__(self, L, starts, vmax, x_c, offset, alpha_ov, a_sens, dt, N, sizes=None):
+        B, K = starts.shape
+        dtype = starts.dtype
+        self.L = np.asarray(L, dtype=dtype).reshape(B, 1)
+        self.starts = [starts[:, k:k + 1] for k in range(1, K)]
+        self.half_vmax = (0.5 * vmax).ravel()      # exact, as in 0.5 * vm
+        self.x_c = x_c.ravel()
+        self.offset = offset.ravel()
+        self.row_base = (np.arange(B) * K)[:, None]
+        self.alpha = np.asarray(alpha_ov, dtype=dtype).reshape(-1, 1)
+        self.a_sens = np.asarray(a_sens, dtype=dtype).reshape(-1, 1)
+        self.dt = dt
+        self.sizes = np.full(B, N) if sizes is None else np.asarray(sizes)
+        self.ghost = None
+        if (self.sizes != N).any():
+            self.ghost = np.arange(N) >= self.sizes[:, None]
+            self.last = (self.sizes - 1)[:, None]
+
+        shape = (B, N)
+        self.dx, self.x_mod, self.vm, self.xc, self.off, self.V = (
+            np.empty(shape, dtype=dtype) for _ in range(6))
+        self.passed = np.empty(shape, dtype=bool)
+        self.idx = np.empty(shape, dtype=np.intp)
+        self.xs, self.vs, self.ax, self.av, self.k, self.tmp = (
+            np.empty(shape, dtype=dtype) for _ in range(6))
+
+    def ov(self, dx, x_mod, out):
+        """Optimal velocity of every vehicle into out."""
+        with phase("segment_lookup"):
+            np.copyto(self.idx, self.row_base)
+            for start in self.starts:
+                np.greater_equal(x_mod, start, out=self.passed)
+                np.add(self.idx, self.passed, out=self.idx)
+            np.take(self.half_vmax, self.idx, out=self.vm)
+            np.take(self.x_c, self.idx, out=self.xc)
+            np.take(self.offset, self.idx, out=self.off)
+
+        with phase("ov_tanh"):
+            np.subtract(dx, self.xc, out=out)
+            np.multiply(self.alpha, out, out=out)
+            np.tanh(out, out=out)
+            np.add(out, self.off, out=out)
+            np.multiply(self.vm, out, out=out)
+            np.maximum(out, 0.0, out=out)
+        return out
+
+    def headway(self, x):
+        """Headway to the vehicle ahead (into the dx buffer)."""
+        dx = self.dx
+        np.subtract(x[:, 1:], x[:, :-1], out=dx[:, :-1])
+        np.add(x[:, :1], self.L, out=dx[:, -1:])
+        np.subtract(dx[:, -1:], x[:, -1:], out=dx[:, -1:])
+        if self.ghost is not None:
+            wrap = np.add(x[:, :1], self.L)
+            np.put_along_axis(dx, self.last, wrap - np.take_along_axis(x, self.last, 1), 1)
+        return dx
+
+    def rhs(self, x, v, out):
+        """v_dot = a (V(dx, x_mod) - v) into out; x_dot is v itself."""
+        with phase("headway"):
+            np.remainder(x, self.L, out=self.x_mod)
+            dx = self.headway(x)
+        self.ov(dx, self.x_mod, self.V)
+        np.subtract(self.V, v, out=out)
+        np.multiply(self.a_sens, out, out=out)
+        if self.ghost is not None:
+            np.copyto(out, 0.0, where=self.ghost)
+        return out
+
+    def _stage(self, x, v, h):
+        # next stage state from the current stage slopes (xs = x_dot, k = v_dot)
+        np.multiply(self.vs, h, out=self.xs)
+        np.add(x, self.xs, out=self.xs)
+        np.multiply(self.k, h, out=self.vs)
+        np.add(v, self.vs, out=self.vs)
+        self.rhs(self.xs, self.vs, self.k)
+
+    def _accumulate(self, weight):
+        if weight == 1:
+            np.add(self.ax, self.vs, out=self.ax)
+            np.add(self.av, self.k, out=self.av)
+            return
+        np.multiply(weight, self.vs, out=self.tmp)
+        np.add(self.ax, self.tmp, out=self.ax)
+        np.multiply(weight, self.k, out=self.tmp)
+        np.add(self.av, self.tmp, out=self.av)
+
+    def step(self, x, v):
+        dt = self.dt
+        self.rhs(x, v, self.k)                  # k1
+        np.copyto(self.ax, v)
+        np.copyto(self.av, self.k)
+        np.copyto(self.vs, v)
+        self._stage(x, v, 0.5 * dt)             # k2
+        self._accumulate(2)
+        self._stage(x, v, 0.5 * dt)             # k3
+        self._accumulate(2)
+        self._stage(x, v, dt)                   # k4
+        self._accumulate(1)
+
+        np.multiply(dt / 6.0, self.ax, out=self.ax)
+        np.add(x, self.ax, out=x)
+        np.multiply(dt / 6.0, self.av, out=self.av)
+        np.add(v, self.av, out=v)
+        return x, v
+
+def recenter(x, L, stepper=None):
+    """In-place NumPy counterpart of sim._recenter (x: (B, N), L: (B, 1))."""
+    ghost = stepper.ghost if stepper is not None else None
+    L64 = L.astype(np.float64)
+    x_last = x[:, -1:] if ghost is None else np.take_along_axis(x, stepper.last, 1)
+    mid = 0.5 * (x[:, :1].astype(np.float64) + x_last)
+    k = np.where(np.abs(mid) >= 2 * L64, np.round(mid / L64), 0.0)
+    if k.any():
+        x[...] = x - k * L64
+        if ghost is not None:
+            x[ghost] = 0.0
+    return x
+
+def integrate_numpy(roads, cfg, init, resume=None, save=None, desc=None, record=None,
+                    observers=None, row_cfgs=None):
+    """
+    Fixed-step RK4 run of sim._integrate_fixed on the NumPy backend.
+    init: (x, v) start arrays, the uniform start of sim.initial_state in
+    run_batch, so both engines start from the same state.
+    record: optional trajectory.Recorder, already opened, fed every step.
+    observers: optional observers.ObserverSet, opened here on torch views of
+    the arrays (headway and x_mod in the stepper's buffers), pushed every step.
+    row_cfgs: optional SimCfg per road, see sim.run_batch.
+    Returns (x, v, v_means, info) with x, v as (B, N) arrays of cfg.dtype.
+    """
+    dtype = np.dtype(cfg.dtype).type
+    N = cfg.N
+    rows = row_cfgs or [cfg] * len(roads)
+    Ls = [road.length() for road in roads]
+    tables = segment_arrays(roads, cfg, dtype, row_cfgs)
+    stepper = RK4Stepper(Ls, *tables, [c.alpha_ov for c in rows], [c.a_sens for c in rows],
+                         cfg.dt, N, sizes=[c.N for c in rows])
+
+    x, v = (np.array(a, dtype=dtype) for a in init)
+
+    n_samples = len(range(cfg.t_warmup, cfg.t_total, cfg.sample_every))
+    samples = np.empty((n_samples, len(roads)), dtype=dtype)
+    x_absmax = np.zeros(len(roads), dtype=dtype)
+    i_sample = 0
+    t0 = 0
+    if resume is not None:
+        x, v = np.array(resume["x"], dtype=dtype), np.array(resume["v"], dtype=dtype)
+        samples[...] = resume["samples"]
+        x_absmax[...] = resume["x_absmax"]
+        i_sample, t0 = resume["i_sample"], resume["t"]
+    if observers is not None:
+        observers.open(torch.from_numpy(x), torch.from_numpy(stepper.L),
+                       torch.from_numpy(tables[0]),
+                       lambda x: torch.from_numpy(stepper.headway(x.numpy())),
+                       lambda x: torch.from_numpy(np.remainder(x.numpy(), stepper.L,
+                                                               out=stepper.x_mod)))
+        if resume is not None:
+            observers.load_state_dict(resume["observers"])
+
+    steps = range(t0, cfg.t_total)
+    if desc is not None:
+        steps = tqdm(steps, desc=desc, initial=t0, total=cfg.t_total)
+    for t in steps:
+        with phase("step"):
+            stepper.step(x, v)
+        if cfg.recenter_every and (t + 1) % cfg.recenter_every == 0:
+            with phase("recenter"):
+                np.maximum(x_absmax, np.abs(x).max(axis=1), out=x_absmax)
+                recenter(x, stepper.L, stepper)
+
+        # after warmup, sample mean(v) of every row (padding velocities are 0)
+        if t >= cfg.t_warmup and (t - cfg.t_warmup) % cfg.sample_every == 0:
+            with phase("sample"):
+                if stepper.ghost is None:
+                    np.mean(v, axis=1, out=samples[i_sample])
+                else:
+                    np.sum(v, axis=1, out=samples[i_sample])
+                    samples[i_sample] /= stepper.sizes
+            i_sample += 1
+
+        if observers is not None:
+            with phase("observe"):
+                observers.push(t + 1, torch.from_numpy(x), torch.from_numpy(v))
+        if record is not None:
+            with phase("record"):
+                record.push(t + 1, x, v, stepper.L)
+        if save is not None:
+            save(t + 1, lambda: {"x": x, "v": v, "samples": samples, "i_sample": i_sample,
+                                 "x_absmax": x_absmax,
+                                 "observers": observers.state_dict() if observers else None})
+
+    if n_samples:
+        v_means = np.mean(samples.astype(np.float64), axis=0)
+    else:
+        v_means = v.sum(axis=1).astype(np.float64) / stepper.sizes
+
+    B = len(roads)
+    np.maximum(x_absmax, np.abs(x).max(axis=1), out=x_absmax)
+    dx = stepper.headway(x)
+    if stepper.ghost is not None:
+        dx[stepper.ghost] = 0.0
+    dx_max = dx.max(axis=1)
+    info = {"warmup_steps": np.full(B, cfg.t_warmup), "steps": np.full(B, cfg.t_total),
+            "headway_error": headway_rounding_error(x_absmax, dx_max, dtype)}
+    return x, v, v_means, info
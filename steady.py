@@ -0,0 +1,145 @@
+import numpy as np
+
+WARMUP, SAMPLING, DONE = 0, 1, 2
+
+class SteadyState:
+    """
+    Per-row warmup/sampling state machine for SimCfg.converge.
+
+    The integration loop feeds it one window of per-sample statistics every
+    cfg.conv_check_every steps; columns are
+      0: mean velocity
+      1: headway variance / mean headway^2
+      2: jammed fraction of the ring (dx < dx_threshold)
+      3: number of jam fronts
+    A row leaves warmup once the mean of its last SPAN windows differs from
+    the mean of the SPAN windows before by less than cfg.conv_rtol in
+    columns 0-2 (v normalised by vf_max) and half a front in column 3, or by
+    less than two standard errors of the window scatter (stationary noise),
+    or at the first check after cfg.t_warmup. Comparing spans rather than
+    neighbouring windows catches slow drifts such as platoon compression in
+    free flow, which a steady trend never passes as noise. Window means of v
+    are then the batch means. At low density platoons breathe with a period
+    of about half a lap, so neighbouring windows are correlated: adjacent
+    batches are merged in pairs until the lag-1 autocorrelation of the batch
+    means is at most R1_MAX (or merging would leave fewer than
+    cfg.conv_min_batches), and any correlation left widens the half-width
+    by sqrt((1 + r1) / (1 - r1)). A row is finished once, for CONSECUTIVE
+    checks in a row, its merged batch means number at least
+    cfg.conv_min_batches, are uncorrelated, give a 95% half-width on
+    J = rho * v_mean below cfg.conv_tol, and pass the drift test between
+    their first and second half (to conv_tol on J). A transient or an
+    oscillation still running at t_warmup therefore keeps the row sampling,
+    up to t_total.
+    """
+
+    SPAN = 3
+    R1_MAX = 0.1            # max lag-1 autocorrelation of merged batch means
+    CONSECUTIVE = 3         # passing checks in a row before a row stops
+
+    def __init__(self, cfg, rhos):
+        self.cfg = cfg
+        self.rhos = np.asarray(rhos, dtype=np.float64)
+        B = len(self.rhos)
+        self.phase = np.full(B, WARMUP)
+        self.history = [[] for _ in range(B)]
+        self.batch_means = [[] for _ in range(B)]
+        self.batch_sizes = [[] for _ in range(B)]
+        self.passes = np.zeros(B, dtype=int)
+        self.warmup_steps = np.zeros(B, dtype=int)
+        self.steps = np.zeros(B, dtype=int)
+
+    @staticmethod
+    def _settled(history, tol, span):
+        if span < 2 or len(history) < 2 * span:
+            return False
+        prev = np.asarray(history[-2 * span:-span])
+        cur = np.asarray(history[-span:])
+        d = np.abs(cur.mean(axis=0) - prev.mean(axis=0))
+        se = np.sqrt((prev.var(axis=0, ddof=1) + cur.var(axis=0, ddof=1)) / span)
+        return bool(np.all(d < np.maximum(tol, 2.0 * se)))
+
+    def update(self, rows, window, t_done):
+        """
+        rows: original batch index of every active row
+        window: (W, len(rows), 4) float64 statistics since the last check
+        t_done: steps integrated so far
+        Returns a boolean mask over rows marking the rows finished now.
+        """
+        rtol = self.cfg.conv_rtol
+        tol = np.array([rtol * self.cfg.vf_max, rtol, rtol, 0.5])
+        means = window.mean(axis=0)
+        finished = np.zeros(len(rows), dtype=bool)
+        for i, b in enumerate(rows):
+            if self.phase[b] == WARMUP:
+                history = self.history[b]
+                history.append(means[i])
+                del history[:-2 * self.SPAN]
+                if self._settled(history, tol, self.SPAN) or t_done >= self.cfg.t_warmup:
+                    self.phase[b] = SAMPLING
+                    self.warmup_steps[b] = t_done
+            elif self.phase[b] == SAMPLING:
+                self.batch_means[b].append(means[i, 0])
+                self.batch_sizes[b].append(window.shape[0])
+                bm, r1 = self.batches(b)
+                ok = (len(bm) >= self.cfg.conv_min_batches and r1 <= self.R1_MAX
+                      and self.halfwidth(b) < self.cfg.conv_tol
+                      and self._settled(bm, min(tol[0], self.cfg.conv_tol / self.rhos[b]),
+                                        len(bm) // 2))
+                self.passes[b] = self.passes[b] + 1 if ok else 0
+                if self.passes[b] >= self.CONSECUTIVE:
+                    self.phase[b] = DONE
+                    self.steps[b] = t_done
+                    finished[i] = True
+        return finished
+
+    def finish(self, rows, t_done):
+        """Close rows still running when the step budget is exhausted."""
+        for b in rows:
+            if self.phase[b] == WARMUP:
+                self.warmup_steps[b] = t_done
+            self.phase[b] = DONE
+            self.steps[b] = t_done
+
+    @staticmethod
+    def _lag1(bm):
+        d = bm - bm.mean()
+        den = float(d @ d)
+        return float(d[:-1] @ d[1:]) / den if len(bm) > 2 and den > 0 else 0.0
+
+    def batches(self, b):
+        """
+        Batch means of row b, merged pairwise (oldest batch dropped when
+        their number is odd) until their lag-1 autocorrelation is at most
+        R1_MAX or fewer than 2 * conv_min_batches are left; returns
+        (batch means, lag-1 autocorrelation).
+        """
+        bm = np.asarray(self.batch_means[b], dtype=np.float64)
+        w = np.asarray(self.batch_sizes[b], dtype=np.float64)
+        r1 = self._lag1(bm)
+        while r1 > self.R1_MAX and len(bm) >= 2 * self.cfg.conv_min_batches:
+            odd = len(bm) % 2
+            bm, w = bm[odd:], w[odd:]
+            size = w[0::2] + w[1::2]
+            bm = (bm[0::2] * w[0::2] + bm[1::2] * w[1::2]) / size
+            w = size
+            r1 = self._lag1(bm)
+        return bm, r1
+
+    def halfwidth(self, b):
+        """
+        95% confidence half-width on J from the merged batch means of row b,
+        widened by the lag-1 autocorrelation they keep.
+        """
+        bm, r1 = self.batches(b)
+        if len(bm) < 2:
+            return float("inf")
+        r = min(max(r1, 0.0), 0.99)
+        return float(1.96 * self.rhos[b] * bm.std(ddof=1) / np.sqrt(len(bm))
+                     * np.sqrt((1 + r) / (1 - r)))
+
+    def v_mean(self, b):
+        """Mean sampled velocity of row b, or None if it never sampled."""
+        if not self.batch_sizes[b]:
+            return None
+        return float(np.average(self.batch_means[b], weights=self.batch_sizes[b]))
@@ -0,0 +1,17 @@
+import os
+import sys
+import pytest
+
+# modules live at the repository root (run.py imports them the same way)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from road import Road, Segment
+
+def two_segment_road(N=40, rho=0.25, vs=1.0, vf_max=2.0):
+    """Road of one normal and one slowdown section holding N vehicles at rho."""
+    L = N / rho
+    return Road([Segment("N", L / 2, vf_max), Segment("S", L / 2, vs)])
+
+@pytest.fixture
+def road():
+    return two_segment_road()
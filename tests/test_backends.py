@@ -0,0 +1,37 @@
+import dataclasses
+import numpy as np
+import pytest
+from config import SimCfg
+from sim import run_batch, select_backend
+from conftest import two_segment_road
+
+# tanh and the RK4 sums round differently in NumPy and torch; over a few
+# hundred float32 steps the drift stays far below these bounds
+CURRENT_RTOL = 1e-5
+PROFILE_ATOL = 1e-3
+
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_numpy_engine_matches_torch(dtype):
+    cfg = SimCfg(N=40, t_warmup=200, t_total=600, dtype=dtype)
+    jobs = [(two_segment_road(rho=rho), rho) for rho in (0.15, 0.25, 0.35)]
+    ref = run_batch(jobs, dataclasses.replace(cfg, backend="torch"), return_profiles=True)
+    got = run_batch(jobs, dataclasses.replace(cfg, backend="numpy"), return_profiles=True)
+    for r, g in zip(ref, got):
+        assert g["current"] == pytest.approx(r["current"], rel=CURRENT_RTOL)
+        for k in ("x", "v", "dx"):
+            np.testing.assert_allclose(g[k].numpy(), r[k].numpy(), rtol=0, atol=PROFILE_ATOL)
+
+def test_auto_backend_depends_on_row_only():
+    cfg = SimCfg(numpy_max_vehicles=100)
+    assert select_backend(dataclasses.replace(cfg, N=100), "cpu") == "numpy"
+    assert select_backend(dataclasses.replace(cfg, N=101), "cpu") == "torch"
+    assert select_backend(dataclasses.replace(cfg, N=100, converge=True), "cpu") == "torch"
+
+def test_mixed_engine_rows_match_their_own_runs():
+    cfg = SimCfg(N=60, t_warmup=100, t_total=300, numpy_max_vehicles=50)
+    rows = [dataclasses.replace(cfg, N=40), cfg]
+    jobs = [(two_segment_road(N=c.N), 0.25) for c in rows]
+    got = run_batch(jobs, cfg, row_cfgs=rows)
+    for job, c, g in zip(jobs, rows, got):
+        alone = run_batch([job], c)[0]
+        assert g["current"] == alone["current"]
@@ -0,0 +1,47 @@
+import pytest
+import torch
+from config import SimCfg
+from sim import run_batch
+from checkpoint import Checkpointer, batch_key
+from conftest import two_segment_road
+
+class Interrupted(Exception):
+    pass
+
+class CrashAfterSnapshot(Checkpointer):
+    """Checkpointer that dies right after writing its first snapshot."""
+
+    def save_state(self, key, state):
+        super().save_state(key, state)
+        raise Interrupted
+
+@pytest.mark.parametrize("backend", ["torch", "numpy"])
+def test_resumed_run_matches_uninterrupted(tmp_path, backend):
+    cfg = SimCfg(N=40, t_warmup=200, t_total=600, backend=backend)
+    jobs = [(two_segment_road(rho=0.2), 0.2), (two_segment_road(rho=0.3), 0.3)]
+    ref = run_batch(jobs, cfg, return_profiles=True)
+
+    key = batch_key(jobs, cfg)
+    with pytest.raises(Interrupted):
+        run_batch(jobs, cfg, checkpoint=(CrashAfterSnapshot(str(tmp_path), every=300), key))
+    ckpt = Checkpointer(str(tmp_path), every=300, resume=True)
+    assert ckpt.load_state(key)["t"] == 300
+    got = run_batch(jobs, cfg, return_profiles=True, checkpoint=(ckpt, key))
+
+    for r, g in zip(ref, got):
+        assert g["current"] == r["current"]
+        assert torch.equal(g["x"], r["x"]) and torch.equal(g["v"], r["v"])
+
+def test_clear_keeps_other_files(tmp_path):
+    ckpt = Checkpointer(str(tmp_path))
+    key = batch_key([(two_segment_road(), 0.25)], SimCfg())
+    ckpt.save_state(key, {"t": 1})
+    ckpt.mark_done(key, [{"current": 0.1}])
+    (tmp_path / "figure.png").write_bytes(b"")
+    ckpt.clear()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["figure.png"]
+
+    ckpt.save_state(key, {"t": 1})
+    (tmp_path / "figure.png").unlink()
+    ckpt.clear()
+    assert not tmp_path.exists()
@@ -0,0 +1,23 @@
+import torch
+from config import SimCfg
+from sim import initial_state, _rk4_step, _select_step
+from conftest import two_segment_road
+
+def test_compiled_step_matches_eager():
+    cfg = SimCfg(N=40, compile=True)
+    roads = [two_segment_road(rho=0.2), two_segment_road(rho=0.3)]
+    x, v, params = initial_state(roads, cfg, "cpu", torch.float32)
+    v = v + 0.01 * torch.randn_like(v)          # off the uniform state
+    stats = {"host_syncs": 0}
+    step = _select_step(cfg, (x, v) + params, stats)
+
+    xe, ve = x, v
+    for _ in range(50):
+        x, v = step(x, v, *params)
+        xe, ve = _rk4_step(xe, ve, *params)
+    assert torch.allclose(x, xe, rtol=1e-5, atol=1e-4)
+    assert torch.allclose(v, ve, rtol=1e-5, atol=1e-5)
+
+def test_eager_step_without_compile():
+    cfg = SimCfg(N=40)
+    assert _select_step(cfg, (), {"host_syncs": 0}) is _rk4_step
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import torch
+from road import Road, Segment
+from metrics import jam_metrics, jam_ratios_in_normal_sections, road_starts
+
+def _jam_utils_ratios(x_mod, dx, road, dx_threshold):
+    """jam_ratios_in_normal_sections of the removed experiments/_jam_utils.py."""
+    order = np.argsort(x_mod)
+    xs, dxs = x_mod[order], dx[order]
+    ratios = []
+    for start, end, kind, _ in road.bounds:
+        if kind != "N":
+            continue
+        mask = (xs >= start) & (xs < end)
+        jam_x = xs[mask][dxs[mask] < dx_threshold]
+        ratios.append((jam_x.max() - jam_x.min()) / road.length() if len(jam_x) else 0.0)
+    return ratios
+
+def _ring(shift):
+    """
+    Ring of length 100 (N [0, 50), S [50, 100)) with a jam of 9 vehicles at
+    headway 1 (x = 38..46) ahead of free traffic, vehicle 0 at position
+    index `shift` of the sorted positions.
+    """
+    pos = np.array([5, 13, 21, 29] + list(range(38, 48)) + [52, 60, 68, 76, 84, 92],
+                   dtype=np.float64)
+    x = np.roll(pos, -shift)
+    dx = np.roll(np.diff(pos, append=pos[0] + 100.0), -shift)
+    return x, dx
+
+@pytest.mark.parametrize("shift", [0, 8])
+def test_wrapping_cluster_matches_jam_utils(shift):
+    road = Road([Segment("N", 50.0, 2.0), Segment("S", 50.0, 1.0)])
+    x_mod, dx = _ring(shift)
+    # shift 8 puts vehicle 0 at x = 42: the cluster runs from the last
+    # column to the first
+    assert (dx[0] < 3.0 and dx[-1] < 3.0) == (shift == 8)
+
+    m = jam_metrics(torch.from_numpy(x_mod)[None], torch.from_numpy(dx)[None],
+                    torch.tensor([100.0]), road_starts([road], dtype=torch.float64), 3.0)
+    assert m["n_clusters"].tolist() == [1]
+    assert m["cluster_length"][0, 0].item() == 9.0
+    assert m["section_clusters"][0].tolist() == [1, 0]
+
+    # the old ratio spans the jammed positions, the new one adds the head's headway
+    old = _jam_utils_ratios(x_mod, dx, road, 3.0)
+    new = jam_ratios_in_normal_sections(x_mod, dx, road, 3.0)
+    assert old == [0.08]
+    assert new == pytest.approx([old[0] + 1.0 / 100.0])
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from config import SimCfg
+from sim import run_simulation
+from observers import RunningMean, Reservoir, LoopDetectors
+from conftest import two_segment_road
+
+def _observers():
+    return [RunningMean(["v_mean", "jam_fraction"], every=10),
+            Reservoir(["jam_count"], size=8, seed=3, every=5),
+            LoopDetectors(every=1)]
+
+@pytest.mark.parametrize("backend", ["numpy", "torch"])
+def test_reused_observers_match_fresh_ones(backend):
+    cfg = SimCfg(N=40, t_warmup=100, t_total=400, backend=backend)
+    road = two_segment_road(rho=0.3)
+    reused = _observers()
+    run_simulation(two_segment_road(rho=0.2), 0.2, cfg, observers=reused)
+    got = run_simulation(road, 0.3, cfg, observers=reused)
+    ref = run_simulation(road, 0.3, cfg, observers=_observers())
+    for name in ("mean", "reservoir", "loops"):
+        for key, val in ref[name].items():
+            np.testing.assert_array_equal(got[name][key], val, err_msg=f"{name}.{key}")
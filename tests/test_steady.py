@@ -0,0 +1,39 @@
+import numpy as np
+from config import SimCfg
+from steady import SteadyState, DONE
+
+def _feed(series, rho, cfg):
+    """Window means of v fed to a one-row SteadyState until it stops."""
+    monitor = SteadyState(cfg, [rho])
+    rows = np.arange(1)
+    for k, v in enumerate(series):
+        window = np.zeros((1, 1, 4))
+        window[0, 0, 0] = v
+        if monitor.update(rows, window, (k + 1) * cfg.conv_check_every).any():
+            break
+    else:
+        monitor.finish(rows, len(series) * cfg.conv_check_every)
+    return monitor
+
+def test_slow_oscillation_keeps_sampling_and_widens_ci():
+    # platoon breathing at low density: a period of ~50 windows, sampling
+    # starting just before a trough where the batch means look flat
+    rng = np.random.default_rng(0)
+    k = np.arange(400)
+    series = (1.31 + 0.1 * np.cos(2 * np.pi * (k - 34) / 53)
+              + 0.002 * rng.standard_normal(len(k)))
+    cfg = SimCfg(converge=True, t_warmup=0, t_total=400 * 1000)
+    monitor = _feed(series, 0.1, cfg)
+    assert monitor.steps[0] > 100 * cfg.conv_check_every
+    J, hw = 0.1 * monitor.v_mean(0), monitor.halfwidth(0)
+    assert abs(J - 0.131) < hw
+
+def test_white_noise_stops_after_consecutive_checks():
+    rng = np.random.default_rng(1)
+    series = 1.2 + 0.005 * rng.standard_normal(200)
+    cfg = SimCfg(converge=True, t_warmup=0, t_total=200 * 1000)
+    monitor = _feed(series, 0.25, cfg)
+    assert monitor.phase[0] == DONE
+    n = monitor.steps[0] // cfg.conv_check_every
+    assert cfg.conv_min_batches + SteadyState.CONSECUTIVE - 1 <= n < 200
+    assert abs(0.25 * monitor.v_mean(0) - 0.3) < monitor.halfwidth(0) < cfg.conv_tol
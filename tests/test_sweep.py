@@ -0,0 +1,17 @@
+import pytest
+import torch
+import cache
+from config import SimCfg
+from experiments._sweep import run_sweep
+from conftest import two_segment_road
+
+@pytest.mark.parametrize("backend", ["auto", "torch"])
+def test_pooled_sweep_matches_serial(backend):
+    assert not cache.get_cache().enabled
+    cfg = SimCfg(N=40, t_warmup=200, t_total=500, backend=backend)
+    jobs = [(two_segment_road(rho=rho), rho) for rho in (0.1, 0.2, 0.25, 0.3, 0.4)]
+    serial = run_sweep(jobs, cfg, workers=1, return_profiles=True)
+    pooled = run_sweep(jobs, cfg, workers=2, return_profiles=True, chunk_size=2)
+    for s, p in zip(serial, pooled):
+        assert p["current"] == s["current"]
+        assert torch.equal(p["x"], s["x"]) and torch.equal(p["v"], s["v"])
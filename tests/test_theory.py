@@ -0,0 +1,25 @@
+import numpy as np
+from config import SimCfg
+from experiments.spec import build_layout
+from experiments.fig2_fundamental import TWO_SLOWDOWNS
+from experiments._sweep import run_sweep
+from metrics import normal_section_ratios
+from theory import road_theory
+
+def test_fig5_layout_matches_long_sweep():
+    # several laps of the ring: the queue of the uniform start has drained
+    N = 40
+    cfg = SimCfg(N=N, t_warmup=30000, t_total=40000, backend="numpy", dtype="float64")
+    rhos = [0.2, 0.3]
+    jobs = [(build_layout(TWO_SLOWDOWNS, N / rho, {"vf_max": 2.0, "vs": 1.0}), rho)
+            for rho in rhos]
+    res = run_sweep(jobs, cfg, return_profiles=True)
+    theory = road_theory(jobs[0][0], rhos, cfg)
+    assert theory["rho_lo"] > 0.2 and theory["rho_lo"] < 0.3
+
+    current = np.array([r["current"] for r in res])
+    np.testing.assert_allclose(current, theory["current"], rtol=0.01)
+    ratios = normal_section_ratios([r["x_mod"] for r in res], [r["dx"] for r in res],
+                                   [road for road, _ in jobs], cfg.dx_threshold)
+    assert np.all(np.asarray(ratios[0]) == 0)           # free: no jam below rho_lo
+    assert np.all(np.asarray(ratios[1]) > 0)            # saturated: both sections jam
@@ -0,0 +1,27 @@
+import dataclasses
+import pytest
+import torch
+from config import SimCfg
+from sim import initial_state, _rk4_step, RK4Workspace
+from conftest import two_segment_road
+
+@pytest.mark.parametrize("ragged", [False, True])
+def test_workspace_matches_eager_step(ragged):
+    cfg = SimCfg(N=40)
+    rows = [dataclasses.replace(cfg, N=30 if ragged else 40), cfg]
+    roads = [two_segment_road(N=c.N, rho=rho) for c, rho in zip(rows, (0.2, 0.3))]
+    x, v, params = initial_state(roads, cfg, "cpu", torch.float32, row_cfgs=rows)
+    assert (params[9] is not None) == ragged
+    torch.manual_seed(0)
+    v = v + 0.01 * torch.randn_like(v)          # off the uniform state
+    if ragged:
+        v = v.masked_fill(params[9].ghost, 0.0)
+
+    xw, vw = x.clone(), v.clone()
+    step = RK4Workspace(xw, params)
+    for _ in range(200):
+        x, v = _rk4_step(x, v, *params)
+        out = step(xw, vw, *params)
+    assert out[0] is xw and out[1] is vw        # updated in place
+    torch.testing.assert_close(xw, x, rtol=0, atol=1e-4)
+    torch.testing.assert_close(vw, v, rtol=0, atol=1e-5)
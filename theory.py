@@ -0,0 +1,187 @@
+"""
+Semi-analytic steady states of the OVM on a ring with slowdown sections.
+
+Every section k of a layout carries the same current J in the steady
+state. At headway h a section with maximal velocity vmax_k flows
+J = V_k(h) / h, which is largest, J_max,k, at h*_k; below J_max,k a
+section can carry J on its free branch (h > h*_k) or its jam branch
+(h < h*_k). The layout's current cannot exceed the bottleneck current
+J_b = min_k J_max,k of its slowest sections.
+
+Vehicle conservation, rho = sum_k (L_k / L) / h_k, then fixes the regime:
+  rho <= rho_lo   free flow, every section on its free branch, J < J_b
+  rho <= rho_hi   saturated, J = J_b: the bottlenecks run at h*, the normal
+                  section just before a bottleneck holds a jam at headway
+                  h_J (jam branch at J_b) followed by free flow at h_F, and
+                  every other section is free at J_b. The jam grows
+                  linearly with rho:  lJ / L = (rho - rho_lo) / (1/h_J - 1/h_F)
+  rho >  rho_hi   congested, every section on its jam branch, J < J_b
+The total jam length is shared equally by the normal sections before the
+bottlenecks (capped by their lengths); flux and conservation alone do not
+split it when there are several. The jam-length formula holds while the
+jams fit into those sections.
+
+These are stationary states, which a run reaches only after its vehicles
+have gone round the ring a few times (L / v, about 1900 time units at
+N=500, rho=0.2). The uniform start overfills the slowdowns, and until that
+queue drains the simulated current lies below J and the normal sections
+jam below rho_lo; a run of the default t_total on N=500 is still in this
+transient. For the Fig 5 layout, run_sweep with N=200 and t_total=400000
+is within 0.001 of the predicted current at every rho in 0.1..0.4.
+
+Layouts scale with the ring length L = N / rho (only segment fractions
+matter), as in the figure scripts. Everything is vectorized with NumPy
+over layouts and densities; one layout over a few hundred densities takes
+milliseconds.
+"""
+import numpy as np
+
+def ov_velocity(h, vmax, x_c, alpha):
+    """V(h) = 0.5*vmax*(tanh(alpha*(h-x_c)) + tanh(alpha*x_c)), broadcasting."""
+    return 0.5 * vmax * (np.tanh(alpha * (h - x_c)) + np.tanh(alpha * x_c))
+
+def _ov_slope(h, vmax, x_c, alpha):
+    return 0.5 * vmax * alpha / np.cosh(alpha * (h - x_c)) ** 2
+
+def homogeneous_current(rho, vmax, alpha, x_c):
+    """Current rho * V(1/rho) of a homogeneous road (paper Fig 2/4/9 theory)."""
+    rho = np.asarray(rho, dtype=float)
+    return rho * ov_velocity(1.0 / rho, vmax, x_c, alpha)
+
+def _bisect(f, lo, hi, iters=60):
+    """Root of f, increasing between lo (f < 0) and hi (f > 0), elementwise."""
+    lo, hi = np.broadcast_arrays(np.asarray(lo, dtype=float), np.asarray(hi, dtype=float))
+    lo, hi = lo.copy(), hi.copy()
+    for _ in range(iters):
+        mid = 0.5 * (lo + hi)
+        up = f(mid) > 0
+        hi = np.where(up, mid, hi)
+        lo = np.where(up, lo, mid)
+    return 0.5 * (lo + hi)
+
+def max_flux(vmax, x_c, alpha):
+    """
+    (J_max, h_star): the maximal current V(h)/h of a homogeneous section
+    and the headway where it is reached (h V'(h) = V(h), h > x_c).
+    """
+    vmax, x_c, alpha = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                             for a in (vmax, x_c, alpha)))
+    h_star = _bisect(lambda h: ov_velocity(h, vmax, x_c, alpha) - h * _ov_slope(h, vmax, x_c, alpha),
+                     x_c, x_c + 40.0 / alpha)
+    return ov_velocity(h_star, vmax, x_c, alpha) / h_star, h_star
+
+def branch_headways(J, vmax, x_c, alpha):
+    """
+    (h_jam, h_free): headways at which a section carries current J on its
+    jam and free branch, broadcasting over all arguments. Where J exceeds
+    the section's J_max both are h*; where J is below V'(0), the lowest
+    current of the jam branch, h_jam is 0.
+    """
+    J_max, h_star = max_flux(vmax, x_c, alpha)
+    J = np.minimum(J, J_max)
+    vmax, x_c, alpha = (np.broadcast_to(a, J.shape) for a in (vmax, x_c, alpha))
+    h_star = np.broadcast_to(h_star, J.shape)
+    gap = lambda h: J * h - ov_velocity(h, vmax, x_c, alpha)
+    h_free = _bisect(gap, h_star, h_star + vmax / np.maximum(J, 1e-300))
+    h_jam = _bisect(lambda h: -gap(h), np.zeros_like(J), h_star)
+    return h_jam, h_free
+
+def _layouts(roads, cfg):
+    """Padded (M, K) fractions, vmax, x_c, slow flags and next-segment index."""
+    K = max(len(road.segments) for road in roads)
+    frac = np.zeros((len(roads), K))
+    vmax = np.ones((len(roads), K))
+    x_c = np.full((len(roads), K), cfg.x_f_c)
+    slow = np.zeros((len(roads), K), dtype=bool)
+    nxt = np.zeros((len(roads), K), dtype=int)
+    for m, road in enumerate(roads):
+        k = len(road.segments)
+        frac[m, :k] = [s.length / road.L for s in road.segments]
+        vmax[m, :k] = road.vmax
+        x_c[m, :k] = road.x_c(cfg.x_f_c, cfg.x_s_c)
+        slow[m, :k] = road.is_slow
+        nxt[m, :k] = (np.arange(k) + 1) % k
+    return frac, vmax, x_c, slow, nxt
+
+def _current_branch(rhos, frac, vmax, x_c, alpha, J_lo, J_hi, branch, n_grid):
+    """J at densities rhos (M, R) on one branch, from rho(J) on a grid of J."""
+    # rho(J) has a square-root singularity at J_b: refine the grid there
+    t = 1.0 - np.linspace(1.0, 0.0, n_grid) ** 2
+    J = J_lo[:, None] + (J_hi - J_lo)[:, None] * t                    # (M, G)
+    h = branch_headways(J[:, :, None], vmax[:, None], x_c[:, None], alpha)[branch]
+    with np.errstate(divide="ignore"):
+        rho = np.where(frac[:, None] > 0, frac[:, None] / h, 0.0).sum(axis=2)   # (M, G)
+    out = np.empty(rhos.shape)
+    for m in range(len(rhos)):
+        order = np.argsort(rho[m])
+        out[m] = np.interp(rhos[m], rho[m][order], J[m][order])
+    return out
+
+def layout_theory(roads, rhos, cfg, n_grid=512):
+    """
+    Steady state of M road layouts (segment fractions taken from roads) at
+    R densities, for the OV parameters of cfg. Returns a dict of arrays:
+      current       (M, R) current J
+      J_b           (M,)   bottleneck current min_k J_max,k
+      bottleneck    (M, K) sections limiting the current
+      rho_lo        (M,)   onset of the saturated regime
+      rho_hi        (M,)   end of the saturated regime
+      jam_headway   (M, K) jam-branch headway h_J of every section at J_b
+      free_headway  (M, K) free-branch headway h_F of every section at J_b
+      jam_length    (M, R, K) jam length / L in every section (non-zero
+                    only in normal sections before a bottleneck)
+    Padding columns of layouts with fewer segments have zero length.
+    """
+    rhos = np.atleast_1d(np.asarray(rhos, dtype=float))
+    frac, vmax, x_c, slow, nxt = _layouts(roads, cfg)
+    alpha = float(cfg.alpha_ov)
+    present = frac > 0
+    M = len(roads)
+    rho_grid = np.broadcast_to(rhos, (M, len(rhos)))
+
+    J_max, h_star = max_flux(vmax, x_c, alpha)
+    J_b = np.where(present, J_max, np.inf).min(axis=1)
+    bottleneck = present & np.isclose(J_max, J_b[:, None], rtol=1e-9, atol=0.0)
+    h_jam, h_free = branch_headways(np.broadcast_to(J_b[:, None], vmax.shape), vmax, x_c, alpha)
+    h_jam = np.where(bottleneck, h_star, h_jam)
+    h_free = np.where(bottleneck, h_star, h_free)
+    with np.errstate(divide="ignore"):
+        rho_lo = np.where(present, frac / h_free, 0.0).sum(axis=1)
+        rho_hi = np.where(present, frac / h_jam, 0.0).sum(axis=1)
+
+    # current: free, saturated and congested branch
+    J_free = _current_branch(rho_grid, frac, vmax, x_c, alpha, np.zeros(M), J_b, 1, n_grid)
+    J_floor = np.where(present, _ov_slope(0.0, vmax, x_c, alpha), 0.0).max(axis=1)
+    J_cong = _current_branch(rho_grid, frac, vmax, x_c, alpha, np.minimum(J_floor, J_b), J_b,
+                             0, n_grid)
+    current = np.where(rho_grid <= rho_lo[:, None], J_free,
+                       np.where(rho_grid <= rho_hi[:, None], J_b[:, None], J_cong))
+
+    # jam lengths: excess vehicles over rho_lo shared by the jam hosts
+    host = present & ~slow & np.take_along_axis(bottleneck, nxt, axis=1)
+    with np.errstate(divide="ignore"):
+        absorb = np.where(host, 1.0 / np.maximum(h_jam, 1e-300) - 1.0 / h_free, 0.0)  # (M, K)
+    excess = np.clip(rho_grid - rho_lo[:, None], 0.0, None)                             # (M, R)
+    cap = np.where(host, frac, 0.0)
+
+    def held(l):                                    # vehicles / L held by equal jams l
+        return (np.minimum(l[..., None], cap[:, None]) * absorb[:, None]).sum(axis=2)
+    full = held(np.broadcast_to(cap.max(axis=1)[:, None], excess.shape))
+    l = _bisect(lambda l: held(l) - np.minimum(excess, full), np.zeros_like(excess),
+                np.broadcast_to(cap.max(axis=1)[:, None], excess.shape))
+    l = np.where(excess > 0, l, 0.0)
+    jam_length = np.where(host[:, None], np.minimum(l[..., None], cap[:, None]), 0.0)
+
+    return {"current": current, "J_b": J_b, "bottleneck": bottleneck,
+            "rho_lo": rho_lo, "rho_hi": rho_hi,
+            "jam_headway": np.where(present, h_jam, np.nan),
+            "free_headway": np.where(present, h_free, np.nan),
+            "jam_length": jam_length}
+
+def road_theory(road, rhos, cfg):
+    """layout_theory of a single road, without the layout axis."""
+    return {k: v[0] for k, v in layout_theory([road], rhos, cfg).items()}
+
+def normal_jam_ratios(road, rhos, cfg):
+    """Predicted jam length ratio lJk / L of every normal section, (R, #N)."""
+    return road_theory(road, rhos, cfg)["jam_length"][:, ~road.is_slow]
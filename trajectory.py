@@ -0,0 +1,166 @@
+import os
+import json
+import numpy as np
+import torch
+from profiling import count
+
+FIELDS = ("x_mod", "v", "dx")
+
+def _frame(x, v, L):
+    """(x_mod, v, dx) of a (B, N) state; torch tensors or NumPy arrays."""
+    if torch.is_tensor(x):
+        dx = torch.cat([x[:, 1:] - x[:, :-1], (x[:, :1] + L) - x[:, -1:]], dim=1)
+        return torch.remainder(x, L), v, dx
+    dx = np.concatenate([x[:, 1:] - x[:, :-1], (x[:, :1] + L) - x[:, -1:]], axis=1)
+    return np.remainder(x, L), v, dx
+
+class Recorder:
+    """
+    Space-time trajectory of a fixed-step run_batch call, written to a
+    directory of .npy files as the run proceeds:
+      step.npy                (F,) step index of every frame
+      x_mod.npy, v.npy, dx.npy  (F, B, n) float32, n = ceil(N / stride)
+      meta.json               shapes, decimation, L and rho of every row
+    Every `every` steps the state of every `stride`-th vehicle is taken as a
+    frame. Frames collect in a buffer of `chunk` frames on the run's device
+    (a torch tensor, or a NumPy array on the NumPy backend) and are copied
+    out in one transfer and written into the preallocated files through a
+    short-lived memmap, so memory use does not grow with the run length.
+    meta.json counts the frames written so far; read the files with
+    Trajectory.
+    """
+
+    def __init__(self, path, every=100, stride=1, chunk=64):
+        self.path = path
+        self.every = every
+        self.stride = stride
+        self.chunk = chunk
+        self.written = 0
+        self._buf = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".npy")
+
+    def open(self, jobs, cfg, x, t0=0, stats=None):
+        """
+        Prepare the files for the state x (B, N) of a run starting at step t0.
+        A resumed run (t0 > 0) keeps the frames already on disk up to t0.
+        """
+        B, N = x.shape
+        self.n_frames = cfg.t_total // self.every
+        self.stats = stats
+        cols = len(range(0, N, self.stride))
+        self.meta = {"B": B, "N": N, "every": self.every, "stride": self.stride,
+                     "n_frames": self.n_frames, "dt": cfg.dt,
+                     "L": [road.length() for road, _ in jobs],
+                     "rho": [float(rho) for _, rho in jobs]}
+        self.written = min(t0 // self.every, self.n_frames)
+        shape = (self.n_frames, B, cols)
+        if not (t0 and self._matches(shape)):
+            os.makedirs(self.path, exist_ok=True)
+            np.lib.format.open_memmap(self._file("step"), mode="w+", dtype=np.int64,
+                                      shape=(self.n_frames,))
+            for name in FIELDS:
+                np.lib.format.open_memmap(self._file(name), mode="w+", dtype=np.float32,
+                                          shape=shape)
+            self.written = 0
+        self._write_meta()
+
+        if torch.is_tensor(x):
+            self._buf = torch.empty((self.chunk, len(FIELDS), B, cols),
+                                    device=x.device, dtype=x.dtype)
+        else:
+            self._buf = np.empty((self.chunk, len(FIELDS), B, cols), dtype=x.dtype)
+        self._steps = np.empty(self.chunk, dtype=np.int64)
+        self._n = 0
+
+    def _matches(self, shape):
+        try:
+            return np.load(self._file("dx"), mmap_mode="r").shape == shape
+        except (OSError, ValueError):
+            return False
+
+    def _write_meta(self):
+        meta = dict(self.meta, frames=self.written)
+        tmp = os.path.join(self.path, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def push(self, t_done, x, v, L):
+        """Called after every step with the steps done so far."""
+        if t_done % self.every:
+            return
+        frame = _frame(x, v, L)
+        for i, a in enumerate(frame):
+            self._buf[self._n, i] = a[:, ::self.stride]
+        self._steps[self._n] = t_done
+        self._n += 1
+        if self._n == self.chunk:
+            self.flush()
+
+    def flush(self):
+        """Copy the buffered frames out and append them to the files."""
+        n = self._n
+        if not n:
+            return
+        buf = self._buf[:n]
+        if torch.is_tensor(buf):
+            if self.stats is not None:
+                self.stats["host_syncs"] += 1
+            count("host_syncs")
+            buf = buf.cpu().numpy()
+        # frames are numbered by step, so a resumed run overwrites in place
+        i0 = int(self._steps[0]) // self.every - 1
+        steps = np.load(self._file("step"), mmap_mode="r+")
+        steps[i0:i0 + n] = self._steps[:n]
+        steps.flush()
+        del steps
+        for i, name in enumerate(FIELDS):
+            mm = np.load(self._file(name), mmap_mode="r+")
+            mm[i0:i0 + n] = buf[:, i]
+            mm.flush()
+            del mm
+        self.written = i0 + n
+        self._n = 0
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+        self._buf = None
+
+class Trajectory:
+    """
+    Lazy reader of a Recorder directory. Only the small step index is read
+    up front; window() maps the field files and copies out just the frames
+    (and rows) asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as fh:
+            self.meta = json.load(fh)
+        self.steps = np.load(os.path.join(path, "step.npy"))[:self.meta["frames"]]
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def times(self):
+        return self.steps * self.meta["dt"]
+
+    def window(self, t_start=None, t_end=None, rows=None, fields=FIELDS):
+        """
+        Frames with t_start <= step < t_end (None = open end) as a dict of
+        arrays: "step" (F,) and every field (F, B, n), or (F, n) for an
+        integer rows.
+        """
+        lo = 0 if t_start is None else int(np.searchsorted(self.steps, t_start))
+        hi = len(self.steps) if t_end is None else int(np.searchsorted(self.steps, t_end))
+        out = {"step": self.steps[lo:hi]}
+        sel = slice(None) if rows is None else rows
+        for name in fields:
+            mm = np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+            out[name] = np.array(mm[lo:hi, sel])
+            del mm
+        return out
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+import traceback
+import dataclasses
+import multiprocessing as mp
+import torch
+from tqdm import tqdm
+from config import SimCfg
+from road import Road, Segment
+from sim import run_batch, shared_fields
+from cache import ResultCache, job_key
+
+FORMAT_VERSION = 1
+
+def _write(fname, text):
+    """Write text to fname atomically (write a temporary file, then rename)."""
+    tmp = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(text)
+    os.replace(tmp, fname)
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class WorkQueue:
+    """
+    Queue of (road, rho, SimCfg) jobs in a directory on a shared filesystem:
+      queue.json                  format version, lease seconds, max attempts
+      jobs/<seq>.<key>.json       one job (key: cache.job_key), seq = queue order
+      leases/<key>.<attempt>      claim of an attempt: worker and expiry time
+      errors/<key>.<attempt>.txt  traceback of a failed attempt
+      results/                    cache.ResultCache of finished jobs
+    Submitters enqueue jobs with submit() and collect them with wait();
+    workers on any node (work(), or python workqueue.py DIR) claim() jobs,
+    run them as one run_batch and store the results. Every file is created
+    atomically, leases with O_EXCL and the rest by write-and-rename, so no
+    locking is needed and NFS works (unlike SQLite). A running attempt
+    renews its lease every lease / 3 seconds; once a lease has expired
+    without a result (worker killed, node lost, exception) the next claim
+    starts attempt k + 1, and after max_attempts the job has failed. Should
+    a lease expire under a live worker both attempts run, which is harmless
+    as results are deterministic and replaced by rename. Expiry compares
+    wall clocks, so node clocks must agree to well within a lease. The
+    first process opening the directory sets lease and max_attempts; batch
+    (jobs per claim) and work (run jobs while waiting) are per process.
+    """
+
+    def __init__(self, path, lease=300.0, max_attempts=3, poll=1.0, batch=8, work=True):
+        self.path = path
+        self.poll = poll
+        self.batch = batch
+        self.work = work
+        for sub in ("jobs", "leases", "errors"):
+            os.makedirs(os.path.join(path, sub), exist_ok=True)
+        meta = os.path.join(path, "queue.json")
+        if not os.path.exists(meta):
+            _write(meta, json.dumps({"version": FORMAT_VERSION, "lease": lease,
+                                     "max_attempts": max_attempts}))
+        with open(meta) as fh:
+            meta = json.load(fh)
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: queue format {meta['version']}, expected {FORMAT_VERSION}")
+        self.lease = meta["lease"]
+        self.max_attempts = meta["max_attempts"]
+        self.results = ResultCache(os.path.join(path, "results"), max_bytes=float("inf"))
+
+    def _file(self, sub, name):
+        return os.path.join(self.path, sub, name)
+
+    def _jobs(self):
+        """(file name, key) of every queued job, in queue order."""
+        names = sorted(n for n in os.listdir(self._file("jobs", "")) if n.endswith(".json"))
+        return [(name, name.split(".")[1]) for name in names]
+
+    def _attempts(self):
+        """Latest attempt of every key that was ever claimed."""
+        latest = {}
+        for name in os.listdir(self._file("leases", "")):
+            key, _, attempt = name.partition(".")
+            if attempt.isdigit():
+                latest[key] = max(latest.get(key, -1), int(attempt))
+        return latest
+
+    def _expires(self, key, attempt):
+        fname = self._file("leases", f"{key}.{attempt}")
+        try:
+            with open(fname) as fh:
+                return json.load(fh)["expires"]
+        except (OSError, ValueError, KeyError):
+            # created but not written yet, or its writer died in between
+            return os.path.getmtime(fname) + self.lease
+
+    def _set_lease(self, key, attempt, expires):
+        _write(self._file("leases", f"{key}.{attempt}"),
+               json.dumps({"worker": worker_id(), "expires": expires}))
+
+    def _next_attempt(self, key, latest, now):
+        """Attempt a claim of key would start, or None while leased or out of attempts."""
+        if key not in latest:
+            return 0
+        attempt = latest[key] + 1
+        if self._expires(key, latest[key]) > now or attempt >= self.max_attempts:
+            return None
+        return attempt
+
+    def submit(self, jobs, cfg, row_cfgs=None):
+        """
+        Enqueue (road, rho) jobs, with optional per-row SimCfgs as in
+        sim.run_batch; jobs already queued or finished are not added again.
+        Returns the job keys in job order.
+        """
+        rows = row_cfgs or [cfg] * len(jobs)
+        queued = self._jobs()
+        seq = len(queued)
+        queued = {key for _, key in queued}
+        keys = []
+        for (road, rho), c in zip(jobs, rows):
+            key = job_key(road, rho, c)
+            keys.append(key)
+            if key in queued or key in self.results:
+                continue
+            job = {"key": key, "cfg": dataclasses.asdict(c), "rho": float(rho),
+                   "segments": [(s.kind, float(s.length), float(s.vmax)) for s in road.segments]}
+            _write(self._file("jobs", f"{seq:08d}.{key}.json"), json.dumps(job))
+            queued.add(key)
+            seq += 1
+        return keys
+
+    def claim(self, batch=1):
+        """
+        Claim up to batch jobs, the first claimable one in queue order and
+        the next ones whose SimCfg shares its sim.shared_fields. Jobs
+        enqueued by a different simulation source (other job_key) are left
+        to workers running that source. Returns (key, attempt, road, rho,
+        cfg) tuples.
+        """
+        latest = self._attempts()
+        now = time.time()
+        claimed, shared = [], None
+        for name, key in self._jobs():
+            attempt = self._next_attempt(key, latest, now)
+            if attempt is None or key in self.results:
+                continue
+            with open(self._file("jobs", name)) as fh:
+                job = json.load(fh)
+            cfg = SimCfg(**job["cfg"])
+            road = Road([Segment(*s) for s in job["segments"]])
+            if job_key(road, job["rho"], cfg) != key:
+                continue
+            group = json.dumps(shared_fields(cfg), sort_keys=True)
+            if shared is not None and group != shared:
+                continue
+            try:
+                fd = os.open(self._file("leases", f"{key}.{attempt}"),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue        # another worker was faster
+            with os.fdopen(fd, "w") as fh:
+                json.dump({"worker": worker_id(), "expires": time.time() + self.lease}, fh)
+            claimed.append((key, attempt, road, job["rho"], cfg))
+            shared = group
+            if len(claimed) == batch:
+                break
+        return claimed
+
+    def _renew(self, claimed, stop):
+        while not stop.wait(self.lease / 3):
+            for key, attempt, *_ in claimed:
+                self._set_lease(key, attempt, time.time() + self.lease)
+
+    def run(self, claimed, device="cpu"):
+        """
+        Run claimed jobs as one run_batch, renewing their leases meanwhile,
+        and store their results. On an exception the traceback is kept in
+        errors/ and the leases are released for the next attempt.
+        """
+        stop = threading.Event()
+        beat = threading.Thread(target=self._renew, args=(claimed, stop), daemon=True)
+        beat.start()
+        cfgs = [cfg for *_, cfg in claimed]
+        try:
+            results = run_batch([(road, rho) for _, _, road, rho, _ in claimed], cfgs[0],
+                                device=device, return_profiles=True,
+                                row_cfgs=None if all(c == cfgs[0] for c in cfgs) else cfgs)
+        except Exception:
+            err = traceback.format_exc()
+            stop.set()
+            beat.join()
+            for key, attempt, *_ in claimed:
+                _write(self._file("errors", f"{key}.{attempt}.txt"), err)
+                self._set_lease(key, attempt, 0.0)
+            print(f"[queue] {worker_id()}: batch of {len(claimed)} failed\n{err}")
+            return False
+        stop.set()
+        beat.join()
+        for (key, *_), res in zip(claimed, results):
+            self.results.put(key, res)
+        return True
+
+    def work_once(self, device="cpu", batch=None):
+        """Claim and run one batch; returns the number of jobs claimed."""
+        claimed = self.claim(batch or self.batch)
+        if claimed:
+            self.run(claimed, device)
+        return len(claimed)
+
+    def failed(self, keys):
+        """Keys without a result whose last allowed attempt has expired."""
+        latest = self._attempts()
+        now = time.time()
+        return [key for key in keys
+                if latest.get(key, -1) + 1 >= self.max_attempts
+                and self._expires(key, latest[key]) <= now and key not in self.results]
+
+    def error(self, key):
+        """Traceback of the latest failed attempt of key."""
+        for attempt in range(self.max_attempts - 1, -1, -1):
+            fname = self._file("errors", f"{key}.{attempt}.txt")
+            if os.path.exists(fname):
+                with open(fname) as fh:
+                    return fh.read()
+        return "lease expired without a result (worker lost)"
+
+    def wait(self, keys, device="cpu", desc=None):
+        """
+        Result dicts of keys, in order, once all are finished; with work set
+        this process runs queued jobs meanwhile. Raises RuntimeError when a
+        job has failed max_attempts times.
+        """
+        pending = set(keys)
+        with tqdm(total=len(pending), desc=desc, disable=desc is None) as bar:
+            while pending:
+                done = {key for key in pending if key in self.results}
+                bar.update(len(done))
+                pending -= done
+                failed = self.failed(pending)
+                if failed:
+                    raise RuntimeError(f"{len(failed)} queued jobs failed after "
+                                       f"{self.max_attempts} attempts, e.g. {failed[0]}:\n"
+                                       + self.error(failed[0]))
+                if pending and not (self.work and self.work_once(device)):
+                    time.sleep(self.poll)
+        return [self.results.get(key) for key in keys]
+
+    def map(self, jobs, cfg, row_cfgs=None, device="cpu", desc=None):
+        """submit() and wait(): result dicts of the jobs in job order, with profiles."""
+        return self.wait(self.submit(jobs, cfg, row_cfgs), device=device, desc=desc)
+
+    def status(self):
+        """Job counts: queued, done, running, failed and waiting to be (re)claimed."""
+        latest = self._attempts()
+        now = time.time()
+        counts = {"queued": 0, "done": 0, "running": 0, "failed": 0, "waiting": 0}
+        for _, key in self._jobs():
+            counts["queued"] += 1
+            if key in self.results:
+                counts["done"] += 1
+            elif key in latest and self._expires(key, latest[key]) > now:
+                counts["running"] += 1
+            elif latest.get(key, -1) + 1 >= self.max_attempts:
+                counts["failed"] += 1
+            else:
+                counts["waiting"] += 1
+        return counts
+
+def work(path, device="cpu", batch=8, stop=None, idle_exit=0.0, threads=None):
+    """
+    Worker loop on the queue at path: claim and run batches until stop (an
+    Event) is set or, with idle_exit > 0, nothing was claimable for that
+    many seconds.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    queue = WorkQueue(path, batch=batch)
+    idle_since = time.time()
+    while stop is None or not stop.is_set():
+        if queue.work_once(device):
+            idle_since = time.time()
+        elif idle_exit > 0 and time.time() - idle_since > idle_exit:
+            break
+        else:
+            time.sleep(queue.poll)
+
+def start_workers(path, n, device="cpu", batch=8):
+    """
+    n local worker processes on the queue at path, sharing the CPU threads;
+    returns a function that stops them (after their current batch) and
+    waits for them to exit.
+    """
+    ctx = mp.get_context("spawn")
+    stop = ctx.Event()
+    threads = max(1, (os.cpu_count() or 1) // max(n, 1))
+    procs = [ctx.Process(target=work, args=(path, device, batch, stop, 0.0, threads))
+             for _ in range(n)]
+    for proc in procs:
+        proc.start()
+
+    def shutdown():
+        stop.set()
+        for proc in procs:
+            proc.join()
+    return shutdown
+
+# process-wide queue used by the experiments; None runs sweeps locally
+_queue = None
+
+def configure(path, **kwargs):
+    global _queue
+    _queue = WorkQueue(path, **kwargs)
+    return _queue
+
+def get_queue():
+    return _queue
+
+def main():
+    p = argparse.ArgumentParser(description="Worker of a run.py --queue directory")
+    p.add_argument("path")
+    p.add_argument("--device", type=str, default="cpu")
+    p.add_argument("--batch", type=int, default=8, help="jobs per claim (one run_batch)")
+    p.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    p.add_argument("--idle_exit", type=float, default=0.0,
+                   help="exit after this many seconds without claimable jobs (0 = never)")
+    p.add_argument("--status", action="store_true", help="print job counts and exit")
+    args = p.parse_args()
+    if args.status:
+        print(json.dumps(WorkQueue(args.path).status()))
+        return
+    print(f"[queue] worker {worker_id()} on {args.path}")
+    work(args.path, device=args.device, batch=args.batch, idle_exit=args.idle_exit,
+         threads=args.threads)
+
+if __name__ == "__main__":
+    main()